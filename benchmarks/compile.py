@@ -0,0 +1,60 @@
+"""
+Compares throughput of plain and compiled (fused) pipelines built of
+mappers and predicates.
+
+Run it from the project root::
+
+    python benchmarks/compile.py [items]
+
+"""
+
+from os.path import dirname, realpath
+from sys import argv, path
+from time import time
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from copipes import mapper, predicate, pipeline
+
+
+@mapper
+def add(value, item):
+    return item + value
+
+
+@mapper
+def multiply(value, item):
+    return item * value
+
+
+@predicate
+def divisible(value, item):
+    return not item % value
+
+
+def build():
+    return pipeline(
+        add.params(1),
+        divisible.params(2),
+        multiply.params(3),
+        add.params(-1),
+        divisible.params(5),
+        multiply.params(7),
+    )
+
+
+def measure(p, count):
+    start = time()
+    p.feed(range(count))
+    return count / (time() - start)
+
+
+if __name__ == '__main__':
+    count = int(argv[1]) if len(argv) > 1 else 1000000
+
+    plain = measure(build(), count)
+    fused = measure(build().compile(), count)
+
+    print('Plain pipeline:    {0:12.0f} items/sec'.format(plain))
+    print('Compiled pipeline: {0:12.0f} items/sec'.format(fused))
+    print('Speedup:           {0:12.2f}x'.format(fused / plain))
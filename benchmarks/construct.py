@@ -0,0 +1,85 @@
+"""
+Compares cost of initialization of pipeline and of its frozen factory,
+see :meth:`copipes.pipeline.freeze`.  Then compares feeding of many small
+batches by :meth:`copipes.pipeline.feed`, which initializes pipeline for
+each batch, and by session, see :meth:`copipes.pipeline.session`.
+
+Run it from the project root::
+
+    python benchmarks/construct.py [pipelines]
+
+"""
+
+from os.path import dirname, realpath
+from sys import argv, path
+from time import time
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from copipes import coroutine, pipeline, null
+
+
+@coroutine
+def add(value, next=null):
+    while True:
+        item = yield
+        next.send(item + value)
+
+
+@coroutine
+def broadcast(*channels):
+    while True:
+        item = yield
+        for channel in channels:
+            channel.send(item)
+
+
+@coroutine
+def collect(target, next=null):
+    while True:
+        item = yield
+        target.append(item)
+        next.send(item)
+
+
+def build():
+    p = pipeline(*[add.params(1)] * 8)
+    with p.fork(broadcast, 2) as (first, second):
+        first.connect(add.params(2), collect.params([]))
+        second.connect(add.params(3), collect.params([]))
+    return p
+
+
+def measure(factory, count):
+    start = time()
+    for i in range(count):
+        factory()
+    return count / (time() - start)
+
+
+def measure_feed(feed, count, size=10):
+    batch = list(range(size))
+    start = time()
+    for i in range(count):
+        feed(batch)
+    return count / (time() - start)
+
+
+if __name__ == '__main__':
+    count = int(argv[1]) if len(argv) > 1 else 100000
+
+    p = build()
+    plain = measure(p, count)
+    frozen = measure(p.freeze(), count)
+
+    print('pipeline(): {0:12.0f} pipelines/sec'.format(plain))
+    print('factory():  {0:12.0f} pipelines/sec'.format(frozen))
+    print('Speedup:    {0:12.2f}x'.format(frozen / plain))
+
+    fed = measure_feed(p.feed, count)
+    with p.session() as session:
+        reused = measure_feed(session.feed, count)
+
+    print('feed():     {0:12.0f} batches/sec'.format(fed))
+    print('session:    {0:12.0f} batches/sec'.format(reused))
+    print('Speedup:    {0:12.2f}x'.format(reused / fed))
@@ -0,0 +1,129 @@
+"""
+Compares throughput of per-item and batched feeds on the log pipeline
+from ``copipes/example.py``.
+
+Run it from the project root::
+
+    python benchmarks/feed.py [lines] [batch_size]
+
+"""
+
+from collections import namedtuple
+from io import StringIO
+from os.path import dirname, realpath
+from sys import argv, modules, path
+from time import time
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from copipes import batched, pipeline, null, send_many
+from copipes import example
+
+
+LogRecord = namedtuple('LogRecord', ['level', 'module', 'message'])
+
+
+@batched
+def parse(next=null):
+    while True:
+        lines = yield
+        records = []
+        for line in lines:
+            line = line.strip()
+            if line:
+                records.append(LogRecord(*line.split(None, 2)))
+        send_many(next, records)
+
+
+@batched
+def broadcast(*channels):
+    while True:
+        records = yield
+        for channel in channels:
+            send_many(channel, records)
+
+
+@batched
+def split(selector, **channels):
+    while True:
+        records = yield
+        chunks = dict((name, []) for name in channels)
+        for record in records:
+            chunks[selector(record)].append(record)
+        for name, chunk in chunks.items():
+            if chunk:
+                send_many(channels[name], chunk)
+
+
+@batched
+def filter(condition, next=null):
+    while True:
+        records = yield
+        send_many(next, [r for r in records if condition(r)])
+
+
+@batched
+def unique(next=null):
+    passed = set()
+    while True:
+        records = yield
+        result = []
+        for record in records:
+            if record not in passed:
+                passed.add(record)
+                result.append(record)
+        send_many(next, result)
+
+
+@batched
+def save(file, next=null):
+    template = example.u('{0.level:7.7} {0.module:6.6} {0.message}\n')
+    while True:
+        records = yield
+        file.write(''.join(template.format(r) for r in records))
+        send_many(next, records)
+
+
+def build(stages):
+    p = pipeline(
+        stages.parse,
+        stages.filter.params(lambda r: r.level != 'DEBUG'),
+    )
+    with p.fork(stages.broadcast, 2) as (modules, errors):
+        with modules.fork(stages.split.params(lambda r: r.module),
+                          'first', 'second', 'third') as (first, second,
+                                                          third):
+            first.connect(stages.save.params(StringIO()))
+            second.connect(stages.save.params(StringIO()))
+            third.connect(stages.save.params(StringIO()))
+        errors.connect(
+            stages.filter.params(lambda r: r.level in ('ERROR', 'WARNING')),
+            stages.unique,
+            stages.save.params(StringIO()),
+        )
+    return p
+
+
+def source(count):
+    lines = [line for line in example.log.getvalue().splitlines() if line]
+    for i in range(count):
+        yield lines[i % len(lines)]
+
+
+def measure(p, count, batch_size=None):
+    start = time()
+    p.feed(source(count), batch_size=batch_size)
+    return count / (time() - start)
+
+
+if __name__ == '__main__':
+    count = int(argv[1]) if len(argv) > 1 else 500000
+    batch_size = int(argv[2]) if len(argv) > 2 else 1024
+
+    per_item = measure(build(example), count)
+    per_batch = measure(build(modules[__name__]), count, batch_size)
+
+    print('Per-item feed: {0:12.0f} items/sec'.format(per_item))
+    print('Batched feed:  {0:12.0f} items/sec (batch_size={1})'.format(
+        per_batch, batch_size))
+    print('Speedup:       {0:12.2f}x'.format(per_batch / per_item))
@@ -0,0 +1,76 @@
+"""
+Measures import time of a module with 100 stages defined by ``@pipe`` macro
+with cold and warm cache of rewritten code, see
+:func:`copipes.macros.pipe.pipe`.  Each import is run by a fresh
+interpreter.
+
+Run it from the project root::
+
+    python benchmarks/pipe_import.py [stages] [repeat]
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from os.path import dirname, join, realpath
+from time import time
+
+ROOT = dirname(dirname(realpath(__file__)))
+
+STAGE = '''
+@pipe
+def stage_{0}(value):
+    """Adds ``value`` to each item"""
+    [x]
+    send(x + value + {0})
+'''
+
+
+def generate(directory, stages):
+    with open(join(directory, 'stages.py'), 'w') as f:
+        f.write('from copipes.macros.pipe import pipe\n')
+        for i in range(stages):
+            f.write(STAGE.format(i))
+
+
+def measure(directory):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([directory, ROOT] + sys.path)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    start = time()
+    subprocess.check_call([sys.executable, '-c', 'import stages'], env=env)
+    return time() - start
+
+
+def clear(directory):
+    shutil.rmtree(join(directory, '__pycache__'), ignore_errors=True)
+    for name in os.listdir(directory):
+        if name.endswith('.pyc'):
+            os.remove(join(directory, name))
+
+
+if __name__ == '__main__':
+    stages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    directory = tempfile.mkdtemp()
+    try:
+        generate(directory, stages)
+        cold = []
+        warm = []
+        for i in range(repeat):
+            clear(directory)
+            cold.append(measure(directory))
+            warm.append(measure(directory))
+        cold = min(cold)
+        warm = min(warm)
+    finally:
+        shutil.rmtree(directory)
+
+    print('Stages:     {0:12d}'.format(stages))
+    print('Cold:       {0:12.3f} sec'.format(cold))
+    print('Warm:       {0:12.3f} sec'.format(warm))
+    print('Speedup:    {0:12.2f}x'.format(cold / warm))
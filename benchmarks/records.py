@@ -0,0 +1,100 @@
+"""
+Compares throughput of parse, filter and split stages of the log pipeline
+from ``copipes/example.py`` with ``namedtuple`` records, slotted records of
+``copipes.records``, and ``copipes.records.columns`` batches.
+
+Run it from the project root::
+
+    python benchmarks/records.py [lines] [batch_size]
+
+"""
+
+from collections import namedtuple
+from os.path import dirname, realpath
+from sys import argv, path
+from time import time
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from copipes import coroutine, pipeline, null
+from copipes import example
+from copipes.records import parse_columns
+
+
+LogRecord = namedtuple('LogRecord', ['level', 'module', 'message'])
+
+
+@coroutine
+def parse(next=null):
+    while True:
+        line = yield
+        line = line.strip()
+        if not line:
+            continue
+        level, module, message = line.split(None, 2)
+        next.send(LogRecord(level, module, message))
+
+
+@coroutine
+def count(target, next=null):
+    while True:
+        yield
+        target[0] += 1
+
+
+@coroutine
+def split_columns(**channels):
+    # Filters and splits batch by its columns, counting records per module
+    while True:
+        batch = yield
+        for level, module in zip(batch.column('level'),
+                                 batch.column('module')):
+            if level != 'DEBUG':
+                channels[module][0] += 1
+
+
+def build(parser):
+    counts = [0], [0], [0]
+    p = pipeline(parser, example.filter.params(lambda r: r.level != 'DEBUG'))
+    with p.fork(example.split.params(lambda r: r.module),
+                'first', 'second', 'third') as branches:
+        for branch, target in zip(branches, counts):
+            branch.connect(count.params(target))
+    return p, counts
+
+
+def source(count):
+    lines = [line for line in example.log.getvalue().splitlines() if line]
+    for i in range(count):
+        yield lines[i % len(lines)]
+
+
+def measure(p, count, batch_size=None):
+    start = time()
+    p.feed(source(count), batch_size=batch_size)
+    return count / (time() - start)
+
+
+if __name__ == '__main__':
+    lines = int(argv[1]) if len(argv) > 1 else 500000
+    batch_size = int(argv[2]) if len(argv) > 2 else 1024
+
+    p, expected = build(parse)
+    tuples = measure(p, lines)
+    p, counts = build(example.parse)
+    slotted = measure(p, lines)
+    assert counts == expected
+    counts = [0], [0], [0]
+    p = pipeline(
+        parse_columns.params(example.LogRecord, batch_size),
+        split_columns.params(first=counts[0], second=counts[1],
+                             third=counts[2]),
+    )
+    batched = measure(p, lines, batch_size)
+    assert counts == expected
+
+    print('namedtuple records: {0:12.0f} lines/sec'.format(tuples))
+    print('Slotted records:    {0:12.0f} lines/sec ({1:.2f}x)'.format(
+        slotted, slotted / tuples))
+    print('Columns:            {0:12.0f} lines/sec ({1:.2f}x)'.format(
+        batched, batched / tuples))
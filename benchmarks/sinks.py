@@ -0,0 +1,58 @@
+"""
+Compares per-record writes made by ``save`` worker from
+``copipes/example.py`` and buffered writes made by ``copipes.sinks.write``.
+
+Run it from the project root::
+
+    python benchmarks/sinks.py [records]
+
+"""
+
+from os import close, remove
+from os.path import dirname, realpath
+from sys import argv, path
+from tempfile import mkstemp
+from time import time
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from copipes import pipeline
+from copipes import example
+from copipes.sinks import write
+
+
+def records(count):
+    record = example.LogRecord
+    levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+    modules = ('first', 'second', 'third')
+    for i in range(count):
+        yield record(levels[i % 4], modules[i % 3], 'Message {0}'.format(i))
+
+
+def measure(worker, count, buffering=-1):
+    # ``worker`` is a function of file returning parametrized coroutine
+    fd, name = mkstemp()
+    close(fd)
+    try:
+        with open(name, 'w', buffering) as f:
+            start = time()
+            pipeline(worker(f)).feed(records(count))
+            f.flush()
+            return count / (time() - start)
+    finally:
+        remove(name)
+
+
+if __name__ == '__main__':
+    count = int(argv[1]) if len(argv) > 1 else 10000000
+    template = '{0.level:7.7} {0.module:6.6} {0.message}\n'
+    saved = lambda f: example.save.params(f)
+    buffered = lambda f: write.params(f, template=template)
+
+    for label, buffering in (('default', -1), ('line', 1)):
+        per_record = measure(saved, count, buffering)
+        batched = measure(buffered, count, buffering)
+        print('File buffering: {0}'.format(label))
+        print('  Per-record writes: {0:12.0f} records/sec'.format(per_record))
+        print('  Buffered writes:   {0:12.0f} records/sec'.format(batched))
+        print('  Speedup:           {0:12.2f}x'.format(batched / per_record))
@@ -0,0 +1,272 @@
+"""
+Benchmark suite, which measures pipelines of typical shapes on synthetic
+data.  Each workload reports throughput in items/sec, percentiles of
+latency of sending one item (or one batch) to the pipeline, and peak memory
+allocated during feed.  Data are generated using fixed seed, so runs are
+comparable.  Results are stored as JSON, and two result files can be
+compared.
+
+Run it from the project root::
+
+    python benchmarks/suite.py [--size N] [--repeat N] [--seed N]
+                               [--output FILE] [workload ...]
+    python benchmarks/suite.py --compare OLD NEW
+
+Workloads:
+
+``chain``
+    deep linear chain of coroutines;
+``fork``
+    wide fork, which broadcasts items to many branches;
+``nested``
+    nested forks of the log pipeline from ``copipes/example.py``;
+``pipe``
+    chain of stages defined by ``@pipe`` macro;
+``feed``, ``feed-batched``
+    short chain fed by single items and by batches, which shows overhead
+    of feed itself.
+
+"""
+
+import argparse
+import json
+import platform
+from io import StringIO
+from os.path import dirname, realpath
+from random import Random
+from sys import path
+from timeit import default_timer as timer
+
+try:
+    import tracemalloc
+except ImportError:     # Python < 3.4
+    tracemalloc = None
+
+path.insert(0, dirname(dirname(realpath(__file__))))
+
+from copipes import coroutine, batched, pipeline, null, send_many
+from copipes import example
+
+
+@coroutine
+def add(value, next=null):
+    while True:
+        item = yield
+        next.send(item + value)
+
+
+@batched
+def add_many(value, next=null):
+    while True:
+        items = yield
+        send_many(next, [item + value for item in items])
+
+
+@coroutine
+def broadcast(*channels):
+    while True:
+        item = yield
+        for channel in channels:
+            channel.send(item)
+
+
+@coroutine
+def count(counter, next=null):
+    while True:
+        item = yield
+        counter[0] += 1
+        next.send(item)
+
+
+def numbers(size, seed):
+    random = Random(seed)
+    return [random.randint(0, 1 << 20) for i in range(size)]
+
+
+def log_lines(size, seed):
+    random = Random(seed)
+    levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+    modules = ['first', 'second', 'third']
+    return [u'{0} {1} Message {2}'.format(random.choice(levels),
+                                          random.choice(modules),
+                                          random.randint(1, 100))
+            for i in range(size)]
+
+
+def chain(depth=50):
+    return pipeline(*[add.params(1)] * depth)
+
+
+def fork(width=32):
+    p = pipeline()
+    with p.fork(broadcast, width) as branches:
+        for branch in branches:
+            branch.connect(add.params(1), count.params([0]))
+    return p
+
+
+def nested():
+    p = pipeline(
+        example.parse,
+        example.filter.params(lambda r: r.level != 'DEBUG'),
+    )
+    with p.fork(example.broadcast, 2) as (modules, errors):
+        with modules.fork(example.split.params(lambda r: r.module),
+                          'first', 'second', 'third') as (first, second,
+                                                          third):
+            first.connect(example.save.params(StringIO()))
+            second.connect(example.save.params(StringIO()))
+            third.connect(example.save.params(StringIO()))
+        errors.connect(
+            example.filter.params(lambda r: r.level in ('ERROR', 'WARNING')),
+            example.unique,
+            example.save.params(StringIO()),
+        )
+    return p
+
+
+def pipe_chain(depth=50):
+    from copipes.macros.pipe import pipe
+
+    @pipe
+    def increment(value):
+        [x]                 # noqa: F821
+        send(x + value)     # noqa: F821
+
+    return pipeline(*[increment.params(1)] * depth)
+
+
+def short_chain():
+    return chain(depth=5)
+
+
+def batched_chain(depth=5):
+    return pipeline(*[add_many.params(1)] * depth)
+
+
+# name: (build pipeline, generate data, batch size)
+WORKLOADS = [
+    ('chain', chain, numbers, None),
+    ('fork', fork, numbers, None),
+    ('nested', nested, log_lines, None),
+    ('pipe', pipe_chain, numbers, None),
+    ('feed', short_chain, numbers, None),
+    ('feed-batched', batched_chain, numbers, 256),
+]
+
+
+def percentile(values, q):
+    index = int(round(q * (len(values) - 1)))
+    return values[index]
+
+
+def throughput(build, data, batch_size, repeat):
+    best = None
+    for i in range(repeat):
+        p = build()
+        start = timer()
+        p.feed(data, batch_size=batch_size)
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(data) / best
+
+
+def latency(build, data, batch_size):
+    p = build()()
+    if batch_size:
+        send = getattr(p, 'send_many', None) or \
+               (lambda items: send_many(p, items))
+        data = [data[i:i + batch_size]
+                for i in range(0, len(data), batch_size)]
+    else:
+        send = p.send
+    result = []
+    for item in data:
+        start = timer()
+        send(item)
+        result.append(timer() - start)
+    p.close()
+    result.sort()
+    return dict(('p{0}'.format(int(q * 100)), percentile(result, q))
+                for q in (0.5, 0.9, 0.99))
+
+
+def peak_memory(build, data, batch_size):
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        build().feed(data, batch_size=batch_size)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(names, size, seed, repeat):
+    results = {}
+    for name, build, generate, batch_size in WORKLOADS:
+        if names and name not in names:
+            continue
+        try:
+            build()
+        except (ImportError, SyntaxError) as e:
+            print('{0:14} skipped: {1}'.format(name, e))
+            continue
+        data = generate(size, seed)
+        result = {
+            'items_per_sec': throughput(build, data, batch_size, repeat),
+            'latency': latency(build, data, batch_size),
+            'peak_memory': peak_memory(build, data, batch_size),
+            'batch_size': batch_size,
+        }
+        results[name] = result
+        print('{0:14} {1:12.0f} items/sec  p50 {2[p50]:.2e} s  '
+              'p99 {2[p99]:.2e} s  peak {3} bytes'.format(
+                  name, result['items_per_sec'], result['latency'],
+                  result['peak_memory']))
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'size': size,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(old, new):
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    print('{0:14} {1:>14} {2:>14} {3:>8}'.format('workload', 'old items/s',
+                                                  'new items/s', 'ratio'))
+    for name in sorted(set(old['results']) & set(new['results'])):
+        a = old['results'][name]['items_per_sec']
+        b = new['results'][name]['items_per_sec']
+        print('{0:14} {1:14.0f} {2:14.0f} {3:7.2f}x'.format(name, a, b, b / a))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run pipeline benchmarks')
+    parser.add_argument('workloads', nargs='*',
+                        help='workloads to run (default: all)')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='number of items per workload')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs, the best one is taken')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='seed of synthetic data')
+    parser.add_argument('--output', help='file to store results as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        report = run(args.workloads, args.size, args.seed, args.repeat)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
@@ -1,10 +1,20 @@
+from collections import deque
 from contextlib import contextmanager
 from functools import update_wrapper
+from itertools import islice
 from os import linesep
-from sys import version_info
+from sys import modules, version_info
+from threading import Lock, Semaphore, Thread
+from timeit import default_timer as timer
 
+try:
+    from queue import Queue
+except ImportError:     # Python 2.x
+    from Queue import Queue
 
-__all__ = ['coroutine', 'pipeline', 'null']
+
+__all__ = ['coroutine', 'pure', 'batched', 'mapper', 'predicate', 'pipeline',
+           'null', 'send_many']
 __version__ = '0.1'
 __author__ = 'Dmitry Vakhrushev <self@kr41.net>'
 __license__ = 'BSD'
@@ -61,6 +71,10 @@ class _null(object):
         """ Mimics to coroutine processing """
         pass
 
+    def send_many(self, items):
+        """ Mimics to batched coroutine processing """
+        pass
+
     def close(self):
         """ Mimics to coroutine termination """
         pass
@@ -100,12 +114,19 @@ class coroutine(object):
         >>> target
         [2, 3, 4]
 
+    Coroutine, which has no side effects, i.e. only sends items to the next
+    worker, can be marked as pure using :func:`pure` decorator or ``pure``
+    argument.  Pure coroutine, which next worker is ``null``, is dropped by
+    :class:`pipeline` during initialization, because its work is discarded
+    anyway.
+
     """
 
-    def __init__(self, func):
+    def __init__(self, func, pure=False):
         self.func = func
         self.args = ()
         self.kw = {}
+        self.pure = pure
         update_wrapper(self, func)
 
     def __call__(self, *args, **kw):
@@ -118,6 +139,20 @@ class coroutine(object):
         method()
         return c
 
+    def __getstate__(self):
+        # Function of coroutine defined at module level is shadowed by the
+        # coroutine itself, so it's pickled by reference to the coroutine
+        state = self.__dict__.copy()
+        reference = _reference.to(self.func)
+        if reference is not None:
+            state['func'] = state['__wrapped__'] = reference
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state['func'], _reference):
+            state['func'] = state['__wrapped__'] = state['func'].resolve()
+        self.__dict__.update(state)
+
     def __repr__(self):
         params = [repr(a) for a in self.args]
         params.extend('{0!s}={1!r}'.format(k, v) for k, v in self.kw.items())
@@ -125,6 +160,56 @@ class coroutine(object):
         return '{0}'.format(self.__name__) if not params else \
                '{0}.params({1})'.format(self.__name__, params)
 
+    def get_state(self):
+        """
+        Returns state of coroutine for checkpoint, i.e. dict of states of its
+        parameters, which provide ``get_state`` and ``set_state`` methods,
+        like :mod:`copipes.dedup` backends do.  The dict is keyed by position
+        or name of parameter.  Returns ``None``, if coroutine has no such
+        parameters.
+
+        Local variables of coroutine are not the part of its state, so
+        coroutine opts in checkpoints by keeping its state in parameter.
+
+        ..  code-block:: pycon
+
+            >>> class counter(object):
+            ...     def __init__(self):
+            ...         self.value = 0
+            ...     def get_state(self):
+            ...         return self.value
+            ...     def set_state(self, state):
+            ...         self.value = state
+
+            >>> @coroutine
+            ... def count(counter, next=null):
+            ...     while True:
+            ...         item = yield
+            ...         counter.value += 1
+            ...         next.send(item)
+
+            >>> c = count.params(counter())
+            >>> pipeline(c).feed(range(3))
+            >>> c.get_state()
+            {0: 3}
+            >>> c.set_state({0: 10})
+            >>> c.args[0].value
+            10
+
+        """
+        state = {}
+        params = list(enumerate(self.args)) + list(self.kw.items())
+        for key, value in params:
+            if not isinstance(value, type) and hasattr(value, 'get_state'):
+                state[key] = value.get_state()
+        return state or None
+
+    def set_state(self, state):
+        """ Restores state of coroutine returned by :meth:`get_state` """
+        for key, value in state.items():
+            param = self.args[key] if isinstance(key, int) else self.kw[key]
+            param.set_state(value)
+
     def params(self, *args, **kw):
         """
         Returns a parametrized copy of coroutine.
@@ -158,12 +243,304 @@ class coroutine(object):
             [2, 3, 4]
 
         """
-        p = self.__class__(self.func)
+        p = self.__class__(self.func, pure=self.pure)
         p.args = args
         p.kw = kw
         return p
 
 
+def pure(worker):
+    """
+    Decorator marks coroutine as pure, see :class:`coroutine`.
+
+    ..  code-block:: pycon
+
+        >>> @pure
+        ... @coroutine
+        ... def decrement(next=null):
+        ...     while True:
+        ...         item = yield
+        ...         next.send(item - 1)
+
+        >>> decrement.pure
+        True
+        >>> pipeline(decrement, decrement)()
+        null
+
+    """
+    worker.pure = True
+    return worker
+
+
+class _reference(object):
+    """ Reference to function of coroutine defined at module level """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    @classmethod
+    def to(cls, func):
+        """ Returns reference to ``func`` or ``None`` if it's not found """
+        module = getattr(func, '__module__', None)
+        name = getattr(func, '__qualname__', func.__name__)
+        if '<locals>' in name or module not in modules:
+            return None
+        reference = cls(module, name)
+        try:
+            if reference.resolve() is func:
+                return reference
+        except AttributeError:
+            pass
+        return None
+
+    def resolve(self):
+        """ Returns referenced function """
+        __import__(self.module)
+        owner = modules[self.module]
+        for name in self.name.split('.'):
+            owner = getattr(owner, name)
+        return getattr(owner, 'func', owner)
+
+
+class batched(coroutine):
+    """
+    Decorator turns callable to batched coroutine.
+
+    Batched coroutine receives a sequence of items per resume instead of
+    a single item.  Use :func:`send_many` to pass the whole batch to the next
+    worker, so that it moves through the pipeline in one resume of each
+    batched worker.  Initialized batched coroutine also accepts single items
+    via ``send``, so it can be used after a plain coroutine.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @batched
+        ... def increment(next=null):
+        ...     while True:
+        ...         items = yield
+        ...         send_many(next, [item + 1 for item in items])
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> target = []
+        >>> inc = increment(collect(target))    # Init coroutines
+
+        >>> inc.send_many([1, 2])
+        >>> inc.send(3)
+
+        >>> target
+        [2, 3, 4]
+
+    """
+
+    def __call__(self, *args, **kw):
+        """ Returns initialized batched coroutine """
+        return _batched(super(batched, self).__call__(*args, **kw))
+
+
+class _batched(object):
+    """
+    Initialized batched coroutine.  You don't need to deal with it directly,
+    use :class:`batched` decorator.
+
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.send_many = generator.send
+        self.close = generator.close
+
+    def send(self, item):
+        self.generator.send((item,))
+
+
+def send_many(target, items):
+    """
+    Sends sequence of ``items`` to ``target`` coroutine.
+
+    If ``target`` is a batched coroutine, the whole sequence is passed in one
+    call.  Otherwise items are sent one by one.
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> target = []
+        >>> send_many(collect(target), [1, 2, 3])
+        >>> target
+        [1, 2, 3]
+
+    """
+    method = getattr(target, 'send_many', None)
+    if method is not None:
+        method(items)
+    else:
+        send = target.send
+        for item in items:
+            send(item)
+
+
+class mapper(coroutine):
+    """
+    Decorator turns function of single item to coroutine, which sends result
+    of the function to the next worker.  Parameters passed via
+    :meth:`coroutine.params` precede the item.
+
+    Pipeline of mappers and predicates can be fused into single coroutine
+    using :meth:`pipeline.compile`.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @mapper
+        ... def add(value, item):
+        ...     return item + value
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> target = []
+        >>> pipeline(add.params(1), collect.params(target)).feed([1, 2, 3])
+        >>> target
+        [2, 3, 4]
+
+    """
+
+    template = '{0} = {1}'
+
+    def __call__(self, next=null):
+        """ Returns initialized coroutine """
+        return _fused((self,))(next=next)
+
+
+class predicate(mapper):
+    """
+    Decorator turns function of single item to coroutine, which sends to the
+    next worker only items the function returns true for.  Parameters passed
+    via :meth:`coroutine.params` precede the item.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @predicate
+        ... def divisible(value, item):
+        ...     return not item % value
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> target = []
+        >>> p = pipeline(divisible.params(2), collect.params(target))
+        >>> p.feed([1, 2, 3, 4])
+        >>> target
+        [2, 4]
+
+    """
+
+    template = 'if not {1}:{2}    continue'
+
+
+class _fused(object):
+    """
+    Fused run of mappers and predicates.  You don't need to deal with it
+    directly, use :meth:`pipeline.compile` method.
+
+    The run is compiled into single generator, so item passes the whole run
+    in one resume.  Like each of the fused workers, it closes the next one on
+    termination.
+
+    """
+
+    cache = {}
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pure = all(worker.pure for worker in workers)
+        self.key = tuple((w.template, len(w.args), tuple(sorted(w.kw)))
+                         for w in workers)
+
+    def function(self, send):
+        """
+        Returns generated coroutine, if ``send`` is false the coroutine
+        doesn't send items to the next worker
+
+        """
+        key = (self.key, send)
+        func = self.cache.get(key)
+        if func is None:
+            func = self.cache[key] = self.generate(*key)
+        return func
+
+    @staticmethod
+    def generate(key, send=True):
+        # Parameters of workers are passed to the generated function as
+        # arguments, so calls inside the loop don't go through ``partial``.
+        indent = '\n' + ' ' * 12
+        names = []
+        body = []
+        for i, (template, argc, kwnames) in enumerate(key):
+            func = 'f{0}'.format(i)
+            args = ['{0}_{1}'.format(func, j) for j in range(argc)]
+            kw = ['{0}_{1}'.format(func, k) for k in kwnames]
+            names.append(func)
+            names.extend(args)
+            names.extend(kw)
+            call = '{0}({1})'.format(func, ', '.join(
+                args + ['item'] +
+                ['{0}={1}'.format(k, v) for k, v in zip(kwnames, kw)]
+            ))
+            body.append(template.format('item', call, indent))
+        source = '\n'.join([
+            'def fused({0}next):',
+            '    send = next.send',
+            '    try:',
+            '        while True:',
+            '            item = yield',
+            '            {1}',
+            '            send(item)' if send else '',
+            '    finally:',
+            '        next.close()',
+        ]).format(''.join(name + ', ' for name in names), indent.join(body))
+        namespace = {}
+        exec(compile(source, '<fused>', 'exec'), namespace)
+        return coroutine(namespace['fused'])
+
+    def __call__(self, next=null):
+        """ Returns initialized fused coroutine """
+        args = []
+        for worker in self.workers:
+            args.append(worker.func)
+            args.extend(worker.args)
+            args.extend(worker.kw[k] for k in sorted(worker.kw))
+        return self.function(bool(next))(*args, next=next)
+
+    def __repr__(self):
+        return linesep.join(repr(worker) for worker in self.workers)
+
+
 class pipeline(object):
     """
     Coroutine pipeline is utility class to connect number of coroutines into
@@ -215,8 +592,21 @@ class pipeline(object):
         self.connect(*workers)
 
     def __call__(self, next=null):
-        """ Returns initialized coroutine pipeline """
-        for worker in reversed(self.pipe):
+        """
+        Returns initialized coroutine pipeline.
+
+        Workers connected after ``null`` and pure workers followed by ``null``
+        are not initialized, since items never reach them or their work is
+        discarded.
+
+        """
+        workers = self.pipe
+        if null in workers:
+            workers = workers[:workers.index(null)]
+            next = null
+        for worker in reversed(workers):
+            if not next and getattr(worker, 'pure', False):
+                continue
             next = worker(next=next)
         return next
 
@@ -255,10 +645,141 @@ class pipeline(object):
         """
         self.pipe.extend(workers)
 
+    def compile(self):
+        """
+        Returns equal pipeline, where each run of adjacent :class:`mapper` and
+        :class:`predicate` workers is fused into single coroutine.  Forked
+        pipelines are compiled too.  Other workers are left as is.
+
+        Examples:
+
+        ..  code-block:: pycon
+
+            >>> @mapper
+            ... def add(value, item):
+            ...     return item + value
+
+            >>> @predicate
+            ... def even(item):
+            ...     return not item % 2
+
+            >>> @coroutine
+            ... def collect(target, next=null):
+            ...     while True:
+            ...         item = yield
+            ...         target.append(item)
+            ...         next.send(item)
+
+            >>> target = []
+            >>> p = pipeline(add.params(1), even, add.params(10))
+            >>> p.connect(collect.params(target))
+            >>> p.compile().feed([1, 2, 3, 4])
+            >>> target
+            [12, 14]
+
+        """
+        result = pipeline()
+        run = []
+        for worker in self.pipe + [None]:
+            if isinstance(worker, mapper):
+                run.append(worker)
+                continue
+            if run:
+                result.connect(_fused(tuple(run)))
+                run = []
+            if worker is None:
+                break
+            if isinstance(worker, _fork):
+                worker = worker.compile()
+            result.connect(worker)
+        return result
+
+    def freeze(self):
+        """
+        Returns factory of initialized pipelines, which is equal to the
+        pipeline, but is cheaper to call.  Parameters of coroutines are
+        resolved once, so the factory is not affected by further changes
+        of the pipeline.  It is useful when many short-lived pipelines are
+        initialized, e.g. one per request.
+
+        Examples:
+
+        ..  code-block:: pycon
+
+            >>> @coroutine
+            ... def collect(target, next=null):
+            ...     while True:
+            ...         item = yield
+            ...         target.append(item)
+            ...         next.send(item)
+
+            >>> @coroutine
+            ... def increment(next=null):
+            ...     while True:
+            ...         item = yield
+            ...         next.send(item + 1)
+
+            >>> result = []
+            >>> factory = pipeline(increment, collect.params(result)).freeze()
+            >>> for i in range(3):
+            ...     p = factory()
+            ...     p.send(i)
+            ...     p.close()
+            >>> result
+            [1, 2, 3]
+
+            >>> factory
+            <frozen pipeline>
+            increment
+            collect.params([1, 2, 3])
+
+        """
+        return _frozen(self)
+
+    def profile(self):
+        """
+        Returns equal pipeline, which records statistics of each worker
+        including ones of forked pipelines.  The statistics are: number of
+        items passed in and out, cumulative and self time spent by the worker,
+        and maximum latency, i.e. maximum time spent to process one item.
+        Cumulative time includes time spent by the downstream workers, self
+        time does not.  Use ``report`` method of the returned pipeline to get
+        the statistics in the same layout as representation of the pipeline.
+
+        Original pipeline is not affected, so there is no overhead when
+        profiling is not used.
+
+        Examples:
+
+        ..  code-block:: pycon
+
+            >>> @mapper
+            ... def add(value, item):
+            ...     return item + value
+
+            >>> @predicate
+            ... def even(item):
+            ...     return not item % 2
+
+            >>> p = pipeline(add.params(1), even).profile()
+            >>> p.feed([1, 2, 3, 4])
+            >>> print(p.report())                       # doctest: +ELLIPSIS
+                           in  out  cumulative, s   self, s  max latency, s
+            add.params(1)   4    4       0.0...  0.0...        0.0...
+            even            4    2       0.0...  0.0...        0.0...
+
+        """
+        return _profiled_pipeline(*self.pipe)
+
     def plug(self):
         """ Plug pipeline, i.e. connect ``null`` to pipeline """
         self.pipe.append(null)
 
+    @property
+    def plugged(self):
+        """ True if pipeline is plugged, i.e. items never leave it """
+        return null in self.pipe
+
     @contextmanager
     def fork(self, worker, *pipes):
         """
@@ -373,25 +894,553 @@ class pipeline(object):
         else:
             pipe_count = len(pipes)
             pipe_names = pipes
-        pipes = tuple(pipeline() for i in range(pipe_count))
+        pipes = tuple(self.__class__() for i in range(pipe_count))
         yield pipes
         if pipe_names:
-            self.connect(_fork(worker, **dict(zip(pipe_names, pipes))))
+            self.connect(self.forked(worker, **dict(zip(pipe_names, pipes))))
         else:
-            self.connect(_fork(worker, *pipes))
+            self.connect(self.forked(worker, *pipes))
+
+    def forked(self, worker, *pipes, **named_pipes):
+        """ Returns forked coroutine for :meth:`fork` """
+        return _fork(worker, *pipes, **named_pipes)
+
+    def get_state(self):
+        """
+        Returns list of states of workers including ones of forked pipelines.
+        See :meth:`coroutine.get_state`.
 
-    def feed(self, source):
+        """
+        return [worker.get_state() for worker in self.stateful()]
+
+    def set_state(self, state):
+        """ Restores state of workers returned by :meth:`get_state` """
+        workers = list(self.stateful())
+        if len(workers) != len(state):
+            raise ValueError('State does not match pipeline')
+        for worker, value in zip(workers, state):
+            if value is not None:
+                worker.set_state(value)
+
+    def stateful(self):
+        """
+        Iterates over workers, which support :meth:`coroutine.get_state`,
+        including ones of forked pipelines and ones wrapped by other workers.
+        A wrapper exposes wrapped workers by its own ``stateful`` method.
+
+        """
+        for worker in self.pipe:
+            for w in _stateful(worker):
+                yield w
+
+    def feed(self, source, batch_size=None, checkpoint=None, resume_from=None):
         """
         Feed pipeline using items from ``source``.
 
-        The method initializes pipeline, feeds it, then closes it.
+        The method initializes pipeline, feeds it, then closes it.  If
+        ``batch_size`` is passed, items are sent to pipeline by chunks of
+        the size using :func:`send_many`.
+
+        If ``checkpoint`` is passed, the number of items fed and the state of
+        pipeline (see :meth:`get_state`) are saved each ``checkpoint.interval``
+        items and at the end of source by ``checkpoint.save(position, state)``
+        call.  If ``resume_from`` is passed, the pipeline state is restored
+        from the snapshot returned by ``resume_from.load()``, and the items
+        fed before it are skipped.  Both are usually the same
+        :class:`copipes.checkpoint.checkpoint`.  Both are closed by
+        ``close()`` call, when they are no longer needed.  Items fed after the
+        last snapshot are fed again on resume, and state of workers, which do
+        not opt in checkpoints, is lost.
+
+        ..  code-block:: pycon
+
+            >>> @batched
+            ... def collect(target, next=null):
+            ...     while True:
+            ...         items = yield
+            ...         target.append(list(items))
+            ...         send_many(next, items)
+
+            >>> result = []
+            >>> pipeline(collect.params(result)).feed(range(5), batch_size=2)
+            >>> result
+            [[0, 1], [2, 3], [4]]
 
         """
+        position = 0
+        if resume_from is not None:
+            snapshot = resume_from.load()
+            if snapshot is not None:
+                position, state = snapshot
+                self.set_state(state)
+                source = islice(source, position, None)
+            if resume_from is not checkpoint:
+                resume_from.close()
         p = self()
-        for item in source:
-            p.send(item)
+        send, source = _sender(p, source, batch_size)
+        if checkpoint is None:
+            for item in source:
+                send(item)
+        else:
+            try:
+                saved = position
+                mark = position + checkpoint.interval
+                for item in source:
+                    send(item)
+                    position += len(item) if batch_size else 1
+                    if position >= mark:
+                        checkpoint.save(position, self.get_state())
+                        saved = position
+                        mark = position + checkpoint.interval
+                if position > saved:
+                    checkpoint.save(position, self.get_state())
+            finally:
+                checkpoint.close()
         p.close()
 
+    def session(self, next=null):
+        """
+        Returns session, which keeps initialized pipeline alive across many
+        :meth:`feed` calls of its own, so workers are not re-created and
+        primed for each source.  Session is a context manager, which is
+        closed on exit.
+
+        Session provides the following methods:
+
+        ``send(item)``, ``send_many(items)``
+            send item or batch to pipeline;
+        ``feed(source, batch_size=None)``
+            send items of ``source`` like :meth:`pipeline.feed` does, but
+            don't close pipeline;
+        ``flush()``
+            close pipeline, so workers send items they hold on close, like
+            :mod:`copipes.windows` do.  The pipeline is initialized again
+            on the next call;
+        ``reset()``
+            restore state of workers (see :meth:`get_state`) to the one
+            taken before the first item is sent to session.  Local variables
+            of workers are not the part of the state, so use ``flush()`` to
+            drop them.  Raises ``TypeError``, if the state can't be taken,
+            e.g. it's kept by :class:`copipes.parallel.parallel` processes;
+        ``close()``
+            the same as ``flush()``.
+
+        Pipeline is also initialized again, when a worker raises exception,
+        because the raising generator can't be resumed.  Use :meth:`pool`
+        to share sessions between threads.
+
+        ..  code-block:: pycon
+
+            >>> class counter(object):
+            ...     def __init__(self):
+            ...         self.value = 0
+            ...     def get_state(self):
+            ...         return self.value
+            ...     def set_state(self, state):
+            ...         self.value = state
+
+            >>> @coroutine
+            ... def count(counter, next=null):
+            ...     try:
+            ...         while True:
+            ...             item = yield
+            ...             counter.value += 1
+            ...             next.send(item)
+            ...     except GeneratorExit:
+            ...         next.send(counter.value)
+            ...         next.close()
+
+            >>> @coroutine
+            ... def collect(target, next=null):
+            ...     while True:
+            ...         item = yield
+            ...         target.append(item)
+            ...         next.send(item)
+
+            >>> result = []
+            >>> c = counter()
+            >>> p = pipeline(count.params(c), collect.params(result))
+            >>> with p.session() as session:
+            ...     session.feed('ab')
+            ...     session.feed('cd')
+            ...     session.flush()
+            ...     session.reset()
+            ...     session.feed('e')
+            >>> result
+            ['a', 'b', 'c', 'd', 4, 'e', 1]
+
+        """
+        return _session(self, next)
+
+    def pool(self, size, next=null):
+        """
+        Returns thread-safe pool of at most ``size`` sessions (see
+        :meth:`session`), which are initialized on demand.  Session is taken
+        from the pool by ``with pool.session() as session`` statement, which
+        blocks, while all sessions are in use.  Session is returned to the
+        pool on exit without flushing.  If the body of the statement raises
+        exception, the session is closed instead.  Call ``pool.close()`` to
+        close idle sessions.
+
+        All sessions send items to the same ``next`` worker and share
+        parameters of workers, so they should be thread-safe.
+
+        ..  code-block:: pycon
+
+            >>> @coroutine
+            ... def increment(next=null):
+            ...     while True:
+            ...         item = yield
+            ...         next.send(item + 1)
+
+            >>> @coroutine
+            ... def collect(target, next=null):
+            ...     while True:
+            ...         item = yield
+            ...         target.append(item)
+            ...         next.send(item)
+
+            >>> result = []
+            >>> pool = pipeline(increment, collect.params(result)).pool(2)
+            >>> with pool.session() as session:
+            ...     session.feed([1, 2])
+            >>> with pool.session() as session:     # The same session
+            ...     session.send(3)
+            >>> pool.close()
+            >>> result
+            [2, 3, 4]
+
+        """
+        return _pool(self, size, next)
+
+    def iter(self, source, batch_size=None, maxsize=None):
+        """
+        Returns iterator over items sent by the last worker of pipeline fed
+        by items from ``source``.  Items are pulled from ``source`` lazily,
+        when the iterator is exhausted.  See :meth:`feed` for ``batch_size``.
+
+        By default, pipeline is run within the iterator, so outputs of each
+        item pulled from source are buffered, until they are consumed.  If
+        ``maxsize`` is passed, pipeline is run on a separate thread, which is
+        blocked when the buffer holds ``maxsize`` items.  So the memory is
+        bounded even if one item fans out to many ones.
+
+        Pipeline is closed, when source is exhausted, and items sent on close
+        are also iterated over.  Closing of iterator closes pipeline too.
+
+        ..  code-block:: pycon
+
+            >>> @coroutine
+            ... def replicate(count, next=null):
+            ...     while True:
+            ...         item = yield
+            ...         for i in range(count):
+            ...             next.send(item)
+
+            >>> p = pipeline(replicate.params(2))
+            >>> list(p.iter([1, 2, 3]))
+            [1, 1, 2, 2, 3, 3]
+
+            >>> items = p.iter(range(1000000), maxsize=10)
+            >>> [next(items) for i in range(3)]
+            [0, 0, 1]
+            >>> items.close()
+
+        """
+        if maxsize is None:
+            return self._pull(source, batch_size)
+        return self._pull_threaded(source, batch_size, maxsize)
+
+    def _pull(self, source, batch_size):
+        output = deque()
+        p = self(_output(output))
+        send, source = _sender(p, source, batch_size)
+        popleft = output.popleft
+        try:
+            for item in source:
+                send(item)
+                while output:
+                    yield popleft()
+            p.close()
+            while output:
+                yield popleft()
+        except GeneratorExit:
+            p.close()
+            raise
+
+    def _pull_threaded(self, source, batch_size, maxsize):
+        queue = Queue(maxsize)
+        cancelled = []
+
+        def run():
+            try:
+                p = self(_queued(queue, cancelled))
+                send, items = _sender(p, source, batch_size)
+                for item in items:
+                    if cancelled:
+                        break
+                    send(item)
+                p.close()
+                queue.put(_done(None))
+            except Exception as e:
+                queue.put(_done(e))
+
+        thread = Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if isinstance(item, _done):
+                    if item.error is not None:
+                        raise item.error
+                    break
+                yield item
+        except GeneratorExit:
+            # The thread stops feeding and closes pipeline
+            cancelled.append(True)
+            # Unblock the thread, so it notices cancellation
+            while not isinstance(queue.get(), _done):
+                pass
+            raise
+        finally:
+            thread.join()
+
+
+class _frozen(object):
+    """
+    Factory of initialized pipelines.  You don't need to deal with it
+    directly, use :meth:`pipeline.freeze` method.
+
+    """
+
+    def __init__(self, pipeline):
+        workers = pipeline.pipe
+        # The plug is kept in ``pipe``, so the frozen pipeline is reported
+        # as plugged to the joint of forked ones
+        self.pipe = list(workers)
+        self.plugged = null in workers
+        if self.plugged:
+            workers = workers[:workers.index(null)]
+        self.steps = []
+        for worker in reversed(workers):
+            pure = getattr(worker, 'pure', False)
+            if type(worker) is _fork:
+                # Forked pipelines are frozen too
+                worker = _fork(worker.worker,
+                               *[p.freeze() for p in worker.pipes],
+                               **dict((name, p.freeze()) for name, p
+                                      in worker.named_pipes.items()))
+                self.steps.append((pure, worker, None, None))
+            elif type(worker) is coroutine:
+                # Plain coroutine is initialized bypassing its ``__call__``
+                kw = dict(worker.kw)
+                kw.pop('next', None)
+                self.steps.append((pure, worker.func, worker.args, kw))
+            else:
+                self.steps.append((pure, worker, None, None))
+
+    def __call__(self, next=null):
+        """ Returns initialized coroutine pipeline """
+        if self.plugged:
+            next = null
+        for pure, func, args, kw in self.steps:
+            if pure and not next:
+                continue
+            if args is None:
+                next = func(next=next)
+            else:
+                next = func(*args, next=next, **kw)
+                next.send(None)
+        return next
+
+    def __repr__(self):
+        return linesep.join(['<frozen pipeline>'] +
+                            [repr(worker) for worker in self.pipe])
+
+
+class _session(object):
+    """
+    Initialized pipeline, which is fed many times.  You don't need to deal
+    with it directly, use :meth:`pipeline.session` method.
+
+    """
+
+    def __init__(self, pipeline, next):
+        self.pipeline = pipeline
+        self.next = next
+        self.snapshot = None
+        self.coroutine = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        # Returns initialized pipeline, initializes it on demand.  State is
+        # taken before the first item, since pipelines, which state can't
+        # be taken, e.g. because it's kept by worker processes, can be used
+        # by session too, but can't be reset.
+        if self.snapshot is None:
+            try:
+                self.snapshot = self.pipeline.get_state(), None
+            except TypeError as e:
+                self.snapshot = None, e
+        if self.coroutine is None:
+            self.coroutine = self.pipeline(self.next)
+        return self.coroutine
+
+    def send(self, item):
+        try:
+            self.start().send(item)
+        except Exception:
+            self.coroutine = None
+            raise
+
+    def send_many(self, items):
+        try:
+            send_many(self.start(), items)
+        except Exception:
+            self.coroutine = None
+            raise
+
+    def feed(self, source, batch_size=None):
+        send, source = _sender(self.start(), source, batch_size)
+        try:
+            for item in source:
+                send(item)
+        except Exception:
+            self.coroutine = None
+            raise
+
+    def flush(self):
+        p, self.coroutine = self.coroutine, None
+        if p is not None:
+            p.close()
+
+    def reset(self):
+        if self.snapshot is None:
+            return
+        state, error = self.snapshot
+        if error is not None:
+            raise error
+        self.pipeline.set_state(state)
+
+    close = flush
+
+
+class _pool(object):
+    """
+    Thread-safe pool of sessions.  You don't need to deal with it directly,
+    use :meth:`pipeline.pool` method.
+
+    """
+
+    def __init__(self, pipeline, size, next):
+        self.pipeline = pipeline
+        self.next = next
+        self.idle = []
+        self.lock = Lock()
+        self.available = Semaphore(size)
+
+    @contextmanager
+    def session(self):
+        self.available.acquire()
+        try:
+            with self.lock:
+                session = self.idle.pop() if self.idle else None
+            if session is None:
+                session = self.pipeline.session(self.next)
+            try:
+                yield session
+            except BaseException:
+                # The session may be broken, so it's not reused
+                session.close()
+                raise
+            with self.lock:
+                self.idle.append(session)
+        finally:
+            self.available.release()
+
+    def close(self):
+        with self.lock:
+            sessions, self.idle = self.idle, []
+        for session in sessions:
+            session.close()
+
+
+class _output(object):
+    """ Sink, which passes items to ``deque`` for :meth:`pipeline.iter` """
+
+    def __init__(self, output):
+        self.send = output.append
+        self.send_many = output.extend
+
+    def close(self):
+        pass
+
+
+class _queued(object):
+    """ Sink, which passes items to ``Queue`` for :meth:`pipeline.iter` """
+
+    def __init__(self, queue, cancelled):
+        self.queue = queue
+        self.cancelled = cancelled
+
+    def send(self, item):
+        # Items are discarded, when iterator is closed
+        if not self.cancelled:
+            self.queue.put(item)
+
+    def send_many(self, items):
+        for item in items:
+            self.send(item)
+
+    def close(self):
+        pass
+
+
+class _done(object):
+    """ Marks the end of items for :meth:`pipeline.iter` """
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _stateful(worker):
+    # Iterates over stateful workers of ``worker``, which is either stateful
+    # itself or wraps other workers, like forks do
+    stateful = getattr(worker, 'stateful', None)
+    if stateful is not None:
+        for w in stateful():
+            yield w
+    elif hasattr(worker, 'get_state'):
+        yield worker
+
+
+def _sender(p, source, batch_size):
+    # Returns function, which sends items of ``source`` to initialized
+    # pipeline ``p``, and the source chunked according to ``batch_size``
+    if not batch_size:
+        return p.send, source
+    send = getattr(p, 'send_many', None)
+    if send is None:
+        send = lambda items: send_many(p, items)
+    return send, _chunks(source, batch_size)
+
+
+def _chunks(source, size):
+    chunk = []
+    for item in source:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 class _fork(object):
     """
@@ -406,12 +1455,57 @@ class _fork(object):
         self.named_pipes = named_pipes
 
     def __call__(self, next):
-        """ Returns initialized forked pipeline """
-        pipes = (pipe(next) for pipe in self.pipes)
+        """
+        Returns initialized forked pipeline.  If the worker is pure and all
+        the forked pipelines are reduced to ``null``, returns ``null``.
+
+        """
+        # Plugged pipelines never reach the joint, so they are not counted
+        branches = self.pipes + tuple(self.named_pipes.values())
+        count = sum(1 for pipe in branches if not pipe.plugged)
+        if next and count > 1:
+            next = _join(next, count, self.concurrent())
+        pipes = [pipe(next) for pipe in self.pipes]
         named_pipes = dict((name, pipe(next)) for name, pipe
                                               in self.named_pipes.items())
+        if getattr(self.worker, 'pure', False) and \
+           not any(pipes) and not any(named_pipes.values()):
+            return null
         return self.worker(*pipes, **named_pipes)
 
+    def concurrent(self):
+        """
+        Returns true if any of the forked pipelines contains concurrent
+        worker, i.e. one sending items from other thread.
+
+        """
+        for pipe in self.pipes + tuple(self.named_pipes.values()):
+            for worker in pipe.pipe:
+                if isinstance(worker, _fork):
+                    if worker.concurrent():
+                        return True
+                elif getattr(worker, 'concurrent', False):
+                    return True
+        return False
+
+    def stateful(self):
+        """ Iterates over stateful workers, see :meth:`pipeline.stateful` """
+        for worker in _stateful(self.worker):
+            yield worker
+        branches = list(self.pipes)
+        branches.extend(pipe for name, pipe
+                             in sorted(self.named_pipes.items()))
+        for pipe in branches:
+            for worker in pipe.stateful():
+                yield worker
+
+    def compile(self):
+        """ Returns forked pipeline with compiled branches """
+        pipes = [pipe.compile() for pipe in self.pipes]
+        named_pipes = dict((name, pipe.compile()) for name, pipe
+                                                  in self.named_pipes.items())
+        return self.__class__(self.worker, *pipes, **named_pipes)
+
     def __repr__(self):
         result = [repr(self.worker) + ':']
         for pipe in self.pipes:
@@ -421,3 +1515,193 @@ class _fork(object):
             result.append('    {0} -->'.format(name))
             result.extend(' ' * 8 + wr for wr in repr(pipe).split(linesep))
         return linesep.join(result)
+
+
+class _join(object):
+    """
+    Joint of forked pipelines.  It passes items to the next worker and closes
+    it, when all the forked pipelines are closed.  If ``concurrent`` is true,
+    the forked pipelines are run on different threads, so the next worker is
+    accessed under lock.
+
+    """
+
+    def __init__(self, next, count, concurrent=False):
+        self.next = next
+        self.count = count
+        self.lock = Lock()
+        # Columnar worker behind the joint receives batches through it,
+        # see :mod:`copipes.columnar`
+        self.columnar = getattr(next, 'columnar', False)
+        if concurrent:
+            self.send = self.send_locked
+            if hasattr(next, 'send_many'):
+                self.send_many = self.send_many_locked
+            return
+        self.send = next.send
+        if hasattr(next, 'send_many'):
+            self.send_many = next.send_many
+
+    def send_locked(self, item):
+        with self.lock:
+            self.next.send(item)
+
+    def send_many_locked(self, items):
+        with self.lock:
+            self.next.send_many(items)
+
+    def close(self):
+        with self.lock:
+            self.count -= 1
+            if not self.count:
+                self.next.close()
+
+
+class _profiled_pipeline(pipeline):
+    """
+    Pipeline, which records statistics of its workers.  You don't need to
+    deal with it directly, use :meth:`pipeline.profile` method.
+
+    """
+
+    def connect(self, *workers):
+        for worker in workers:
+            if isinstance(worker, _fork):
+                pipes = [pipe.profile() for pipe in worker.pipes]
+                named_pipes = dict((name, pipe.profile()) for name, pipe
+                                   in worker.named_pipes.items())
+                worker = worker.__class__(_profiled(worker.worker),
+                                          *pipes, **named_pipes)
+            elif worker is not null:
+                # The plug is kept as is, so the pipeline is still plugged
+                worker = _profiled(worker)
+            self.pipe.append(worker)
+
+    def stats(self, indent=''):
+        """ Returns list of ``(label, stats)`` pairs of the workers """
+        result = []
+        for worker in self.pipe:
+            if worker is null:
+                result.append((indent + repr(worker), None))
+                continue
+            if not isinstance(worker, _fork):
+                result.append((indent + repr(worker), worker.stats))
+                continue
+            result.append((indent + repr(worker.worker) + ':',
+                           worker.worker.stats))
+            branches = [('-->', pipe) for pipe in worker.pipes]
+            branches.extend(('{0} -->'.format(name), pipe)
+                            for name, pipe in worker.named_pipes.items())
+            for label, pipe in branches:
+                result.append((indent + '    ' + label, None))
+                result.extend(pipe.stats(indent + ' ' * 8))
+        return result
+
+    def report(self):
+        """ Returns statistics of the workers as a table """
+        header = ('in', 'out', 'cumulative, s', 'self, s', 'max latency, s')
+        rows = [('', header)]
+        for label, stats in self.stats():
+            if stats is None:
+                rows.append((label, ()))
+                continue
+            rows.append((label, (
+                str(stats.count_in),
+                str(stats.count_out),
+                '{0:.6f}'.format(stats.cumulative),
+                '{0:.6f}'.format(stats.cumulative - stats.downstream),
+                '{0:.6f}'.format(stats.max_latency),
+            )))
+        width = max(len(label) for label, columns in rows)
+        widths = [max(len(columns[i]) for label, columns in rows if columns)
+                  for i in range(len(header))]
+        result = []
+        for label, columns in rows:
+            line = label.ljust(width)
+            for column, w in zip(columns, widths):
+                line += '  ' + column.rjust(w)
+            result.append(line.rstrip())
+        return linesep.join(result)
+
+
+class _stats(object):
+    """ Statistics of profiled worker """
+
+    def __init__(self):
+        self.count_in = 0
+        self.count_out = 0
+        self.cumulative = 0.0
+        self.downstream = 0.0
+        self.max_latency = 0.0
+
+
+class _profiled(object):
+    """ Worker, which initialized coroutines are wrapped by probes """
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.stats = _stats()
+
+    def __call__(self, *args, **kw):
+        args = [_probe_out(n, self.stats) for n in args]
+        kw = dict((k, _probe_out(n, self.stats)) for k, n in kw.items())
+        return _probe_in(self.worker(*args, **kw), self.stats)
+
+    def __repr__(self):
+        return repr(self.worker)
+
+
+class _probe_in(object):
+    """ Measures time spent by coroutine to process items """
+
+    def __init__(self, coroutine, stats):
+        self.coroutine = coroutine
+        self.stats = stats
+
+    def send(self, item):
+        stats = self.stats
+        stats.count_in += 1
+        start = timer()
+        self.coroutine.send(item)
+        spent = timer() - start
+        stats.cumulative += spent
+        if spent > stats.max_latency:
+            stats.max_latency = spent
+
+    def send_many(self, items):
+        stats = self.stats
+        stats.count_in += len(items)
+        start = timer()
+        send_many(self.coroutine, items)
+        spent = timer() - start
+        stats.cumulative += spent
+        if spent > stats.max_latency:
+            stats.max_latency = spent
+
+    def close(self):
+        self.coroutine.close()
+
+
+class _probe_out(object):
+    """ Measures time spent by downstream of coroutine """
+
+    def __init__(self, next, stats):
+        self.next = next
+        self.stats = stats
+
+    def send(self, item):
+        stats = self.stats
+        stats.count_out += 1
+        start = timer()
+        self.next.send(item)
+        stats.downstream += timer() - start
+
+    def send_many(self, items):
+        stats = self.stats
+        stats.count_out += len(items)
+        start = timer()
+        send_many(self.next, items)
+        stats.downstream += timer() - start
+
+    def close(self):
+        self.next.close()
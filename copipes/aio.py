@@ -0,0 +1,245 @@
+"""
+Asynchronous counterparts of coroutine pipelines based on ``asyncio``.
+
+Workers are asynchronous generators, so they can await I/O between items.
+Each pipeline processes items one by one, but any number of pipelines can
+run concurrently on a single event loop.  The module requires Python 3.6+.
+
+Asynchronous workers can't be mixed with plain ones within a pipeline.
+
+"""
+
+from copipes import coroutine, pipeline, _null, _fork
+
+
+__all__ = ['async_coroutine', 'async_pipeline', 'null']
+
+
+class _async_null(_null):
+    """
+    A fake asynchronous coroutine, which does nothing.  It's a counterpart
+    of :data:`copipes.null`, which methods can be awaited.
+
+    ..  code-block:: pycon
+
+        >>> import asyncio
+        >>> asyncio.run(null.send(1))      # No exception is raised
+        >>> bool(null)
+        False
+
+    """
+
+    async def __call__(self, *args, **kw):
+        """ Mimics to coroutine initialization """
+        return self
+
+    async def send(self, *args, **kw):
+        """ Mimics to coroutine processing """
+        pass
+
+    async def send_many(self, items):
+        """ Mimics to batched coroutine processing """
+        pass
+
+    async def close(self):
+        """ Mimics to coroutine termination """
+        pass
+
+
+null = _async_null()
+
+
+class async_coroutine(coroutine):
+    """
+    Decorator turns asynchronous generator function to coroutine.
+    Initialization of the coroutine should be awaited, as well as ``send``
+    and ``close`` methods of the initialized one.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> import asyncio
+
+        >>> @async_coroutine
+        ... async def increment(next=null):
+        ...     while True:
+        ...         item = yield
+        ...         await asyncio.sleep(0)      # Await I/O here
+        ...         await next.send(item + 1)
+
+        >>> @async_coroutine
+        ... async def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         await next.send(item)
+
+        >>> async def main(target):
+        ...     inc = await increment(await collect(target))
+        ...     for item in [1, 2, 3]:
+        ...         await inc.send(item)
+        ...     await inc.close()
+
+        >>> target = []
+        >>> asyncio.run(main(target))
+        >>> target
+        [2, 3, 4]
+
+    """
+
+    async def __call__(self, *args, **kw):
+        """ Returns initialized coroutine """
+        pargs = self.args + args
+        kwargs = self.kw.copy()
+        kwargs.update(kw)
+        c = self.func(*pargs, **kwargs)
+        await c.__anext__()
+        return _async_generator(c)
+
+
+class _async_generator(object):
+    """
+    Initialized asynchronous coroutine.  You don't need to deal with it
+    directly, use :class:`async_coroutine` decorator.
+
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.send = generator.asend
+        self.close = generator.aclose
+
+
+def _unsupported(name):
+    # Returns method of plain pipeline, which is not supported by
+    # asynchronous one
+    def method(self, *args, **kw):
+        raise TypeError('Asynchronous pipeline does not support '
+                        '{0}()'.format(name))
+    method.__name__ = name
+    return method
+
+
+class async_pipeline(pipeline):
+    """
+    Asynchronous coroutine pipeline.  It provides the same interface as
+    :class:`copipes.pipeline`, but initialization of the pipeline and
+    :meth:`feed` should be awaited.  Source of :meth:`feed` may be either
+    asynchronous or plain iterable.  Compilation, profiling, freezing,
+    iteration, sessions and checkpoints are not supported and raise
+    ``TypeError``.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> import asyncio
+
+        >>> @async_coroutine
+        ... async def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         await next.send(item)
+
+        >>> @async_coroutine
+        ... async def split(even=null, odd=null):
+        ...     while True:
+        ...         item = yield
+        ...         await (odd if item % 2 else even).send(item)
+
+        >>> async def numbers(count):
+        ...     for i in range(count):
+        ...         await asyncio.sleep(0)
+        ...         yield i
+
+        >>> evens = []
+        >>> odds = []
+        >>> p = async_pipeline()
+        >>> with p.fork(split, 'even', 'odd') as (even, odd):
+        ...     even.connect(collect.params(evens))
+        ...     odd.connect(collect.params(odds))
+        ...     odd.plug()
+
+        >>> asyncio.run(p.feed(numbers(5)))
+        >>> evens
+        [0, 2, 4]
+        >>> odds
+        [1, 3]
+
+    Many pipelines can be fed concurrently:
+
+    ..  code-block:: pycon
+
+        >>> results = [[] for i in range(3)]
+        >>> async def main():
+        ...     await asyncio.gather(*[
+        ...         async_pipeline(collect.params(result)).feed(numbers(3))
+        ...         for result in results
+        ...     ])
+        >>> asyncio.run(main())
+        >>> results
+        [[0, 1, 2], [0, 1, 2], [0, 1, 2]]
+
+    """
+
+    async def __call__(self, next=null):
+        """ Returns initialized coroutine pipeline """
+        for worker in reversed(self.pipe):
+            next = await worker(next=next)
+        return next
+
+    def plug(self):
+        """ Plug pipeline, i.e. connect asynchronous ``null`` to pipeline """
+        self.pipe.append(null)
+
+    @property
+    def plugged(self):
+        """ True if pipeline is plugged, i.e. items never leave it """
+        return null in self.pipe
+
+    compile = _unsupported('compile')
+    profile = _unsupported('profile')
+    freeze = _unsupported('freeze')
+    iter = _unsupported('iter')
+    session = _unsupported('session')
+    pool = _unsupported('pool')
+    get_state = _unsupported('get_state')
+    set_state = _unsupported('set_state')
+
+    def forked(self, worker, *pipes, **named_pipes):
+        """ Returns forked coroutine for :meth:`fork` """
+        return _async_fork(worker, *pipes, **named_pipes)
+
+    async def feed(self, source):
+        """
+        Feed pipeline using items from ``source``.
+
+        The method initializes pipeline, feeds it, then closes it.
+
+        """
+        p = await self()
+        if hasattr(source, '__aiter__'):
+            async for item in source:
+                await p.send(item)
+        else:
+            for item in source:
+                await p.send(item)
+        await p.close()
+
+
+class _async_fork(_fork):
+    """
+    Forked asynchronous coroutine pipeline.  You don't need to deal with it
+    directly, use :meth:`async_pipeline.fork` method.
+
+    """
+
+    async def __call__(self, next):
+        """ Returns initialized forked pipeline """
+        pipes = [await pipe(next) for pipe in self.pipes]
+        named_pipes = {}
+        for name, pipe in self.named_pipes.items():
+            named_pipes[name] = await pipe(next)
+        return await self.worker(*pipes, **named_pipes)
@@ -0,0 +1,157 @@
+"""
+Checkpoints of pipeline fed by :meth:`copipes.pipeline.feed`.
+
+"""
+
+import os
+import struct
+from zlib import crc32
+
+try:
+    import cPickle as pickle
+except ImportError:     # Python 3.x
+    import pickle
+
+
+__all__ = ['checkpoint']
+
+
+_header = struct.Struct('<II')
+
+
+class checkpoint(object):
+    """
+    Log of snapshots at ``path``, which are taken each ``interval`` items.
+    Pass it to :meth:`copipes.pipeline.feed` as ``checkpoint`` to save
+    snapshots, and as ``resume_from`` to restart feed from the last one.
+
+    Snapshots are appended to the log incrementally, i.e. each one contains
+    only states of workers changed since the previous snapshot.  Each
+    ``compact`` snapshots the log is rewritten to hold the full state only.
+    States are serialized using ``codec``, which is any object with ``dumps``
+    and ``loads`` functions, like :mod:`pickle` used by default.  Records are
+    protected by checksum, so partially written record of crashed process is
+    ignored on load.  If ``fsync`` is true, the log is synced to disk after
+    each snapshot.
+
+    The log is rewritten by the first snapshot, unless it has been loaded
+    before.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+
+        >>> log = checkpoint(path, interval=100)
+        >>> log.save(100, [{0: 'a'}, None])
+        >>> log.save(200, [{0: 'a'}, {0: 'b'}])
+        >>> checkpoint(path).load()
+        (200, [{0: 'a'}, {0: 'b'}])
+
+        >>> with open(path, 'ab') as f:               # Crash on writing
+        ...     _ = f.write(b'garbage')
+        >>> checkpoint(path).load()
+        (200, [{0: 'a'}, {0: 'b'}])
+
+    """
+
+    def __init__(self, path, interval=10000, compact=100, codec=pickle,
+                 fsync=False):
+        self.path = path
+        self.interval = interval
+        self.compact = compact
+        self.codec = codec
+        self.fsync = fsync
+        self.file = None
+        self.digests = None
+        self.records = 0
+
+    def __repr__(self):
+        return 'checkpoint({0!r}, interval={1!r})'.format(self.path,
+                                                          self.interval)
+
+    def save(self, position, state):
+        """ Appends snapshot of ``state`` at ``position`` to the log """
+        dumps = self.codec.dumps
+        states = [dumps(value) for value in state]
+        digests = [crc32(data) for data in states]
+        if self.file is None or self.records >= self.compact or \
+           len(digests) != len(self.digests):
+            self.rewrite(position, states)
+        else:
+            changed = dict((i, data) for i, data in enumerate(states)
+                           if digests[i] != self.digests[i])
+            self.write(self.file, position, len(states), changed)
+            self.records += 1
+            self.sync(self.file)
+        self.digests = digests
+
+    def load(self):
+        """
+        Returns the last snapshot as ``(position, state)`` pair or ``None``,
+        if there are no snapshots.
+
+        """
+        if not os.path.exists(self.path):
+            return None
+        position = None
+        states = []
+        records = 0
+        end = 0
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + _header.size <= len(data):
+            length, checksum = _header.unpack_from(data, offset)
+            record = data[offset + _header.size:
+                          offset + _header.size + length]
+            if len(record) < length or crc32(record) & 0xFFFFFFFF != checksum:
+                break
+            offset += _header.size + length
+            position, count, changed = pickle.loads(record)
+            states = states[:count] + [None] * (count - len(states))
+            for i, value in changed.items():
+                states[i] = value
+            records += 1
+            end = offset
+        # Continue the log, dropping a partially written record
+        self.close()
+        self.file = open(self.path, 'r+b')
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.records = records
+        self.digests = [crc32(value) for value in states]
+        if position is None:
+            return None
+        loads = self.codec.loads
+        return position, [loads(value) for value in states]
+
+    def rewrite(self, position, states):
+        # Replaces the log by single snapshot of full state
+        self.close()
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            self.write(f, position, len(states), dict(enumerate(states)))
+            self.sync(f)
+        os.rename(temp, self.path)
+        self.file = open(self.path, 'ab')
+        self.records = 1
+
+    def write(self, f, position, count, changed):
+        record = pickle.dumps((position, count, changed),
+                              pickle.HIGHEST_PROTOCOL)
+        f.write(_header.pack(len(record), crc32(record) & 0xFFFFFFFF))
+        f.write(record)
+
+    def sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def close(self):
+        """ Closes the log """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
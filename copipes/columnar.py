@@ -0,0 +1,390 @@
+"""
+Columnar execution mode based on NumPy.
+
+Vectorized workers receive batches instead of single items.  Batch is
+either a NumPy array or a dict of equal-length arrays, which represents
+records with named fields.  Vectorized workers are connected into
+:class:`columnar_pipeline`, which inserts adapters between them and plain
+workers: items sent by plain workers are gathered into batches of
+``batch_size``, and batches sent by vectorized workers are split into items
+(scalars or dicts) for plain ones.  Adapter, which gathers items, flushes the
+rest of them on ``close()``, so plain workers preceding vectorized ones
+should pass ``close()`` through.
+
+The module requires NumPy.
+
+"""
+
+import numpy
+
+from copipes import batched, _batched, pipeline, null, send_many, _fork, \
+                    _stateful
+
+
+__all__ = ['vectorized', 'columnar_pipeline', 'map', 'filter', 'split',
+           'aggregate', 'to_batch', 'to_items']
+
+
+class vectorized(batched):
+    """
+    Decorator turns callable to vectorized coroutine, which receives batches.
+    Use :func:`copipes.send_many` to pass a batch to the next worker.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @vectorized
+        ... def scale(factor, next=null):
+        ...     while True:
+        ...         batch = yield
+        ...         send_many(next, batch * factor)
+
+        >>> @vectorized
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         batch = yield
+        ...         target.extend(batch.tolist())
+        ...         send_many(next, batch)
+
+        >>> result = []
+        >>> p = columnar_pipeline(scale.params(10), collect.params(result))
+        >>> p.feed(range(5), batch_size=2)
+        >>> result
+        [0, 10, 20, 30, 40]
+
+    """
+
+    def __call__(self, *args, **kw):
+        """ Returns initialized vectorized coroutine """
+        c = super(batched, self).__call__(*args, **kw)
+        return _vectorized(c)
+
+
+class _vectorized(_batched):
+    """
+    Initialized vectorized coroutine.  You don't need to deal with it
+    directly, use :class:`vectorized` decorator.
+
+    """
+
+    columnar = True
+
+    def send(self, item):
+        self.generator.send(to_batch([item]))
+
+
+def to_batch(items):
+    """
+    Returns batch of ``items``.  If items are dicts, the batch is a dict of
+    arrays, otherwise it's an array.
+
+    ..  code-block:: pycon
+
+        >>> to_batch([1, 2, 3])
+        array([1, 2, 3])
+        >>> batch = to_batch([{'x': 1, 'y': 2.0}, {'x': 3, 'y': 4.0}])
+        >>> sorted(batch.items())
+        [('x', array([1, 3])), ('y', array([2., 4.]))]
+
+    """
+    if items and isinstance(items[0], dict):
+        return dict((key, numpy.asarray([item[key] for item in items]))
+                    for key in items[0])
+    return numpy.asarray(items)
+
+
+def to_items(batch):
+    """
+    Returns list of items of ``batch``, i.e. Python scalars or dicts.
+
+    ..  code-block:: pycon
+
+        >>> to_items(numpy.arange(3))
+        [0, 1, 2]
+        >>> to_items({'x': numpy.arange(2)})
+        [{'x': 0}, {'x': 1}]
+
+    """
+    if isinstance(batch, dict):
+        keys = list(batch)
+        columns = [batch[key].tolist() for key in keys]
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+    return batch.tolist()
+
+
+def _length(batch):
+    if isinstance(batch, dict):
+        for column in batch.values():
+            return len(column)
+        return 0
+    return len(batch)
+
+
+def _take(batch, selector):
+    if isinstance(batch, dict):
+        return dict((key, column[selector]) for key, column in batch.items())
+    return batch[selector]
+
+
+class _batching(object):
+    """ Adapter, which gathers items into batches for vectorized worker """
+
+    columnar = True
+
+    def __init__(self, next, batch_size):
+        self.next = next
+        self.batch_size = batch_size
+        self.items = []
+
+    def send(self, item):
+        items = self.items
+        items.append(item)
+        if len(items) >= self.batch_size:
+            self.next.send_many(to_batch(items))
+            self.items = []
+
+    def send_many(self, batch):
+        self.flush()
+        if isinstance(batch, list):
+            # Chunk of items, e.g. passed by ``pipeline.feed``
+            batch = to_batch(batch)
+        self.next.send_many(batch)
+
+    def flush(self):
+        if self.items:
+            self.next.send_many(to_batch(self.items))
+            self.items = []
+
+    def close(self):
+        self.flush()
+        self.next.close()
+
+
+class _unbatching(object):
+    """ Adapter, which splits batches into items for plain worker """
+
+    def __init__(self, next):
+        self.next = next
+        self.send = next.send
+        self.close = next.close
+
+    def send_many(self, batch):
+        send = self.next.send
+        for item in to_items(batch):
+            send(item)
+
+
+def _adapt(next, columnar, batch_size):
+    # Returns ``next`` adapted to worker, which sends batches if ``columnar``
+    # is true, and items otherwise
+    if not next:
+        return next
+    if getattr(next, 'columnar', False):
+        return next if columnar else _batching(next, batch_size)
+    return _unbatching(next) if columnar else next
+
+
+class columnar_pipeline(pipeline):
+    """
+    Pipeline, which connects vectorized and plain workers.  Plain items and
+    batches can be sent to the pipeline, as well as fed by :meth:`feed`.  The
+    ``batch_size`` is a size of batches made of items sent by plain workers.
+
+    ..  code-block:: pycon
+
+        >>> from copipes import coroutine
+
+        >>> @coroutine
+        ... def increment(next=null):
+        ...     try:
+        ...         while True:
+        ...             item = yield
+        ...             next.send(item + 1)
+        ...     except GeneratorExit:
+        ...         next.close()
+
+        >>> result = []
+        >>> p = columnar_pipeline(
+        ...     increment,
+        ...     filter.params(lambda batch: batch % 2 == 0),
+        ...     increment,
+        ...     aggregate.params('sum'),
+        ...     increment,
+        ...     batch_size=3,
+        ... )
+        >>> p.connect(map.params(lambda batch: result.extend(batch.tolist())))
+        >>> p.feed(range(5))
+        >>> result
+        [9]
+
+    """
+
+    def __init__(self, *workers, **options):
+        self.batch_size = options.pop('batch_size', 1024)
+        if options:
+            raise TypeError('Unexpected options {0}'.format(
+                ', '.join(options)))
+        super(columnar_pipeline, self).__init__(*workers)
+
+    def __call__(self, next=null):
+        """ Returns initialized coroutine pipeline """
+        next = super(columnar_pipeline, self).__call__(next)
+        if isinstance(next, _vectorized):
+            # Gather items sent to the pipeline into batches
+            next = _batching(next, self.batch_size)
+        return next
+
+    def feed(self, source, batch_size=None):
+        """
+        Feed pipeline using items from ``source``.  Items are sent to the
+        pipeline by batches of ``batch_size``, which is the pipeline one by
+        default.
+
+        """
+        super(columnar_pipeline, self).feed(
+            source, batch_size=batch_size or self.batch_size)
+
+    def connect(self, *workers):
+        for worker in workers:
+            if isinstance(worker, (_fork, _columnar)) or worker is null:
+                self.pipe.append(worker)
+            else:
+                self.pipe.append(_columnar(worker, self))
+
+    def forked(self, worker, *pipes, **named_pipes):
+        """ Returns forked coroutine for :meth:`fork` """
+        for pipe in pipes + tuple(named_pipes.values()):
+            pipe.batch_size = self.batch_size
+        return _fork(_columnar(worker, self), *pipes, **named_pipes)
+
+
+class _columnar(object):
+    """ Worker, which initialization adapts next workers to it """
+
+    def __init__(self, worker, owner):
+        self.worker = worker
+        self.owner = owner
+        self.pure = getattr(worker, 'pure', False)
+
+    def __call__(self, *args, **kw):
+        columnar = isinstance(self.worker, vectorized)
+        size = self.owner.batch_size
+        args = [_adapt(n, columnar, size) for n in args]
+        kw = dict((k, _adapt(n, columnar, size)) for k, n in kw.items())
+        return self.worker(*args, **kw)
+
+    def stateful(self):
+        """ Iterates over stateful workers, see :meth:`pipeline.stateful` """
+        return _stateful(self.worker)
+
+    def __repr__(self):
+        return repr(self.worker)
+
+
+@vectorized
+def map(func, next=null):
+    """ Sends to the next worker result of ``func`` called with batch """
+    try:
+        while True:
+            batch = yield
+            send_many(next, func(batch))
+    except GeneratorExit:
+        next.close()
+
+
+@vectorized
+def filter(condition, next=null):
+    """
+    Sends to the next worker rows of batch, which ``condition`` is true for.
+    The ``condition`` is called with batch and returns boolean array.
+
+    """
+    try:
+        while True:
+            batch = yield
+            batch = _take(batch, condition(batch))
+            if _length(batch):
+                send_many(next, batch)
+    except GeneratorExit:
+        next.close()
+
+
+@vectorized
+def split(selector, **channels):
+    """
+    Splits batch into channels.  The ``selector`` is called with batch and
+    returns array of channel names.  Unknown name raises ``KeyError`` like in
+    plain ``split`` worker.
+
+    ..  code-block:: pycon
+
+        >>> evens = []
+        >>> odds = []
+        >>> p = columnar_pipeline()
+        >>> selector = lambda batch: numpy.where(batch % 2, 'odd', 'even')
+        >>> with p.fork(split.params(selector), 'even', 'odd') as (even, odd):
+        ...     even.connect(map.params(lambda b: evens.extend(b.tolist())))
+        ...     odd.connect(map.params(lambda b: odds.extend(b.tolist())))
+        >>> p.feed(range(6))
+        >>> evens, odds
+        ([0, 2, 4], [1, 3, 5])
+
+    """
+    names = list(channels)
+    try:
+        while True:
+            batch = yield
+            keys = selector(batch)
+            unknown = ~numpy.isin(keys, names)
+            if unknown.any():
+                raise KeyError(keys[unknown][0])
+            for name in names:
+                selected = _take(batch, keys == name)
+                if _length(selected):
+                    send_many(channels[name], selected)
+    except GeneratorExit:
+        for channel in channels.values():
+            channel.close()
+
+
+@vectorized
+def aggregate(operation, column=None, next=null):
+    """
+    Reduces all the batches to single value, which is sent to the next
+    worker on close.  The ``operation`` is one of ``'sum'``, ``'count'``,
+    ``'min'``, ``'max'`` and ``'mean'``.  If batches are dicts, the ``column``
+    is reduced.
+
+    """
+    if operation not in ('sum', 'count', 'min', 'max', 'mean'):
+        raise ValueError('Unknown operation {0!r}'.format(operation))
+    total = None
+    count = 0
+    try:
+        while True:
+            batch = yield
+            length = _length(batch)
+            if not length:
+                continue
+            if column is not None:
+                batch = batch[column]
+            count += length
+            if operation in ('sum', 'mean'):
+                value = batch.sum()
+                total = value if total is None else total + value
+            elif operation == 'min':
+                value = batch.min()
+                total = value if total is None else numpy.minimum(total, value)
+            elif operation == 'max':
+                value = batch.max()
+                total = value if total is None else numpy.maximum(total, value)
+    except GeneratorExit:
+        if operation == 'count':
+            next.send(count)
+        elif operation == 'mean':
+            if count:
+                next.send(total / float(count))
+        elif total is not None:
+            next.send(total)
+        next.close()
@@ -0,0 +1,250 @@
+"""
+Worker, which removes duplicate items from stream using bounded memory.
+
+The :func:`unique` worker delegates bookkeeping of seen items to a backend.
+Backend is an object with ``add(key)`` method, which returns true if the key
+has not been seen before, and ``evictions`` attribute, which counts keys
+forgotten to keep memory bounded.  Forgotten keys pass through the worker
+again.  Backend keeps its state across initializations of the worker, so the
+same instance can be inspected after :meth:`copipes.pipeline.feed`.  Backends
+also provide ``get_state`` and ``set_state`` methods, so the state is saved
+by :class:`copipes.checkpoint.checkpoint`.
+
+"""
+
+from array import array
+from collections import OrderedDict
+from math import ceil, log
+from time import time
+
+from copipes import coroutine, null
+
+
+__all__ = ['unique', 'lru', 'ttl', 'bloom']
+
+
+# Default limit of keys kept by :class:`ttl` backend
+MAXSIZE = 1000000
+
+
+@coroutine
+def unique(seen, key=None, next=null):
+    """
+    Sends to the next worker items, which are not ``seen`` yet.  If ``key``
+    function is passed, items are compared by results of the function.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> seen = lru(2)
+        >>> p = pipeline(unique.params(seen), collect.params(result))
+        >>> p.feed([1, 2, 1, 3, 1, 2, 3])
+        >>> result
+        [1, 2, 3, 2, 3]
+        >>> seen.evictions
+        3
+
+        >>> p
+        unique.params(lru(2))
+        collect.params([1, 2, 3, 2, 3])
+
+    """
+    add = seen.add
+    try:
+        while True:
+            item = yield
+            if add(item if key is None else key(item)):
+                next.send(item)
+    except GeneratorExit:
+        next.close()
+
+
+class lru(object):
+    """
+    Exact backend, which keeps ``maxsize`` recently seen keys.  Seeing the key
+    again makes it recent.
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.keys = OrderedDict()
+        self.evictions = 0
+
+    def __repr__(self):
+        return 'lru({0!r})'.format(self.maxsize)
+
+    def get_state(self):
+        return list(self.keys), self.evictions
+
+    def set_state(self, state):
+        keys, self.evictions = state
+        self.keys = OrderedDict.fromkeys(keys)
+
+    def add(self, key):
+        keys = self.keys
+        if key in keys:
+            keys[key] = keys.pop(key)
+            return False
+        keys[key] = None
+        if len(keys) > self.maxsize:
+            keys.popitem(last=False)
+            self.evictions += 1
+        return True
+
+
+class ttl(object):
+    """
+    Exact backend, which forgets keys in ``seconds`` since they have been seen
+    first time.  At most ``maxsize`` keys are kept, so memory stays bounded
+    even when many keys come within the ``seconds``.  If the limit is
+    exceeded the oldest keys are forgotten before they are expired.  Expired
+    keys are counted by ``expirations`` attribute, and included into
+    ``evictions``.
+
+    The ``clock`` is a function returning current time in seconds.  Pass
+    a function returning event time of the last item to use it instead of
+    wall-clock time.
+
+    """
+
+    def __init__(self, seconds, maxsize=MAXSIZE, clock=time):
+        self.seconds = seconds
+        self.maxsize = maxsize
+        self.clock = clock
+        self.keys = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __repr__(self):
+        params = [repr(self.seconds)]
+        if self.maxsize != MAXSIZE:
+            params.append('maxsize={0!r}'.format(self.maxsize))
+        return 'ttl({0})'.format(', '.join(params))
+
+    def get_state(self):
+        return list(self.keys.items()), self.evictions, self.expirations
+
+    def set_state(self, state):
+        keys, self.evictions, self.expirations = state
+        self.keys = OrderedDict(keys)
+
+    def add(self, key):
+        keys = self.keys
+        now = self.clock()
+        expired = now - self.seconds
+        while keys:
+            if keys[next(iter(keys))] > expired:
+                break
+            keys.popitem(last=False)
+            self.evictions += 1
+            self.expirations += 1
+        if key in keys:
+            return False
+        keys[key] = now
+        if len(keys) > self.maxsize:
+            keys.popitem(last=False)
+            self.evictions += 1
+        return True
+
+
+class bloom(object):
+    """
+    Probabilistic backend based on Bloom filter, which uses fixed memory
+    determined by ``capacity`` and ``error_rate``.  A new key is mistaken for
+    seen one with probability at most ``error_rate``, seen keys are never
+    mistaken for new ones until they are forgotten.
+
+    To keep the error rate bounded, the backend holds two filters.  New keys
+    are added to the current one, keys are looked up in both.  When the
+    current filter gets ``capacity`` keys, the previous one is discarded and
+    the keys it holds are counted by ``evictions``.  Each filter is sized for
+    half of ``error_rate``, so a key looked up in both of them is mistaken
+    with probability at most ``error_rate``.
+
+    Keys are hashed by built-in hash, which is salted per process for strings,
+    unless ``PYTHONHASHSEED`` is set.  So state of the backend restored in
+    other process is valid only if the seed is fixed.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> seen = bloom(100, error_rate=0.01)
+        >>> seen.add('a'), seen.add('b'), seen.add('a')
+        (True, True, False)
+        >>> seen.bits, seen.hashes
+        (1103, 8)
+
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        rate = error_rate / 2.0
+        self.bits = int(ceil(-capacity * log(rate) / log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(capacity) * log(2))))
+        self.current = self.filter()
+        self.previous = None
+        self.count = 0
+        self.previous_count = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return 'bloom({0!r}, error_rate={1!r})'.format(self.capacity,
+                                                        self.error_rate)
+
+    def filter(self):
+        return array('B', [0]) * ((self.bits + 7) // 8)
+
+    def get_state(self):
+        previous = self.previous
+        return (self.current[:], None if previous is None else previous[:],
+                self.count, self.previous_count, self.evictions)
+
+    def set_state(self, state):
+        current, previous, self.count, self.previous_count, \
+            self.evictions = state
+        self.current = current[:]
+        self.previous = None if previous is None else previous[:]
+
+    def positions(self, key):
+        h1 = hash(key)
+        h2 = hash((key, 0x5bd1e995)) | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def contains(self, filter, positions):
+        for p in positions:
+            if not filter[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        positions = self.positions(key)
+        current = self.current
+        if self.contains(current, positions):
+            return False
+        if self.previous is not None and \
+           self.contains(self.previous, positions):
+            return False
+        if self.count >= self.capacity:
+            self.evictions += self.previous_count
+            self.previous = current
+            self.previous_count = self.count
+            self.current = current = self.filter()
+            self.count = 0
+        for p in positions:
+            current[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        return True
@@ -8,7 +8,6 @@ Last file should not contain duplicate records.
 
 """
 
-from collections import namedtuple
 from io import StringIO
 from os.path import dirname, realpath
 from sys import path, version_info
@@ -16,6 +15,7 @@ from sys import path, version_info
 path.append(dirname(dirname(realpath(__file__))))
 
 from copipes import coroutine, pipeline, null
+from copipes import records
 
 
 if version_info[0] == 2:
@@ -53,17 +53,9 @@ log = StringIO(u("""
 """))
 
 
-@coroutine
-def parse(next=null):
-    LogRecord = namedtuple('LogRecord', ['level', 'module', 'message'])
-    while True:
-        line = yield
-        line = line.strip()
-        if not line:
-            # Skip blank line
-            continue
-        level, module, message = line.split(None, 2)
-        next.send(LogRecord(level, module, message))
+LogRecord = records.record('LogRecord', ['level', 'module', 'message'])
+
+parse = records.parse.params(LogRecord)
 
 
 @coroutine
@@ -1,32 +1,42 @@
-from macropy.core.macros import *
-from copipes import coroutine, null
+from copipes import coroutine, batched, null, send_many
 
+import ast
 import copy
 import functools
+import hashlib
 import inspect
+import marshal
+import os
+import sys
 import textwrap
 
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:     # Python 2.x
+    from imp import get_magic
+    MAGIC_NUMBER = get_magic()
+
 __all__ = ['pipe']
 
 def debug_print_ast(tree, **kws):
     """Print the AST"""
-    @Walker
-    def print_node(tree, **kws):
-        print real_repr(tree)
-        return tree
-    print_node.recurse(tree)
+    print(ast.dump(tree))
     return tree
 
 def debug_print_src(tree, **kws):
-    """Print the python code for the AST"""
-    print unparse(tree).strip()
+    """Print the python code for the AST (Python 3.9+)"""
+    print(ast.unparse(tree).strip())
     return tree
 
 
+def arg_name(arg):
+    """Name of the argument, which is `ast.arg` or `ast.Name` on Python 2"""
+    return getattr(arg, 'arg', None) or getattr(arg, 'id', None)
+
 def arguments_has_ident(args, ident):
     """Check of the `ast.arguments` has an identifier"""
-    for a in args.args:
-        if a.id == ident:
+    for a in args.args + getattr(args, 'kwonlyargs', []):
+        if arg_name(a) == ident:
             return True
     return False
 
@@ -39,55 +49,147 @@ def rewrite__specify_next_coroutine(args, next='next'):
     """
     if not arguments_has_ident(args, next):
         # add `next=null` to the arguments
-        args.args.append(Name(next, Param()))
-        args.defaults.append(Name('null', Load()))
+        if hasattr(ast, 'arg'):
+            args.args.append(ast.arg(arg=next, annotation=None))
+        else:
+            args.args.append(ast.Name(next, ast.Param()))
+        args.defaults.append(ast.Name('null', ast.Load()))
 
 
+class SendExpander(ast.NodeTransformer):
+    """Replace each `send(...)` with `<next_ident>.send(...)`"""
+
+    def __init__(self, next_ident):
+        self.next_ident = next_ident
+
+    def visit_Call(self, tree):
+        self.generic_visit(tree)
+        if type(tree.func) is ast.Name and tree.func.id == 'send':
+            tree.func = ast.copy_location(
+                ast.Attribute(ast.Name(self.next_ident, ast.Load()),
+                              'send', ast.Load()),
+                tree.func)
+        return tree
+
 def rewrite__expand_send(next_ident, tree):
     """Replace each `send(...)` with `<next_ident>.send(...)"""
-    @Walker
-    def rewrite(tree, **kws):
-        if     type(tree)      is Call and \
-               type(tree.func) is Name and \
-               tree.func.id    == 'send':
-
-            new_tree = Call(Attribute(Name(next_ident, Load()),
-                                     'send', Load()),
-                            tree.args, tree.keywords, tree.starargs, tree.kwargs)
-            return new_tree
-        else:
-            return tree
+    expander = SendExpander(next_ident)
+    return [expander.visit(stmt) for stmt in tree]
+
+
+class SendCollector(ast.NodeTransformer):
+    """Replace each `send(...)` with `<batch_ident>.append(...)`"""
+
+    def __init__(self, batch_ident):
+        self.batch_ident = batch_ident
+
+    def visit_Call(self, tree):
+        self.generic_visit(tree)
+        if type(tree.func) is ast.Name and tree.func.id == 'send':
+            tree.func = ast.copy_location(
+                ast.Attribute(ast.Name(self.batch_ident, ast.Load()),
+                              'append', ast.Load()),
+                tree.func)
+        return tree
+
 
-    return rewrite.recurse(tree)
+class BatchFlusher(ast.NodeTransformer):
+    """
+    Insert `flush` statements before each `return`, so the collected batch
+    is not lost
+    """
+
+    def __init__(self, flush):
+        self.flush = flush
+
+    def visit_Return(self, tree):
+        return [ast.copy_location(copy.deepcopy(self.flush), tree), tree]
+
+    def visit_FunctionDef(self, tree):
+        return tree
+    visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = visit_FunctionDef
+
+def rewrite__collect_send(batch_ident, next_ident, tree):
+    """
+    Replace each `send(...)` with `<batch_ident>.append(...)`, and return
+    the statements followed by the flush of the batch to `next_ident`
+    """
+    flush = ast.parse('if %s:\n    send_many(%s, %s)'
+                      % (batch_ident, next_ident, batch_ident)).body[0]
+    collector = SendCollector(batch_ident)
+    flusher = BatchFlusher(flush)
+    tree = [collector.visit(stmt) for stmt in tree]
+    new_tree = []
+    for stmt in tree:
+        stmt = flusher.visit(stmt)
+        new_tree.extend(stmt if isinstance(stmt, list) else [stmt])
+    last = new_tree[-1] if new_tree else None
+    if not isinstance(last, ast.Return):
+        new_tree.append(ast.copy_location(flush, last) if last else flush)
+    return new_tree
 
 
 def rewrite__create_while_loop(body):
     """Create the `While True: ...` loop"""
-    test   = Name('True', Load())
+    test   = ast.parse('True', mode='eval').body    # Name or Constant
     orElse = []
-    return While(test, body, orElse)
+    loop = ast.While(test, body, orElse)
+    return ast.copy_location(loop, body[0]) if body else loop
 
 def rewrite__create_recvs(idents):
     def recv(name):
-        return Assign([Name(name, Store())], Yield(None))
-    return [recv(n.id) for n in idents]
+        assign = ast.Assign([ast.Name(name.id, ast.Store())], ast.Yield(None))
+        return ast.copy_location(assign, name)
+    return [recv(n) for n in idents]
 
 def rewrite_args(args, next='next'):
     new_args = copy.deepcopy(args)
     rewrite__specify_next_coroutine(new_args, next=next)
     return new_args
 
-def rewrite_body(body, next='next'):
+def is_input_declaration(stmt):
+    """Check if the statement is the list of input parameters, e.g. `[x, y]`"""
+    return type(stmt) is ast.Expr and type(stmt.value) is ast.List
+
+def is_batch_declaration(stmt):
+    """Check if the statement declares batch input, e.g. `[*xs]`"""
+    if not is_input_declaration(stmt):
+        return False
+    elts = stmt.value.elts
+    starred = [e for e in elts if type(e) is getattr(ast, 'Starred', None)]
+    if starred and len(elts) > 1:
+        raise ValueError('Batch input declaration should be the only one, '
+                         'e.g. `[*xs]`')
+    return bool(starred)
+
+def has_batch_declaration(body):
+    """Check if the first input declaration of the body is the batch one"""
+    for stmt in body:
+        if is_input_declaration(stmt):
+            return is_batch_declaration(stmt)
+    return False
+
+def rewrite_body(body, next='next', batch='__batch'):
     new_body = copy.deepcopy(body)
     # get the first occurence of a List expression: these are the parameters sent to this coroutine
     for i, stmt in enumerate(new_body):
-        if type(stmt.value) is not List: continue
+        if not is_input_declaration(stmt): continue
         left = new_body[:i]
         right = new_body[i:]
-        idents   = right.pop(0).value.elts
-        recvs    = rewrite__create_recvs(idents)
-        new_body = left + recvs + right
-        new_body = rewrite__expand_send(next, new_body)
+        declaration = right.pop(0)
+        if is_batch_declaration(declaration):
+            # `[*xs]` receives batch, and sent items are collected to
+            # `batch` list, which is sent to the next coroutine as a whole
+            recvs = rewrite__create_recvs([declaration.value.elts[0].value])
+            init  = ast.parse('%s = []' % batch).body[0]
+            right = rewrite__collect_send(batch, next, right)
+            new_body = left + recvs + [ast.copy_location(init, declaration)]
+            new_body = rewrite__expand_send(next, new_body) + right
+        else:
+            idents   = declaration.value.elts
+            recvs    = rewrite__create_recvs(idents)
+            new_body = left + recvs + right
+            new_body = rewrite__expand_send(next, new_body)
         loop     = rewrite__create_while_loop(new_body)
         return [loop]
     msg = textwrap.dedent("""\
@@ -99,64 +201,147 @@ def rewrite_body(body, next='next'):
                    [x,y,z] # input parameters
                    # rest of the body
                """)
-    raise Exception(msg % unparse(body))
+    dump = getattr(ast, 'unparse', ast.dump)
+    raise Exception(msg % '\n'.join(dump(stmt) for stmt in body))
+
+def decorator_name(dec):
+    """Name of the decorator, e.g. `pipe` for `@pipe` and `@macros.pipe`"""
+    if type(dec) is ast.Name:
+        return dec.id
+    if type(dec) is ast.Attribute:
+        return dec.attr
+    return None
 
 def rewrite__function_decorators(decorator_list, to_remove=None):
     to_remove = to_remove or []
     decorators = []
     for dec in decorator_list:
-        if dec.id in to_remove: continue
+        if decorator_name(dec) in to_remove: continue
         decorators.append(dec)
     return decorators
 
 def rewrite_function(func, remove=None):
     next_ident = 'next'
-    new_args   = rewrite_args(func.args, next=next_ident)
-    new_body   = rewrite_body(func.body, next=next_ident)
-    new_decs   = rewrite__function_decorators(func.decorator_list, to_remove=remove)
-    new_func   = FunctionDef(name=func.name,
-                             args=new_args,
-                             body=new_body,
-                             decorator_list=new_decs,
-                            )
+    new_func   = copy.copy(func)
+    new_func.args = rewrite_args(func.args, next=next_ident)
+    new_func.body = rewrite_body(func.body, next=next_ident)
+    new_func.decorator_list = rewrite__function_decorators(func.decorator_list, to_remove=remove)
     return new_func
 
+# The cache key covers this module, so changes of rewriting invalidate the cache
+with open(os.path.splitext(__file__)[0] + '.py', 'rb') as f:
+    REWRITER_DIGEST = hashlib.sha1(f.read()).digest()
+
+def cache_key(src, firstlineno=1):
+    """
+    Key of cached code of the function defined by `src` at the line
+    `firstlineno`.  The key covers the source, its position, the rewriter
+    and the bytecode version, so stale code is never loaded.
+    """
+    if not isinstance(src, bytes):
+        src = src.encode('utf-8')
+    key = MAGIC_NUMBER + REWRITER_DIGEST + str(firstlineno).encode() + src
+    return hashlib.sha1(key).digest()
+
+def cache_path(loc, name):
+    """
+    Path of cached code of the function `name` defined in the file `loc`,
+    i.e. `__pycache__/module.name.pipe` next to the file.  The path doesn't
+    depend on the source, so the cached code of edited function is replaced.
+    """
+    module = os.path.splitext(os.path.basename(loc))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(loc)), '__pycache__',
+                        '%s.%s.pipe' % (module, name))
+
+def load_code(path, key):
+    """Load cached code object stored with `key`, return None on miss"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(key)) != key:
+                return None
+            return marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+def save_code(path, key, code):
+    """
+    Cache code object with `key` header, failures are ignored like the
+    import system does
+    """
+    if sys.dont_write_bytecode:
+        return
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'wb') as f:
+            f.write(key)
+            marshal.dump(code, f)
+        getattr(os, 'replace', os.rename)(temp, path)
+    except (IOError, OSError):
+        pass
+
 def rewrite(fn, remove_decorators=None):
+    """
+    Returns `(function, batch)` pair, where `function` is the rewritten
+    generator function, and `batch` is true, if it receives batches
+    """
     src = inspect.getsource(fn)
     src = textwrap.dedent(src)
     loc = inspect.getsourcefile(fn)
+    firstlineno = fn.__code__.co_firstlineno
+    path = cache_path(loc, fn.__name__)
+    key = cache_key(src, firstlineno)
+    code = load_code(path, key)
+    if code is None:
+        code = compile_rewritten(src, loc, remove_decorators, firstlineno)
+        save_code(path, key, code)
+
+    # The function is defined by factory in the module namespace, so it
+    # sees globals, and gets helpers from the factory closure
+    mylocals = {}
+    myglobals = fn.__globals__
+    exec(code, myglobals, mylocals)
+    return mylocals['__pipe__'](null, send_many)
+
+def compile_rewritten(src, loc, remove_decorators=None, firstlineno=1):
+    """
+    Rewrite the function definition `src` and compile it.  The code is
+    compiled from the rewritten tree directly, line numbers refer to `loc`
+    file, where the definition starts at `firstlineno`.
+    """
     tree = ast.parse(src)
+    stmts = tree.body
+    if len(stmts) != 1 or not isinstance(stmts[0], ast.FunctionDef):
+        raise ValueError('No handler for rewriting %s' % (ast.dump(tree),))
 
-    if type(tree) is Module:
-        stmts = tree.body
-        assert len(stmts) == 1
-        func = stmts[0]
-        new_tree = rewrite_function(func, remove=remove_decorators)
-    elif type(tree) is FunctionDef:
-        new_tree = rewrite_function(tree, remove=remove_decorators)
-    else:
-        raise ValueError, 'No handler for rewriting %s' % (type(tree),)
-
-    fix_missing_locations(new_tree)
-    new_src = unparse(new_tree).strip()
-
-    mylocals = dict(coroutine=coroutine, null=null)
-    myglobals = {}
-    exec new_src in myglobals, mylocals
-    new_func = mylocals[fn.__name__]
-    return new_func
+    # Source is dedented, so column offsets are off, but lines are exact
+    ast.increment_lineno(tree, firstlineno - 1)
+    func = stmts[0]
+    batch = has_batch_declaration(func.body)
+    factory = ast.parse('def __pipe__(null, send_many):\n'
+                        '    return %s, %r' % (func.name, batch)).body[0]
+    for node in ast.walk(factory):
+        ast.copy_location(node, func)
+    factory.body.insert(0, rewrite_function(func, remove=remove_decorators))
+    tree.body = [factory]
+    ast.fix_missing_locations(tree)
+    return compile(tree, loc, 'exec')
 
 
 def pipe(fn):
     """
     Rewrite the function definition to allow cleaner syntax for defining coroutines as `pipe`s.
+    The rewritten code is cached in `__pycache__` next to the source file, so the rewrite
+    is skipped on import of unchanged source.
 
     Eg:
     @coroutine
     def putStrLn(next=null):
         while True:
             v = yield
-            print v
+            print(v)
             next.send(v)
 
     becomes
@@ -164,10 +349,20 @@ def pipe(fn):
     @pipe
     def putStrLn():
         [x]
-        print x
+        print(x)
         send(x)
+
+    The batch input declaration `[*xs]` turns the function to batched coroutine,
+    see `copipes.batched`.  Items sent by `send(...)` are collected, and the batch
+    of them is sent to the next coroutine at the end of each iteration, e.g.
+
+    @pipe
+    def increment():
+        [*xs]
+        for x in xs:
+            send(x + 1)
     """
 
-    new_fn = rewrite(fn, remove_decorators=['pipe'])
+    new_fn, batch = rewrite(fn, remove_decorators=['pipe'])
     new_fn = functools.wraps(fn)(new_fn)
-    return coroutine(new_fn)
+    return batched(new_fn) if batch else coroutine(new_fn)
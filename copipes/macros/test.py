@@ -1,8 +1,13 @@
-from pipe import pipe
+from copipes.macros.pipe import pipe
 from copipes import coroutine, pipeline, null
 from nose import tools
 from textwrap import dedent
 
+import inspect
+import os
+import sys
+import copipes.macros.pipe as macro
+
 @pipe
 def collect(target):
     """Connects pipeline to queue"""
@@ -32,7 +37,46 @@ def split(even, odd):
 @pipe
 def replicate(n):
     [x]
-    for i in xrange(n):
+    for i in range(n):
+        send(x)
+
+def scale(x):
+    return x * 100
+
+@pipe
+def scaled():
+    [x]
+    send(scale(x))
+
+@pipe
+def fail():
+    [x]
+    raise ValueError(x)
+
+@pipe
+def add_many(v):
+    """Adds ``v`` to each item of batch"""
+    [*xs]
+    for x in xs:
+        send(x + v)
+
+@pipe
+def positive(batches):
+    [*xs]
+    batches.append(list(xs))
+    for x in xs:
+        if x is None:
+            break
+        if x > 0:
+            send(x)
+
+@pipe
+def until_zero():
+    [*xs]
+    for x in xs:
+        if x == 0:
+            send('zero')
+            return
         send(x)
 
 def null_test():
@@ -196,3 +240,140 @@ def pipeline_representation_test():
             add.params(2)
     add.params(2)
     """).strip())
+
+
+def cached_rewrite_test():
+    def increment():
+        [x]
+        send(x + 1)
+
+    path = macro.cache_path(inspect.getsourcefile(increment), 'increment')
+    if os.path.exists(path):
+        os.remove(path)
+    dont_write_bytecode = sys.dont_write_bytecode
+    compile_rewritten = macro.compile_rewritten
+    try:
+        sys.dont_write_bytecode = True
+        pipe(increment)
+        tools.ok_(not os.path.exists(path))
+        sys.dont_write_bytecode = False
+        pipe(increment)
+        tools.ok_(os.path.exists(path))
+
+        # Warm decoration loads cached code and doesn't rewrite the source
+        macro.compile_rewritten = None
+        cached = pipe(increment)
+    finally:
+        sys.dont_write_bytecode = dont_write_bytecode
+        macro.compile_rewritten = compile_rewritten
+        if os.path.exists(path):
+            os.remove(path)
+    result = []
+    pipeline(cached, collect.params(result)).feed([1, 2])
+    tools.eq_(result, [2, 3])
+
+
+def edited_rewrite_test():
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, 'stages.py')
+    template = 'from copipes.macros.pipe import pipe\n' \
+               '{0}\n' \
+               '@pipe\n' \
+               'def stage():\n' \
+               '    [x]\n' \
+               '    send(x + {1})\n'
+    dont_write_bytecode = sys.dont_write_bytecode
+    sys.dont_write_bytecode = False
+    sys.path.insert(0, directory)
+    try:
+        # Edited function replaces its cached code, also when it's moved.
+        # Sizes of the versions differ, so stale bytecode of the module and
+        # lines of its source are not used within the same second.
+        for prefix, value in (('', 1), ('', 20), ('# Moved\n', 20)):
+            with open(source, 'w') as f:
+                f.write(template.format(prefix, value))
+            sys.modules.pop('stages', None)
+            import stages
+            result = []
+            pipeline(stages.stage, collect.params(result)).feed([1])
+            tools.eq_(result, [1 + value])
+            tools.eq_(sorted(name for name in os.listdir(
+                os.path.join(directory, '__pycache__'))
+                if name.endswith('.pipe')), ['stages.stage.pipe'])
+    finally:
+        sys.dont_write_bytecode = dont_write_bytecode
+        sys.path.remove(directory)
+        sys.modules.pop('stages', None)
+        shutil.rmtree(directory)
+
+
+def module_globals_test():
+    result = []
+    pipeline(scaled, collect.params(result)).feed([1, 2])
+    tools.eq_(result, [100, 200])
+
+
+def line_numbers_test():
+    import traceback
+    try:
+        pipeline(fail).feed([1])
+    except ValueError:
+        filename, lineno, name, line = traceback.extract_tb(
+            sys.exc_info()[2])[-1]
+    tools.eq_(filename, inspect.getsourcefile(fail.func))
+    tools.eq_(name, 'fail')
+    tools.eq_(line.strip(), 'raise ValueError(x)')
+
+
+def missing_input_declaration_test():
+    def stage():
+        send(1)
+    tools.assert_raises(Exception, pipe, stage)
+
+
+def batch_input_test():
+    from copipes import send_many
+
+    batches = []
+    result = []
+    p = pipeline(
+        add_many.params(-2),
+        positive.params(batches),
+        collect.params(result),
+    )
+    tools.eq_(repr(p), os.linesep.join(['add_many.params(-2)',
+                                        'positive.params([])',
+                                        'collect.params([])']))
+    p.feed(range(6), batch_size=4)
+    tools.eq_(batches, [[-2, -1, 0, 1], [2, 3]])
+    tools.eq_(result, [1, 2, 3])
+    tools.eq_(add_many.__doc__, 'Adds ``v`` to each item of batch')
+
+    # Plain items are received as batches of one item, and the collected
+    # batch is flushed on ``break``
+    batches = []
+    result = []
+    p = pipeline(positive.params(batches), collect.params(result))()
+    p.send(1)
+    send_many(p, [2, None, 3])
+    p.close()
+    tools.eq_(batches, [[1], [2, None, 3]])
+    tools.eq_(result, [1, 2])
+
+
+def batch_input_return_test():
+    result = []
+    worker = pipeline(until_zero, collect.params(result))()
+    with tools.assert_raises(StopIteration):
+        worker.send_many([2, 1, 0, 3])
+    tools.eq_(result, [2, 1, 'zero'])
+
+
+def mixed_batch_input_test():
+    def stage():
+        [x, *xs]
+        send(x)
+    tools.assert_raises(ValueError, pipe, stage)
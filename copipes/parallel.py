@@ -0,0 +1,529 @@
+"""
+Workers, which run other workers concurrently.
+
+"""
+
+import multiprocessing
+from multiprocessing import cpu_count
+from threading import Event, Lock, Thread
+from time import sleep
+
+try:
+    from multiprocessing import get_context
+except ImportError:     # Python 2.x
+    get_context = None
+
+try:
+    from queue import Queue, Full, Empty
+except ImportError:     # Python 2.x
+    from Queue import Queue, Full, Empty
+
+from copipes import coroutine, null, send_many, _fork, _stateful
+
+
+__all__ = ['parallel', 'threaded', 'buffer', 'watermarks']
+
+
+class parallel(object):
+    """
+    Runs wrapped worker on a pool of ``processes``.  The wrapper can be
+    connected to pipeline like any other coroutine.
+
+    Incoming items are grouped into chunks of ``chunk_size`` and handed to the
+    pool.  Each process keeps its own initialized copy of the worker, so the
+    worker should not rely on state shared across items.  Items sent by the
+    worker are re-emitted to the next worker either in order of incoming
+    chunks (``ordered=True``) or as soon as the chunks are processed.  At most
+    ``max_pending`` chunks are in flight, when the limit is exceeded the
+    wrapper waits for results before accepting the next item.
+
+    Closing of the wrapper processes the rest of items, closes the worker
+    copy of each process, passes items sent by the copies on close to the
+    next worker, shuts down the pool, and closes the next worker.
+
+    The worker is pickled to be passed to the pool processes.  Coroutines
+    defined at module level are pickled by reference, so they work with any
+    start method of :mod:`multiprocessing`.  Coroutines defined elsewhere,
+    e.g. within function or interactive session, require ``'fork'`` start
+    method, which is not available on Windows.  The ``context`` is a name of
+    start method used by the pool, it defaults to the default one of the
+    platform.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def square(next=null):
+        ...     while True:
+        ...         item = yield
+        ...         next.send(item * item)
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> p = pipeline(
+        ...     parallel(square, processes=2, chunk_size=2, context='fork'),
+        ...     collect.params(result),
+        ... )
+        >>> p.feed(range(5))
+        >>> result
+        [0, 1, 4, 9, 16]
+
+        >>> p
+        parallel(square, processes=2, chunk_size=2, context='fork')
+        collect.params([0, 1, 4, 9, 16])
+
+    """
+
+    def __init__(self, worker, processes=None, ordered=True, chunk_size=256,
+                 max_pending=None, context=None):
+        self.worker = worker
+        self.processes = processes
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.context = context
+
+    def __call__(self, next=null):
+        """ Returns initialized coroutine """
+        return _dispatch(self, next)
+
+    def stateful(self):
+        """
+        Raises ``TypeError``, if wrapped worker is stateful, because its state
+        is kept by worker processes.  See :meth:`copipes.pipeline.stateful`.
+
+        """
+        for worker in _stateful(self.worker):
+            if worker.get_state() is not None:
+                raise TypeError('State of {0!r} is kept by worker '
+                                'processes'.format(worker))
+        return iter(())
+
+    def __repr__(self):
+        params = [repr(self.worker)]
+        if self.processes is not None:
+            params.append('processes={0!r}'.format(self.processes))
+        if not self.ordered:
+            params.append('ordered=False')
+        if self.chunk_size != 256:
+            params.append('chunk_size={0!r}'.format(self.chunk_size))
+        if self.max_pending is not None:
+            params.append('max_pending={0!r}'.format(self.max_pending))
+        if self.context is not None:
+            params.append('context={0!r}'.format(self.context))
+        return 'parallel({0})'.format(', '.join(params))
+
+
+@coroutine
+def _dispatch(options, next):
+    context = multiprocessing if options.context is None else \
+              get_context(options.context)
+    processes = options.processes or cpu_count()
+    finished = context.Value('i', 0)
+    pool = context.Pool(processes, _initialize, (options.worker, finished))
+    max_pending = options.max_pending or 2 * processes
+    pending = []
+
+    def emit(block):
+        # Re-emits processed chunks, while ``block`` is true waits for
+        # the first pending chunk at least
+        while pending:
+            if options.ordered:
+                if not block and not pending[0].ready():
+                    return
+                result = pending.pop(0)
+            else:
+                ready = [r for r in pending if r.ready()]
+                if not ready:
+                    if not block:
+                        return
+                    pending[0].wait(0.01)
+                    continue
+                result = ready[0]
+                pending.remove(result)
+            send_many(next, result.get())
+            block = False
+
+    chunk = []
+    try:
+        while True:
+            item = yield
+            chunk.append(item)
+            if len(chunk) < options.chunk_size:
+                continue
+            pending.append(pool.apply_async(_process, (chunk,)))
+            chunk = []
+            emit(block=len(pending) > max_pending)
+    except GeneratorExit:
+        if chunk:
+            pending.append(pool.apply_async(_process, (chunk,)))
+        while pending:
+            emit(block=True)
+        # Each process takes exactly one call, since it waits for others
+        finishing = [pool.apply_async(_finish, (processes,))
+                     for i in range(processes)]
+        for result in finishing:
+            send_many(next, result.get())
+        pool.close()
+        pool.join()
+        next.close()
+    finally:
+        pool.terminate()
+
+
+class threaded(object):
+    """
+    Runs wrapped worker on ``threads``, which take items from bounded queue.
+    The wrapper can be connected to pipeline like any other coroutine.  It
+    is useful for workers blocked by I/O, so the upstream doesn't wait for
+    them.
+
+    Each thread keeps its own initialized copy of the worker.  Items sent by
+    the copies are passed to the next worker under lock, i.e. the next worker
+    is never resumed concurrently.  When the queue of ``maxsize`` items is
+    full, ``policy`` defines behavior of the wrapper:
+
+    ``'block'``
+        wait for free slot in the queue;
+    ``'drop'``
+        drop the oldest item in the queue;
+    ``'sample'``
+        while the queue is full, drop every ``rate``-th item like ``'drop'``
+        does, and drop others without enqueuing them;
+    ``'raise'``
+        raise ``queue.Full`` exception.
+
+    The wrapper counts dropped items in ``dropped`` attribute and keeps
+    the maximal observed length of the queue in ``high_water`` attribute.  The
+    attributes are shared by all initialized copies of the wrapper.
+
+    Closing of the wrapper processes the rest of items, joins the threads,
+    and closes the next worker.  Exception raised by a worker copy is
+    re-raised on the next call of the wrapper.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> p = pipeline(threaded(collect.params(result), threads=2))
+        >>> p.feed(range(5))
+        >>> sorted(result)
+        [0, 1, 2, 3, 4]
+
+        >>> p
+        threaded(collect.params([0, 1, 2, 3, 4]), threads=2)
+
+    """
+
+    policies = ('block', 'drop', 'sample', 'raise')
+
+    # Forked pipeline serializes access of its branches to the rest of
+    # pipeline, if any branch contains concurrent worker
+    concurrent = True
+
+    def __init__(self, worker, threads=1, maxsize=1024, policy='block',
+                 rate=10):
+        if policy not in self.policies:
+            raise ValueError('Unknown policy {0!r}'.format(policy))
+        self.worker = worker
+        self.threads = threads
+        self.maxsize = maxsize
+        self.policy = policy
+        self.rate = rate
+        self.dropped = 0
+        self.high_water = 0
+
+    def __call__(self, next=null):
+        """ Returns initialized coroutine """
+        return _enqueue(self, next)
+
+    def stateful(self):
+        """
+        Iterates over stateful workers of wrapped one, which are shared by
+        its copies.  See :meth:`copipes.pipeline.stateful`.
+
+        """
+        return _stateful(self.worker)
+
+    def __repr__(self):
+        params = [repr(self.worker)]
+        if self.threads != 1:
+            params.append('threads={0!r}'.format(self.threads))
+        if self.maxsize != 1024:
+            params.append('maxsize={0!r}'.format(self.maxsize))
+        if self.policy != 'block':
+            params.append('policy={0!r}'.format(self.policy))
+        if self.policy == 'sample':
+            params.append('rate={0!r}'.format(self.rate))
+        return 'threaded({0})'.format(', '.join(params))
+
+
+class buffer(threaded):
+    """
+    Bounded buffer, which decouples upstream from the rest of pipeline.  The
+    rest of pipeline is run on a separate thread, and gets items through the
+    queue of ``maxsize`` items.  See :class:`threaded` for details of
+    ``policy``.
+
+    Buffer at the start of forked pipeline lets the branch lag behind others
+    without blocking them, e.g. a slow sink doesn't stall the fast branches.
+    Use :func:`watermarks` to find out how close buffers came to overflow.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> from copipes import pipeline
+
+        >>> @coroutine
+        ... def broadcast(*next):
+        ...     while True:
+        ...         item = yield
+        ...         for n in next:
+        ...             n.send(item)
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> fast = []
+        >>> slow = []
+        >>> p = pipeline()
+        >>> with p.fork(broadcast, 2) as (first, second):
+        ...     first.connect(collect.params(fast))
+        ...     second.connect(buffer(maxsize=100), collect.params(slow))
+        >>> p.feed(range(5))
+        >>> fast, slow
+        ([0, 1, 2, 3, 4], [0, 1, 2, 3, 4])
+
+        >>> p                                           # doctest: +ELLIPSIS
+        broadcast:
+            -->
+                collect.params([0, 1, 2, 3, 4])
+            -->
+                buffer(maxsize=100)
+                collect.params([0, 1, 2, 3, 4])
+        >>> watermarks(p)                               # doctest: +ELLIPSIS
+        [('broadcast: --> 2: buffer(maxsize=100)', ...)]
+
+    """
+
+    def __init__(self, maxsize=1024, policy='block', rate=10):
+        super(buffer, self).__init__(_forward, 1, maxsize, policy, rate)
+
+    def __repr__(self):
+        params = []
+        if self.maxsize != 1024:
+            params.append('maxsize={0!r}'.format(self.maxsize))
+        if self.policy != 'block':
+            params.append('policy={0!r}'.format(self.policy))
+        if self.policy == 'sample':
+            params.append('rate={0!r}'.format(self.rate))
+        return 'buffer({0})'.format(', '.join(params))
+
+
+@coroutine
+def _forward(next):
+    while True:
+        item = yield
+        next.send(item)
+
+
+def watermarks(p, path=''):
+    """
+    Returns list of ``(path, high_water)`` pairs for each buffering worker
+    of pipeline ``p`` and its forked pipelines, i.e. :class:`threaded`,
+    :class:`buffer`, :class:`copipes.spill.spill_buffer` and
+    :class:`copipes.remote.remote`.  The ``high_water`` is the maximal
+    observed number of pending items, or batches for the latter.
+
+    """
+    result = []
+    for worker in p.pipe:
+        if hasattr(worker, 'high_water'):
+            result.append((path + repr(worker), worker.high_water))
+        elif isinstance(worker, _fork):
+            prefix = path + repr(worker.worker) + ': --> '
+            branches = [(str(i + 1), pipe)
+                        for i, pipe in enumerate(worker.pipes)]
+            branches.extend(sorted(worker.named_pipes.items()))
+            for name, pipe in branches:
+                result.extend(watermarks(pipe, prefix + name + ': '))
+    return result
+
+
+_stop = object()
+
+
+@coroutine
+def _enqueue(options, next):
+    queue = Queue(options.maxsize)
+    errors = []
+    cancelled = Event()
+    target = _locked(next)
+    overflow = 0
+    threads = [Thread(target=_consume,
+                      args=(options.worker(next=target), queue, errors,
+                            cancelled))
+               for i in range(options.threads)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while True:
+            item = yield
+            if errors:
+                raise errors[0]
+            if options.policy == 'block':
+                queue.put(item)
+            else:
+                try:
+                    queue.put_nowait(item)
+                    overflow = 0
+                except Full:
+                    if options.policy == 'raise':
+                        raise
+                    options.dropped += 1
+                    if options.policy == 'drop' or \
+                       not overflow % options.rate:
+                        try:
+                            queue.get_nowait()
+                        except Empty:
+                            pass
+                        queue.put(item)
+                    overflow += 1
+            size = queue.qsize()
+            if size > options.high_water:
+                options.high_water = size
+    except GeneratorExit:
+        for thread in threads:
+            queue.put(_stop)
+        for thread in threads:
+            thread.join()
+        del threads[:]
+        if errors:
+            raise errors[0]
+        next.close()
+    finally:
+        if threads:
+            # The wrapper is failed, threads drop the rest of items and stop
+            # without closing their worker copies.  Threads are joined only
+            # if a copy is failed, since others may be busy otherwise, e.g.
+            # when ``queue.Full`` is raised.
+            cancelled.set()
+            _wake(queue, len(threads))
+            if errors:
+                for thread in threads:
+                    thread.join()
+
+
+def _consume(worker, queue, errors, cancelled):
+    try:
+        while True:
+            item = queue.get()
+            if item is _stop or cancelled.is_set():
+                break
+            worker.send(item)
+        if not cancelled.is_set():
+            worker.close()
+    except Exception as e:
+        errors.append(e)
+        # Keep the queue moving, so the producer doesn't hang
+        while not cancelled.is_set() and queue.get() is not _stop:
+            pass
+
+
+def _wake(queue, count):
+    # Puts ``count`` stop signals to ``queue`` bypassing its size limit, so
+    # the caller doesn't wait for busy threads
+    with queue.mutex:
+        queue.queue.extend([_stop] * count)
+        queue.unfinished_tasks += count
+        queue.not_empty.notify_all()
+
+
+class _locked(object):
+    """ Serializes access of worker threads to the next worker """
+
+    def __init__(self, next):
+        self.next = next
+        self.lock = Lock()
+
+    def send(self, item):
+        with self.lock:
+            self.next.send(item)
+
+    def send_many(self, items):
+        with self.lock:
+            send_many(self.next, items)
+
+    def close(self):
+        # The next worker is closed by the wrapper, when all threads are done
+        pass
+
+
+# State of pool process
+_worker = None
+_finished = None
+_output = []
+
+
+def _initialize(worker, finished):
+    global _worker, _finished
+    _worker = worker(next=_collector())
+    _finished = finished
+
+
+class _collector(object):
+    """ Collects items sent by worker within pool process """
+
+    send = _output.append
+
+    def send_many(self, items):
+        _output.extend(items)
+
+    def close(self):
+        pass
+
+
+def _process(chunk):
+    send_many(_worker, chunk)
+    return _flush()
+
+
+def _finish(processes):
+    # Closes worker of the process, then waits for the rest of ``processes``
+    # to do so, so the process doesn't take a call meant for another one
+    _worker.close()
+    with _finished.get_lock():
+        _finished.value += 1
+    while _finished.value < processes:
+        sleep(0.001)
+    return _flush()
+
+
+def _flush():
+    # Returns items collected within pool process
+    result = _output[:]
+    del _output[:]
+    return result
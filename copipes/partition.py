@@ -0,0 +1,164 @@
+"""
+Key-partitioned fork, which routes items to a number of equal pipelines.
+
+"""
+
+from os import linesep
+
+from copipes import coroutine, pipeline, _fork, _stateful
+from copipes.parallel import parallel
+
+
+__all__ = ['partition', 'partitioned', 'dispatch_table']
+
+
+def jump_hash(key, buckets):
+    """
+    Returns bucket of ``key`` using jump consistent hash by Lamping and Veach.
+    When number of buckets grows from ``n`` to ``n + 1``, only ``1 / (n + 1)``
+    of keys move, and they move to the new bucket.
+
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def dispatch_table(count, slots=4096, consistent=True):
+    """
+    Returns list of ``slots`` shard numbers, which maps hash of key modulo
+    ``slots`` to one of ``count`` shards.  If ``consistent`` is true, the table
+    is built using consistent hashing, so changing of ``count`` moves the
+    minimal number of slots.
+
+    ..  code-block:: pycon
+
+        >>> dispatch_table(3, slots=8, consistent=False)
+        [0, 1, 2, 0, 1, 2, 0, 1]
+        >>> old = dispatch_table(4)
+        >>> new = dispatch_table(5)
+        >>> moved = [o for o, n in zip(old, new) if o != n]
+        >>> 0.15 < len(moved) / 4096.0 < 0.25
+        True
+        >>> set(new[i] for i in range(4096) if old[i] != new[i])
+        {4}
+
+    """
+    if count > slots:
+        raise ValueError('Number of shards exceeds number of slots')
+    if consistent:
+        return [jump_hash(slot, count) for slot in range(slots)]
+    return [slot % count for slot in range(slots)]
+
+
+@coroutine
+def partition(key, table, hash, *shards):
+    """
+    Routes each item to one of ``shards`` by ``hash`` of ``key(item)`` using
+    dispatch ``table``.  Use :class:`partitioned` to build the fork.
+
+    """
+    sends = [shard.send for shard in shards]
+    slots = len(table)
+    try:
+        while True:
+            item = yield
+            sends[table[hash(key(item)) % slots]](item)
+    except GeneratorExit:
+        for shard in shards:
+            shard.close()
+
+
+class partitioned(object):
+    """
+    Fork, which routes items to ``count`` shards by ``key(item)``.  Each shard
+    is a pipeline initialized from the same ``template``.  Like other forks,
+    shards are joined to the rest of pipeline.
+
+    Hash of key is mapped to shard via precomputed :func:`dispatch_table`.  By
+    default the table is built using consistent hashing, so changing of
+    ``count`` moves a minimal number of keys to other shards.  Keys are hashed
+    by ``hash`` function, which defaults to built-in one.  Note, built-in hash
+    of strings is salted per process, unless ``PYTHONHASHSEED`` is set.  Pass
+    ``zlib.crc32`` or similar function to get routing stable across runs.
+
+    If ``processes`` is true, each shard runs on a separate process via
+    :class:`copipes.parallel.parallel`, which ``options`` are passed through.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> from copipes import null
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> shards = []
+        >>> @coroutine
+        ... def shard(next=null):
+        ...     target = []
+        ...     shards.append(target)
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> result = []
+        >>> p = pipeline(
+        ...     partitioned(lambda i: i % 6, 3, pipeline(shard)),
+        ...     collect.params(result),
+        ... )
+        >>> p.feed(range(12))
+        >>> sorted(result) == list(range(12))
+        True
+        >>> [sorted(set(i % 6 for i in items)) for items in shards]
+        [[0, 1, 2], [4, 5], [3]]
+
+        >>> p                                           # doctest: +ELLIPSIS
+        partitioned(<function <lambda> at ...>, 3):
+            --> x3
+                shard
+        collect.params([...])
+
+    """
+
+    def __init__(self, key, count, template, consistent=True, slots=4096,
+                 hash=hash, processes=False, **options):
+        self.key = key
+        self.count = count
+        self.template = template
+        self.hash = hash
+        self.table = dispatch_table(count, slots, consistent)
+        if processes:
+            template = pipeline(parallel(template, processes=1, **options))
+        self.shard = template
+        self.fork = _fork(partition.params(key, self.table, hash),
+                          *[template] * count)
+
+    def __call__(self, next):
+        """ Returns initialized forked pipeline """
+        return self.fork(next)
+
+    def stateful(self):
+        """
+        Iterates over stateful workers of ``template``, which are shared by
+        shards.  See :meth:`copipes.pipeline.stateful`.
+
+        """
+        return _stateful(self.shard)
+
+    def __repr__(self):
+        result = ['partitioned({0!r}, {1!r}):'.format(self.key, self.count),
+                  '    --> x{0}'.format(self.count)]
+        result.extend(' ' * 8 + wr
+                      for wr in repr(self.template).split(linesep))
+        return linesep.join(result)
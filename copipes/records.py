@@ -0,0 +1,354 @@
+"""
+Compact record types and workers, which parse lines into them.
+
+:func:`record` declares a record type, which stores its fields in
+``__slots__``, so instances have no ``__dict__``, and field access does not
+go through properties as it does for ``namedtuple``.  Fields may be typed by
+:mod:`array` type codes, values of typed fields are converted on
+construction.  Records are compared and hashed by values of their fields, so
+they can be used by workers like ``unique``.
+
+Records of a type can also be kept in struct-of-arrays form by
+:class:`columns`, where each field is stored in its own preallocated column:
+an :class:`array.array` for typed fields, and a list for others.
+
+:func:`parse` splits each line by a delimiter into a record, and
+:func:`parse_columns` fills a preallocated :class:`columns` batch.
+
+"""
+
+import sys
+from array import array
+from keyword import iskeyword
+
+from copipes import coroutine, batched, null
+
+
+__all__ = ['record', 'columns', 'parse', 'parse_columns']
+
+
+# Type codes of :mod:`array` module, which are not integer ones
+_FLOAT_CODES = 'fd'
+_TEXT_CODES = 'u'
+
+_text = type(u'')
+
+
+def _converter(code):
+    # Returns function converting value to the type ``code``
+    if code is None:
+        return None
+    if code in _FLOAT_CODES:
+        return float
+    if code in _TEXT_CODES:
+        return _text
+    return int
+
+
+def _empty(code):
+    # Returns initial value of column cell of the type ``code``
+    if code is None:
+        return None
+    if code in _TEXT_CODES:
+        return u'\0'
+    return 0
+
+
+class _record(object):
+    """
+    Base class of record types.  You don't need to deal with it directly,
+    use :func:`record` function.
+
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _types = ()
+
+    @classmethod
+    def _make(cls, values):
+        """ Returns record of ``values`` sequence """
+        return cls(*values)
+
+    def __iter__(self):
+        return iter(self._astuple())
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and \
+               self._astuple() == other._astuple()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._astuple())
+
+    def __reduce__(self):
+        return type(self), self._astuple()
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(name, value)
+            for name, value in zip(self._fields, self._astuple())
+        ))
+
+
+def record(name, fields):
+    """
+    Returns record type ``name``.  The ``fields`` is a sequence of field
+    names or ``(name, code)`` pairs, where ``code`` is a type code of
+    :mod:`array` module.  It may also be a string of space or comma
+    separated names.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> Point = record('Point', [('x', 'd'), ('y', 'd'), 'label'])
+        >>> p = Point('1.5', 2, 'a')
+        >>> p
+        Point(x=1.5, y=2.0, label='a')
+        >>> p.x + p.y
+        3.5
+        >>> x, y, label = p
+        >>> p == Point(1.5, 2.0, 'a')
+        True
+        >>> hasattr(p, '__dict__')
+        False
+
+    Record types are pickled by reference, so declare them at module level
+    to pass records to other processes.
+
+    """
+    if hasattr(fields, 'split'):
+        fields = fields.replace(',', ' ').split()
+    names = []
+    types = []
+    for field in fields:
+        field, code = field if isinstance(field, tuple) else (field, None)
+        if not all(c.isalnum() or c == '_' for c in field) or \
+           not field or field[0].isdigit() or field[0] == '_' or \
+           iskeyword(field):
+            raise ValueError('Invalid field name: {0!r}'.format(field))
+        if field in names:
+            raise ValueError('Duplicate field name: {0!r}'.format(field))
+        if code is not None:
+            try:
+                array(code)
+            except (TypeError, ValueError):
+                raise ValueError('Invalid type code: {0!r}'.format(code))
+        names.append(field)
+        types.append(code)
+    # Constructor and accessor are generated like ``namedtuple`` ones,
+    # since they are called per record.  Names of their own parameters
+    # start with underscore, so they don't clash with fields.
+    namespace = {}
+    body = []
+    for field, code in zip(names, types):
+        if code is None:
+            body.append('    _self.{0} = {0}\n'.format(field))
+        else:
+            namespace['_convert_' + field] = _converter(code)
+            body.append('    _self.{0} = _convert_{0}({0})\n'.format(field))
+    fill = ['    ({0}) = _values\n'.format(
+        ''.join('{0}, '.format(field) for field in names))]
+    for i, (field, code) in enumerate(zip(names, types)):
+        fill.append('    _data[{0}][_index] = {1}\n'.format(
+            i, field if code is None else '_convert_{0}({0})'.format(field)))
+    source = 'def __init__({0}):\n{1}' \
+             'def _astuple(_self):\n' \
+             '    return ({2})\n' \
+             'def _fill(_data, _index, _values):\n{3}'.format(
+                 ', '.join(['_self'] + names),
+                 ''.join(body) or '    pass\n',
+                 ''.join('_self.{0}, '.format(field) for field in names),
+                 ''.join(fill))
+    exec(source, namespace)
+    cls = type(str(name), (_record,), {
+        '__slots__': tuple(names),
+        '_fields': tuple(names),
+        '_types': tuple(types),
+        '__init__': namespace['__init__'],
+        '_astuple': namespace['_astuple'],
+        '_fill': staticmethod(namespace['_fill']),
+    })
+    try:
+        cls.__module__ = sys._getframe(1).f_globals.get('__name__', '__main__')
+    except (AttributeError, ValueError):
+        pass
+    return cls
+
+
+class columns(object):
+    """
+    Struct-of-arrays batch of up to ``size`` records of ``type``.  Columns
+    are allocated once, so :meth:`clear` makes the batch ready to be filled
+    again without new allocations.  Indexing and iteration return new
+    records, which can be kept after the batch is cleared.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> Point = record('Point', [('x', 'd'), ('y', 'd'), 'label'])
+        >>> batch = columns(Point, 4)
+        >>> batch.append(['1', '2', 'a'])
+        >>> batch.append([3, 4, 'b'])
+        >>> len(batch)
+        2
+        >>> batch.column('x')
+        array('d', [1.0, 3.0])
+        >>> batch.column('label')
+        ['a', 'b']
+        >>> batch[-1]
+        Point(x=3.0, y=4.0, label='b')
+        >>> batch
+        columns(Point, 4)
+
+        >>> batch.clear()
+        >>> list(batch)
+        []
+
+    """
+
+    def __init__(self, type, size):
+        self.type = type
+        self.size = size
+        self.length = 0
+        self.data = [
+            [None] * size if code is None else
+            array(code, [_empty(code)]) * size
+            for code in type._types
+        ]
+
+    def __repr__(self):
+        return 'columns({0}, {1!r})'.format(self.type.__name__, self.size)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('columns index out of range')
+        return self.type(*[column[index] for column in self.data])
+
+    def __iter__(self):
+        length = self.length
+        for values in zip(*[column[:length] for column in self.data]):
+            yield self.type(*values)
+
+    def append(self, values):
+        """ Appends record of ``values`` sequence """
+        index = self.length
+        if index == self.size:
+            raise IndexError('columns are full')
+        self.type._fill(self.data, index, values)
+        self.length = index + 1
+
+    def column(self, name):
+        """ Returns copy of filled part of column ``name`` """
+        index = self.type._fields.index(name)
+        return self.data[index][:self.length]
+
+    def clear(self):
+        """ Empties the batch keeping allocated columns """
+        self.length = 0
+
+
+@coroutine
+def parse(type, sep=None, next=null):
+    """
+    Splits each line by ``sep`` into record of ``type``, and sends it to the
+    next worker.  The line is stripped, and the last field takes the rest of
+    it.  Blank lines are skipped.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> LogRecord = record('LogRecord', 'level module message')
+        >>> result = []
+        >>> p = pipeline(parse.params(LogRecord), collect.params(result))
+        >>> p.feed(['INFO first Info message', '', 'ERROR second Error'])
+        >>> result[0]
+        LogRecord(level='INFO', module='first', message='Info message')
+        >>> result[1].level
+        'ERROR'
+
+    """
+    maxsplit = len(type._fields) - 1
+    try:
+        while True:
+            line = yield
+            line = line.strip()
+            if not line:
+                continue
+            next.send(type(*line.split(sep, maxsplit)))
+    except GeneratorExit:
+        next.close()
+
+
+@batched
+def parse_columns(type, size=256, sep=None, next=null):
+    """
+    Splits lines like :func:`parse` does, but fills :class:`columns` batch
+    of ``size`` records instead, and sends the batch to the next worker when
+    it's full and on close.  The same batch is cleared and filled again after
+    the next worker returns, so workers, which keep items, should copy them,
+    i.e. get records by iteration or indexing.  The worker is batched, so it
+    receives lines by :func:`copipes.send_many` without a resume per line.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def total(target, next=null):
+        ...     while True:
+        ...         batch = yield
+        ...         target.append(sum(batch.column('bytes')))
+        ...         next.send(batch)
+
+        >>> from copipes import pipeline
+        >>> Request = record('Request', [('bytes', 'l'), 'path'])
+        >>> result = []
+        >>> p = pipeline(parse_columns.params(Request, 2),
+        ...              total.params(result))
+        >>> p.feed(['10 /', '20 /a', '30 /b'], batch_size=2)
+        >>> result
+        [30, 30]
+
+    """
+    batch = columns(type, size)
+    fill = type._fill
+    data = batch.data
+    maxsplit = len(type._fields) - 1
+    try:
+        while True:
+            lines = yield
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                fill(data, batch.length, line.split(sep, maxsplit))
+                batch.length += 1
+                if batch.length == size:
+                    next.send(batch)
+                    batch.clear()
+    except GeneratorExit:
+        if batch.length:
+            next.send(batch)
+        next.close()
@@ -0,0 +1,436 @@
+"""
+Workers, which run a part of pipeline on another process or host.
+
+Pipeline is cut by :class:`remote` worker.  Items sent to it cross the cut
+over TCP or Unix socket, and are processed by pipeline served by
+:func:`serve` on the other side.  Items sent by the served pipeline come
+back and are passed to the next worker of the cut one, so the cut can be
+placed in the middle of pipeline or at a branch of fork.
+
+Items are transferred by batches.  Each batch is a frame of 5-byte header,
+i.e. kind of frame and length of payload, followed by the payload, which is
+the batch serialized using ``codec``.  The served side replies to each batch
+by a batch of its output, which also returns a credit to the sender.  The
+sender keeps at most ``credits`` batches in flight, so memory of both sides
+is bounded, and a slow worker throttles the upstream.
+
+The module can be run as a script, see :func:`main`::
+
+    python -m copipes.remote worker ADDRESS MODULE:PIPELINE
+    python -m copipes.remote coordinator MODULE:PIPELINE [FILE ...]
+
+..  warning::
+
+    Connections are neither authenticated nor encrypted, and the default
+    codec is :mod:`pickle`, so anyone, who can connect to the served
+    pipeline, can run arbitrary code in its process.  Serve pipelines on
+    loopback interface or Unix socket, or within trusted network only.  Pass
+    a codec, which can't construct arbitrary objects, e.g. :mod:`json`, to
+    exchange plain data with untrusted peers.
+
+"""
+
+import argparse
+import socket
+import struct
+import sys
+from threading import Thread
+from timeit import default_timer as timer
+
+try:
+    import cPickle as pickle
+except ImportError:     # Python 3.x
+    import pickle
+
+try:
+    from queue import Queue, Empty
+except ImportError:     # Python 2.x
+    from Queue import Queue, Empty
+
+from copipes import coroutine, send_many, _output, _reference
+
+
+__all__ = ['remote', 'listen', 'serve', 'main']
+
+
+_header = struct.Struct('<BI')
+
+# Host of TCP addresses given by port number only
+LOOPBACK = '127.0.0.1'
+
+_BATCH = 1
+_CLOSE = 2
+_ERROR = 3
+
+
+class remote(object):
+    """
+    Sends items to pipeline served at ``address``, which is either
+    ``(host, port)`` pair or path of Unix socket, and passes items sent by
+    the served pipeline to the next worker.  The wrapper can be connected to
+    pipeline like any other coroutine.  Each initialized copy of the wrapper
+    opens its own connection, which is closed on close of the wrapper.
+
+    Items are sent by batches of ``batch_size`` items or, if ``interval`` is
+    passed, when the ``interval`` in seconds is expired since the first item
+    of the batch came.  The interval is checked on each item, like sinks of
+    :mod:`copipes.sinks` do.  At most ``credits`` batches are in flight, when
+    the limit is exceeded the wrapper waits for reply before accepting the
+    next item.  The maximal observed number of batches in flight is kept in
+    ``high_water`` attribute, see :func:`copipes.parallel.watermarks`.
+
+    Batches are serialized using ``codec``, which is any object with
+    ``dumps`` and ``loads`` functions, like :mod:`pickle` used by default.
+    Exception raised by the served pipeline is re-raised by the wrapper.
+    Connect to trusted peers only, since replies are decoded by the codec,
+    see the warning of :mod:`copipes.remote`.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> from threading import Thread
+        >>> from copipes import pipeline, null
+
+        >>> @coroutine
+        ... def square(next=null):
+        ...     while True:
+        ...         item = yield
+        ...         next.send(item * item)
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> listener = listen(('127.0.0.1', 0))
+        >>> address = listener.getsockname()
+        >>> worker = Thread(target=serve,
+        ...                 args=(listener, pipeline(square), 1))
+        >>> worker.start()
+
+        >>> result = []
+        >>> p = pipeline(
+        ...     remote(address, batch_size=2, credits=1),
+        ...     collect.params(result),
+        ... )
+        >>> p.feed(range(5))
+        >>> worker.join()
+        >>> result
+        [0, 1, 4, 9, 16]
+
+    """
+
+    def __init__(self, address, batch_size=256, interval=None, credits=16,
+                 codec=pickle):
+        self.address = address
+        self.batch_size = batch_size
+        self.interval = interval
+        self.credits = credits
+        self.codec = codec
+        self.high_water = 0
+
+    def __call__(self, next):
+        """ Returns initialized coroutine """
+        return _transfer(self, next)
+
+    def __repr__(self):
+        params = [repr(self.address)]
+        if self.batch_size != 256:
+            params.append('batch_size={0!r}'.format(self.batch_size))
+        if self.interval is not None:
+            params.append('interval={0!r}'.format(self.interval))
+        if self.credits != 16:
+            params.append('credits={0!r}'.format(self.credits))
+        return 'remote({0})'.format(', '.join(params))
+
+
+@coroutine
+def _transfer(options, next):
+    connection = _connection(_connect(options.address), options.codec)
+    # Replies are read by a separate thread, so both sides never wait for
+    # each other on writing.  There are at most ``credits`` replies in the
+    # queue.
+    replies = Queue()
+    reader = Thread(target=_read, args=(connection, replies))
+    reader.daemon = True
+    reader.start()
+    interval = options.interval
+    credits = options.credits
+    batch = []
+    started = None
+    pending = 0
+    try:
+        while True:
+            item = yield
+            if not batch:
+                started = timer()
+            batch.append(item)
+            if len(batch) < options.batch_size and \
+               (interval is None or timer() - started < interval):
+                continue
+            while pending >= credits:
+                _reply(replies.get(), next)
+                pending -= 1
+            connection.write(_BATCH, batch)
+            batch = []
+            pending += 1
+            if pending > options.high_water:
+                options.high_water = pending
+            # Pass through replies, which are ready
+            while pending:
+                try:
+                    reply = replies.get_nowait()
+                except Empty:
+                    break
+                _reply(reply, next)
+                pending -= 1
+    except GeneratorExit:
+        if batch:
+            connection.write(_BATCH, batch)
+        connection.write(_CLOSE, None)
+        while _reply(replies.get(), next) != _CLOSE:
+            pass
+        next.close()
+    finally:
+        connection.close()
+        reader.join()
+
+
+def _read(connection, replies):
+    # Reads frames into ``replies`` queue up to the closing one
+    while True:
+        try:
+            kind, payload = connection.read()
+        except Exception as e:
+            replies.put((_ERROR, e))
+            return
+        replies.put((kind, payload))
+        if kind != _BATCH:
+            return
+
+
+def _reply(reply, next):
+    # Passes items of reply to ``next`` and returns kind of the reply
+    kind, payload = reply
+    if kind == _ERROR:
+        raise payload
+    if kind == _BATCH:
+        send_many(next, payload)
+    return kind
+
+
+def listen(address, backlog=16):
+    """
+    Returns socket listening at ``address``, which is either ``(host, port)``
+    pair, port number, or path of Unix socket.  Port number alone is bound
+    to loopback interface.  Pass port ``0`` to bind a free one, and get the
+    actual address by ``getsockname()`` method of the socket.
+
+    """
+    if isinstance(address, int):
+        address = (LOOPBACK, address)
+    if isinstance(address, tuple):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(address)
+    sock.listen(backlog)
+    return sock
+
+
+def serve(listener, p, connections=None, codec=pickle):
+    """
+    Serves pipeline ``p`` on ``listener`` socket returned by :func:`listen`
+    for :class:`remote` workers.  Each connection is handled on a separate
+    thread by its own initialized copy of the pipeline.  Items sent by the
+    last worker of the pipeline are sent back to the connected one.  Closing
+    of connected worker closes the pipeline.  The ``codec`` should be the
+    same as one of connected workers.
+
+    If ``connections`` is passed, the function returns after the number of
+    connections is handled, and closes ``listener``.  Otherwise, it serves
+    forever.
+
+    ..  warning::
+
+        Batches received from connected peers are decoded by ``codec``.
+        Peer connected to pipeline served with :mod:`pickle` codec can run
+        arbitrary code in the process, so listen on loopback interface or
+        Unix socket, or within trusted network only.
+
+    """
+    threads = []
+    try:
+        while connections is None or len(threads) < connections:
+            sock, address = listener.accept()
+            thread = Thread(target=_handle, args=(sock, p, codec))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+            if connections is None:
+                threads = [t for t in threads if t.is_alive()]
+        for thread in threads:
+            thread.join()
+    finally:
+        listener.close()
+
+
+def _handle(sock, p, codec):
+    # Feeds pipeline ``p`` by batches received from connected ``sock``
+    if sock.family != getattr(socket, 'AF_UNIX', None):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    connection = _connection(sock, codec)
+    output = []
+    try:
+        worker = p(_output(output))
+        while True:
+            kind, items = connection.read()
+            if kind == _CLOSE:
+                worker.close()
+                if output:
+                    connection.write(_BATCH, output)
+                connection.write(_CLOSE, None)
+                break
+            send_many(worker, items)
+            connection.write(_BATCH, output)
+            del output[:]
+    except Exception as e:
+        try:
+            connection.write(_ERROR, e)
+        except Exception:
+            connection.write(_ERROR, RuntimeError(repr(e)))
+        # Batches still in flight are discarded up to close of the connected
+        # worker, so its writes don't fail before it reads the error
+        connection.drain()
+    finally:
+        connection.close()
+
+
+def _connect(address):
+    # Returns socket connected to ``address``
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+class _connection(object):
+    """ Reads and writes frames of connected socket """
+
+    def __init__(self, sock, codec):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        self.dumps = codec.dumps
+        self.loads = codec.loads
+
+    def write(self, kind, payload):
+        data = b'' if payload is None else self.dumps(payload)
+        self.sock.sendall(_header.pack(kind, len(data)) + data)
+
+    def read(self):
+        header = self.file.read(_header.size)
+        if len(header) < _header.size:
+            raise EOFError('Connection is closed by the other side')
+        kind, length = _header.unpack(header)
+        data = self.file.read(length)
+        if len(data) < length:
+            raise EOFError('Connection is closed by the other side')
+        return kind, self.loads(data) if length else None
+
+    def drain(self):
+        # Reads data up to close of the other side
+        try:
+            while self.file.read(65536):
+                pass
+        except socket.error:
+            pass
+
+    def close(self):
+        # Shutdown wakes up the thread blocked on reading
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.file.close()
+        self.sock.close()
+
+
+def _address(value):
+    # Parses ``host:port``, ``port`` or path of Unix socket
+    if value.isdigit():
+        return LOOPBACK, int(value)
+    host, sep, port = value.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return value
+
+
+def _loopback(address):
+    # Returns true, if ``address`` is reachable from the local host only
+    if not isinstance(address, tuple):
+        return True
+    try:
+        host = socket.gethostbyname(address[0])
+    except socket.error:
+        return False
+    return host.startswith('127.')
+
+
+def _resolve(value):
+    # Returns object referenced by ``module:name``
+    module, name = value.split(':')
+    return _reference(module, name).resolve()
+
+
+def main(argv=None):
+    """
+    Entry point of worker and coordinator processes.
+
+    ``worker ADDRESS MODULE:PIPELINE [--connections N] [--public]``
+        serves pipeline, see :func:`serve`.  The ``ADDRESS`` is either
+        ``host:port``, ``port`` of loopback interface, or path of Unix
+        socket.  Since the served pipeline receives pickled batches, which
+        can run arbitrary code, the worker refuses to listen on interface
+        other than loopback one, unless ``--public`` is passed.  Pass it
+        within trusted network only;
+    ``coordinator MODULE:PIPELINE [FILE ...]``
+        feeds pipeline, which is cut by :class:`remote` workers, by lines of
+        files or standard input.
+
+    """
+    parser = argparse.ArgumentParser(prog='python -m copipes.remote')
+    commands = parser.add_subparsers(dest='command')
+    worker = commands.add_parser('worker', help='serve pipeline')
+    worker.add_argument('address', type=_address)
+    worker.add_argument('pipeline', type=_resolve)
+    worker.add_argument('--connections', type=int,
+                        help='number of connections to handle')
+    worker.add_argument('--public', action='store_true',
+                        help='listen on non-loopback interface, which lets '
+                             'anyone, who can connect, run code in worker')
+    coordinator = commands.add_parser('coordinator', help='feed pipeline')
+    coordinator.add_argument('pipeline', type=_resolve)
+    coordinator.add_argument('files', nargs='*',
+                             type=argparse.FileType('r'), default=[sys.stdin])
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        if not args.public and not _loopback(args.address):
+            parser.error('worker receives pickled batches, which can run '
+                         'arbitrary code; pass --public to listen on {0!r} '
+                         'within trusted network'.format(args.address))
+        serve(listen(args.address), args.pipeline, args.connections)
+    elif args.command == 'coordinator':
+        args.pipeline.feed(line for f in args.files for line in f)
+    else:
+        parser.error('command is required')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Workers, which write items to files and sockets.
+
+Items are gathered into buffer, which is flushed when its size exceeds
+``buffer_size`` or, if ``interval`` is passed, when the ``interval`` in seconds
+is expired since the last flush.  The interval is checked on each item, i.e.
+there are no flushes while no items come.  The buffer is also flushed on
+``close()``, so workers preceding the sink should pass ``close()`` through.
+
+Each item is written as is or formatted using ``template``, and is passed to
+the next worker after that.
+
+"""
+
+import os
+from timeit import default_timer as timer
+
+from copipes import coroutine, null
+
+
+__all__ = ['write', 'rotating_write', 'socket_write']
+
+
+BUFFER_SIZE = 64 * 1024
+
+
+@coroutine
+def write(file, template=None, buffer_size=BUFFER_SIZE, interval=None,
+          next=null):
+    """
+    Writes items to ``file`` object.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> from io import StringIO
+        >>> from copipes import pipeline
+        >>> output = StringIO()
+        >>> p = pipeline(write.params(output, template=u'{0}\\n'))
+        >>> p.feed([1, 2, 3])
+        >>> print(output.getvalue().strip())
+        1
+        2
+        3
+
+    """
+    return _buffer(file.write, None, template, buffer_size, interval, next)
+
+
+@coroutine
+def rotating_write(path, max_bytes, backup_count=0, template=None,
+                   buffer_size=BUFFER_SIZE, interval=None, mode='w',
+                   encoding=None, next=null):
+    """
+    Writes items to file at ``path``.  When size of the file would exceed
+    ``max_bytes``, the file is renamed to ``path.1``, previous ``path.1`` is
+    renamed to ``path.2`` and so on, up to ``backup_count`` files.  Then new
+    file is opened.  The file is rotated on buffer flush only, so ``max_bytes``
+    should be greater than ``buffer_size``.  Size of text file is counted in
+    characters.
+
+    """
+    state = {}
+
+    def open_file():
+        state['file'] = open(path, mode) if encoding is None else \
+                        open(path, mode, encoding=encoding)
+        state['size'] = state['file'].tell()
+
+    def flush(data):
+        if state['size'] and state['size'] + len(data) > max_bytes:
+            state['file'].close()
+            for i in range(backup_count - 1, 0, -1):
+                name = '{0}.{1}'.format(path, i)
+                if os.path.exists(name):
+                    os.rename(name, '{0}.{1}'.format(path, i + 1))
+            if backup_count:
+                os.rename(path, path + '.1')
+            else:
+                os.remove(path)
+            open_file()
+        state['file'].write(data)
+        state['size'] += len(data)
+
+    def close():
+        state['file'].close()
+
+    open_file()
+    return _buffer(flush, close, template, buffer_size, interval, next)
+
+
+@coroutine
+def socket_write(sock, template=None, encoding='utf-8',
+                 buffer_size=BUFFER_SIZE, interval=None, next=null):
+    """
+    Writes items to connected ``sock``.  String items are encoded using
+    ``encoding``.  The socket is not closed on close of the worker.
+
+    """
+    def flush(data):
+        if not isinstance(data, bytes):
+            data = data.encode(encoding)
+        sock.sendall(data)
+
+    return _buffer(flush, None, template, buffer_size, interval, next)
+
+
+def _buffer(flush, close, template, buffer_size, interval, next):
+    buffer = []
+    size = 0
+    last = timer()
+    try:
+        while True:
+            item = yield
+            data = item if template is None else template.format(item)
+            buffer.append(data)
+            size += len(data)
+            if size >= buffer_size or \
+               interval is not None and timer() - last >= interval:
+                flush(data[:0].join(buffer))
+                del buffer[:]
+                size = 0
+                if interval is not None:
+                    last = timer()
+            next.send(item)
+    except GeneratorExit:
+        if buffer:
+            flush(buffer[0][:0].join(buffer))
+        if close is not None:
+            close()
+        next.close()
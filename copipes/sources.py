@@ -0,0 +1,100 @@
+"""
+Sources of items for :meth:`copipes.pipeline.feed`.
+
+"""
+
+import mmap
+import os
+
+
+__all__ = ['mmap_lines', 'shards']
+
+
+def mmap_lines(path, start=0, stop=None, encoding=None, keepends=True):
+    """
+    Iterates over lines of the file at ``path`` using memory map.
+
+    Lines are yielded as ``memoryview`` slices of the map, i.e. without
+    copying.  Convert a slice to ``bytes`` to keep it after the iteration is
+    over.  If ``encoding`` is passed, lines are decoded to strings.
+
+    The ``start`` and ``stop`` arguments restrict iteration to the lines
+    beginning within ``[start, stop)`` byte range.  So ranges returned by
+    :func:`shards` split the file into disjoint sets of lines, which can be
+    fed by separate processes.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> from tempfile import NamedTemporaryFile
+        >>> f = NamedTemporaryFile(delete=False)
+        >>> f.write(b'first\\nsecond\\nthird\\n')
+        19
+        >>> f.close()
+
+        >>> [bytes(line) for line in mmap_lines(f.name)]
+        [b'first\\n', b'second\\n', b'third\\n']
+        >>> list(mmap_lines(f.name, encoding='utf-8', keepends=False))
+        ['first', 'second', 'third']
+
+        >>> shards(f.name, 2)
+        [(0, 13), (13, 19)]
+        >>> [list(mmap_lines(f.name, start, stop, encoding='utf-8'))
+        ...  for start, stop in shards(f.name, 2)]
+        [['first\\n', 'second\\n'], ['third\\n']]
+
+        >>> os.remove(f.name)
+
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(m, 'madvise'):
+        m.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(m)
+    stop = size if stop is None else min(stop, size)
+    pos = start
+    if pos and m[pos - 1:pos] != b'\n':
+        # The line started before ``start`` belongs to previous range
+        pos = m.find(b'\n', pos) + 1 or size
+    find = m.find
+    source = view if encoding is None else m
+    tail = 1 if keepends else 0
+    try:
+        while pos < stop:
+            end = find(b'\n', pos)
+            if end < 0:
+                line, pos = source[pos:size], size
+            else:
+                line, pos = source[pos:end + tail], end + 1
+            yield line if encoding is None else line.decode(encoding)
+    finally:
+        view.release()
+        try:
+            m.close()
+        except BufferError:
+            # Slices are still in use, the map will be closed on collection
+            pass
+
+
+def shards(path, count):
+    """
+    Splits the file at ``path`` into ``count`` byte ranges of nearly equal
+    size.  Each range is a pair of ``start`` and ``stop`` offsets, which can
+    be passed to :func:`mmap_lines`.  Ranges are aligned to line boundaries
+    where possible, but the alignment is not required for correctness.
+
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, count):
+            offset = max(size * i // count, bounds[-1])
+            f.seek(offset)
+            f.readline()
+            bounds.append(min(max(f.tell(), bounds[-1]), size))
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
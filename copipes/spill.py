@@ -0,0 +1,218 @@
+"""
+Buffer, which spills items to disk, when they don't fit in memory.
+
+"""
+
+import os
+import shutil
+import struct
+from collections import deque
+from sys import getsizeof
+from tempfile import mkdtemp
+from threading import Condition, Thread
+
+try:
+    import cPickle as pickle
+except ImportError:     # Python 3.x
+    import pickle
+
+from copipes import coroutine, null
+
+
+__all__ = ['spill_buffer']
+
+
+_frame = struct.Struct('<I')
+
+
+class spill_buffer(object):
+    """
+    Unbounded buffer, which decouples upstream from the rest of pipeline like
+    :class:`copipes.parallel.buffer` does.  The rest of pipeline is run on
+    a separate thread.  Items are kept in memory up to ``max_memory`` bytes,
+    and the overflow is written to segment files of about ``segment_size``
+    bytes in temporary directory within ``directory``.  Segments are read back
+    in order they are written, so items pass the buffer in FIFO order.  So the
+    buffer absorbs bursts of items larger than memory.
+
+    Size of item in memory is estimated by ``sizeof`` function, which
+    defaults to shallow :func:`sys.getsizeof`.  Items are written to disk using
+    ``codec``, which is any object with ``dumps`` and ``loads`` functions, like
+    :mod:`pickle` used by default.
+
+    The buffer counts items written to disk in ``spilled`` attribute and keeps
+    the maximal number of pending items in ``high_water`` attribute.  Closing
+    of the buffer passes the rest of items, removes the temporary directory,
+    and closes the next worker.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> spill = spill_buffer(max_memory=10, sizeof=lambda item: 1)
+        >>> p = pipeline(spill, collect.params(result))
+        >>> p.feed(range(1000))
+        >>> result == list(range(1000))
+        True
+
+        >>> p
+        spill_buffer(max_memory=10)
+        collect.params([...])
+
+    """
+
+    # Forked pipeline serializes access of its branches to the rest of
+    # pipeline, see :class:`copipes.parallel.threaded`
+    concurrent = True
+
+    def __init__(self, max_memory=64 * 1024 * 1024, segment_size=1024 * 1024,
+                 directory=None, codec=pickle, sizeof=getsizeof):
+        self.max_memory = max_memory
+        self.segment_size = segment_size
+        self.directory = directory
+        self.codec = codec
+        self.sizeof = sizeof
+        self.spilled = 0
+        self.high_water = 0
+
+    def __call__(self, next=null):
+        """ Returns initialized buffer """
+        return _spill(self, next)
+
+    def __repr__(self):
+        return 'spill_buffer(max_memory={0!r})'.format(self.max_memory)
+
+
+class _spool(object):
+    """
+    FIFO queue, which keeps head of items in memory and the rest in segment
+    files.  New items go to memory only if there are no items on disk.
+
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.memory = deque()
+        self.memory_size = 0
+        self.path = None
+        self.segments = deque()
+        self.segment = None
+        self.segment_count = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, item):
+        options = self.options
+        self.count += 1
+        if not self.segments and self.segment is None:
+            size = options.sizeof(item)
+            if self.memory_size + size <= options.max_memory:
+                self.memory.append((size, item))
+                self.memory_size += size
+                return
+        if self.segment is None:
+            if self.path is None:
+                self.path = mkdtemp(prefix='copipes-spill-',
+                                    dir=options.directory)
+            self.segment_count += 1
+            name = os.path.join(self.path, str(self.segment_count))
+            self.segment = open(name, 'wb')
+        data = options.codec.dumps(item)
+        self.segment.write(_frame.pack(len(data)))
+        self.segment.write(data)
+        options.spilled += 1
+        if self.segment.tell() >= options.segment_size:
+            self.rotate()
+
+    def pop(self):
+        if not self.memory:
+            if not self.segments:
+                self.rotate()
+            self.load(self.segments.popleft())
+        self.count -= 1
+        size, item = self.memory.popleft()
+        self.memory_size -= size
+        return item
+
+    def rotate(self):
+        # Closes segment being written, so it can be read
+        self.segment.close()
+        self.segments.append(self.segment.name)
+        self.segment = None
+
+    def load(self, name):
+        sizeof = self.options.sizeof
+        loads = self.options.codec.loads
+        with open(name, 'rb') as f:
+            data = f.read()
+        os.remove(name)
+        offset = 0
+        while offset < len(data):
+            length, = _frame.unpack_from(data, offset)
+            offset += _frame.size
+            item = loads(data[offset:offset + length])
+            offset += length
+            size = sizeof(item)
+            self.memory.append((size, item))
+            self.memory_size += size
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+@coroutine
+def _spill(options, next):
+    spool = _spool(options)
+    ready = Condition()
+    state = {'closed': False}
+    errors = []
+    thread = Thread(target=_drain, args=(spool, ready, state, errors, next))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = yield
+            if errors:
+                raise errors[0]
+            with ready:
+                spool.push(item)
+                if len(spool) > options.high_water:
+                    options.high_water = len(spool)
+                ready.notify()
+    except GeneratorExit:
+        with ready:
+            state['closed'] = True
+            ready.notify()
+        thread.join()
+        spool.close()
+        if errors:
+            raise errors[0]
+        next.close()
+
+
+def _drain(spool, ready, state, errors, next):
+    try:
+        while True:
+            with ready:
+                while not spool and not state['closed']:
+                    ready.wait()
+                if not spool:
+                    break
+                item = spool.pop()
+            next.send(item)
+    except Exception as e:
+        errors.append(e)
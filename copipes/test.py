@@ -1,8 +1,22 @@
+from os import linesep
 from textwrap import dedent
+from unittest import SkipTest
 
 from nose import tools
 
-from copipes import coroutine, pipeline, null
+from copipes import coroutine, pure, batched, mapper, predicate, pipeline, \
+                    null, send_many
+from copipes.parallel import parallel, threaded, buffer, watermarks
+from copipes.dedup import unique, lru, ttl, bloom
+from copipes.partition import partitioned, dispatch_table
+from copipes.windows import tumbling, sliding, session, Window, total, \
+                            minimum, maximum, quantile
+from copipes.sinks import write, rotating_write, socket_write
+from copipes.sources import mmap_lines, shards
+from copipes.spill import spill_buffer
+from copipes.checkpoint import checkpoint
+from copipes.remote import remote, listen, serve
+from copipes.records import record, columns, parse, parse_columns
 
 
 @coroutine
@@ -39,12 +53,53 @@ def split(even, odd):
         next.send(item)
 
 
+@batched
+def collect_batches(target, next):
+    """ Connects pipeline to queue keeping batches """
+    while True:
+        items = yield
+        target.append(list(items))
+        send_many(next, items)
+
+
+@batched
+def add_many(value, next):
+    """ Adds specified ``value`` to each item of batch """
+    while True:
+        items = yield
+        send_many(next, [item + value for item in items])
+
+
+@mapper
+def add_value(value, item):
+    """ Adds specified ``value`` to item """
+    return item + value
+
+
+@predicate
+def odd(item):
+    """ Passes odd items only """
+    return item % 2
+
+
+@coroutine
+def closing(target, next):
+    """ Registers ``close()`` call in ``target`` """
+    try:
+        while True:
+            item = yield
+            next.send(item)
+    except GeneratorExit:
+        target.append('closed')
+
+
 def null_test():
     tools.ok_(not null)
     tools.ok_(null() is null)
 
     # Following code should not raise an exception
     null.send(1, 2, 3)
+    null.send_many([1, 2, 3])
     null.close()
 
 
@@ -193,3 +248,1481 @@ def pipeline_representation_test():
             add.params(2)
     add.params(2)
     """).strip())
+
+
+def batched_pipeline_test():
+    batches = []
+    result = []
+    p = pipeline(
+        add_many.params(1),
+        collect_batches.params(batches),
+        add.params(10),
+        collect.params(result),
+    )
+    p.feed(range(5), batch_size=2)
+    tools.eq_(batches, [[1, 2], [3, 4], [5]])
+    tools.eq_(result, [11, 12, 13, 14, 15])
+
+
+def batched_feed_to_plain_pipeline_test():
+    result = []
+    pipeline(
+        add.params(1),
+        collect.params(result),
+    ).feed(range(5), batch_size=3)
+    tools.eq_(result, [1, 2, 3, 4, 5])
+
+
+def batched_coroutine_accepts_single_items_test():
+    batches = []
+    pipeline(collect_batches.params(batches)).feed([1, 2])
+    tools.eq_(batches, [[1], [2]])
+
+
+def batched_forked_pipeline_test():
+    evens = []
+    odds = []
+
+    @batched
+    def split_many(even, odd):
+        while True:
+            items = yield
+            send_many(even, [i for i in items if not i % 2])
+            send_many(odd, [i for i in items if i % 2])
+
+    p = pipeline()
+    with p.fork(split_many, 2) as (even, odd):
+        even.connect(collect_batches.params(evens))
+        odd.connect(collect_batches.params(odds))
+    p.feed([1, 2, 3, 4], batch_size=4)
+    tools.eq_(evens, [[2, 4]])
+    tools.eq_(odds, [[1, 3]])
+
+
+def pipeline_iterator_test():
+    pulled = []
+
+    def source():
+        for i in range(10):
+            pulled.append(i)
+            yield i
+
+    @coroutine
+    def total(next):
+        result = 0
+        try:
+            while True:
+                result += yield
+        except GeneratorExit:
+            next.send(result)
+            next.close()
+
+    items = pipeline(add.params(1)).iter(source())
+    tools.eq_(next(items), 1)
+    tools.eq_(pulled, [0])
+    tools.eq_(list(items), list(range(2, 11)))
+
+    p = pipeline(add.params(1), total)
+    tools.eq_(list(p.iter(range(4))), [10])
+    tools.eq_(list(p.iter(range(4), batch_size=3)), [10])
+    tools.eq_(list(p.iter(range(4), maxsize=1)), [10])
+
+    closed = []
+    items = pipeline(closing.params(closed)).iter(range(10))
+    next(items)
+    items.close()
+    tools.eq_(closed, ['closed'])
+
+
+def threaded_pipeline_iterator_test():
+    pulled = []
+
+    def source():
+        for i in range(100):
+            pulled.append(i)
+            yield i
+
+    @coroutine
+    def replicate(next):
+        while True:
+            item = yield
+            for i in range(100):
+                next.send(item)
+
+    items = pipeline(replicate).iter(source(), maxsize=10)
+    tools.eq_([next(items) for i in range(150)], [0] * 100 + [1] * 50)
+    # The thread is blocked by the bounded buffer
+    tools.ok_(len(pulled) <= 3)
+    items.close()
+
+    # Closing of iterator closes pipeline
+    for maxsize in (None, 2):
+        closed = []
+        items = pipeline(replicate, closing.params(closed)).iter(
+            range(100), maxsize=maxsize)
+        tools.eq_(next(items), 0)
+        items.close()
+        tools.eq_(closed, ['closed'])
+
+    items = pipeline(add.params(None)).iter(range(3), maxsize=10)
+    tools.assert_raises(TypeError, list, items)
+
+
+def freeze_test():
+    result = []
+    odds = []
+    p = pipeline(add.params(1), multiply.params(2))
+    with p.fork(split, 2) as (even, odd):
+        even.connect(collect.params(result))
+        odd.connect(collect.params(odds))
+    factory = p.freeze()
+    # Changes of the pipeline don't affect the frozen one
+    p.connect(add.params(100))
+    for i in range(3):
+        f = factory()
+        f.send(i)
+        f.close()
+    tools.eq_(result, [2, 4, 6])
+    tools.eq_(odds, [])
+
+    p = pipeline(add.params(1), collect.params(result))
+    p.plug()
+    p.connect(add.params(None))
+    p.freeze()().send(10)
+    tools.eq_(result, [2, 4, 6, 11])
+
+    @pure
+    @coroutine
+    def forward(next):
+        while True:
+            item = yield
+            next.send(item)
+    tools.ok_(pipeline(forward, forward).freeze()() is null)
+
+
+def session_test():
+    started = []
+
+    @coroutine
+    def start(next):
+        started.append(True)
+        while True:
+            item = yield
+            next.send(item)
+
+    result = []
+    closed = []
+    seen = lru(10)
+    p = pipeline(start, unique.params(seen), closing.params(closed),
+                 collect.params(result))
+    with p.session() as session:
+        session.feed([1, 2, 2])
+        session.send(3)
+        session.send_many([3, 4])
+        session.feed([5, 6, 7], batch_size=2)
+        tools.eq_(started, [True])
+        tools.eq_(closed, [])
+        session.flush()
+        tools.eq_(closed, ['closed'])
+        session.reset()
+        tools.eq_(list(seen.keys), [])
+        session.feed([1])
+        tools.eq_(started, [True, True])
+    tools.eq_(closed, ['closed', 'closed'])
+    tools.eq_(result, [1, 2, 3, 4, 5, 6, 7, 1])
+
+    # Pipeline is initialized again after exception
+    p = pipeline(start, add.params(1), collect.params(result))
+    session = p.session()
+    tools.assert_raises(TypeError, session.send, None)
+    session.send(1)
+    session.close()
+    tools.eq_(result[-1], 2)
+    tools.eq_(len(started), 4)
+
+
+def session_pool_test():
+    from threading import Thread
+
+    result = []
+    p = pipeline(add.params(1), collect.params(result))
+    pool = p.pool(3)
+    sessions = []
+
+    def handle(items):
+        with pool.session() as session:
+            sessions.append(session)
+            for item in items:
+                session.send(item)
+
+    threads = [Thread(target=handle, args=(range(i, 1000, 10),))
+               for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+    tools.eq_(sorted(result), list(range(1, 1001)))
+    tools.ok_(1 <= len(set(sessions)) <= 3)
+    tools.ok_(all(session.coroutine is None for session in sessions))
+
+    # Session is closed, if the body raises exception
+    closed = []
+    result = []
+    pool = pipeline(closing.params(closed), collect.params(result)).pool(1)
+    try:
+        with pool.session() as session:
+            session.send(1)
+            raise ValueError()
+    except ValueError:
+        pass
+    tools.eq_(closed, ['closed'])
+    with pool.session() as other:
+        other.send(2)
+    tools.ok_(other is not session)
+    pool.close()
+    tools.eq_(result, [1, 2])
+    tools.eq_(closed, ['closed', 'closed'])
+
+
+def parallel_session_test():
+    result = []
+    p = pipeline(parallel(unique.params(lru(10)), processes=1),
+                 collect.params(result))
+    with p.session() as session:
+        session.feed([1, 2, 1])
+        session.flush()
+        tools.assert_raises(TypeError, session.reset)
+    pool = p.pool(1)
+    with pool.session() as session:
+        session.send(3)
+    pool.close()
+    tools.eq_(result, [1, 2, 3])
+
+
+def mapper_and_predicate_test():
+    result = []
+    pipeline(
+        add_value.params(1),
+        odd,
+        collect.params(result),
+    ).feed([1, 2, 3, 4])
+    tools.eq_(result, [3, 5])
+    tools.eq_(repr(add_value.params(1)), 'add_value.params(1)')
+
+
+def compiled_pipeline_test():
+    evens = []
+    odds = []
+    result = []
+    p = pipeline(
+        add_value.params(1),
+        add_value.params(2),
+    )
+    with p.fork(split, 2) as (even, odd_):
+        even.connect(
+            add_value.params(1),
+            odd,
+            collect.params(evens),
+        )
+        odd_.connect(
+            collect.params(odds),
+            multiply.params(2),
+        )
+    p.connect(
+        add_value.params(10),
+        collect.params(result),
+    )
+    compiled = p.compile()
+    tools.eq_(repr(compiled), repr(p))
+    tools.eq_(len(compiled.pipe), 4)
+    compiled.feed([1, 2, 3, 4])
+    tools.eq_(evens, [5, 7])
+    tools.eq_(odds, [5, 7])
+    tools.eq_(result, [15, 20, 17, 24])
+
+
+def compiled_pipeline_propagates_close_test():
+    closed = []
+    p = pipeline(
+        add_value.params(1),
+        odd,
+        closing.params(closed),
+    )
+    p.feed([1, 2, 3])
+    tools.eq_(closed, ['closed'])
+
+    closed = []
+    p.pipe[-1] = closing.params(closed)
+    p.compile().feed([1, 2, 3])
+    tools.eq_(closed, ['closed'])
+
+
+def parallel_pipeline_test():
+    result = []
+    closed = []
+    p = pipeline(
+        parallel(multiply.params(10), processes=2, chunk_size=3,
+                 max_pending=1),
+        closing.params(closed),
+        collect.params(result),
+    )
+    p.feed(range(10))
+    tools.eq_(result, [i * 10 for i in range(10)])
+    tools.eq_(closed, ['closed'])
+    tools.eq_(repr(p.pipe[0]), 'parallel(multiply.params(10), processes=2, '
+                               'chunk_size=3, max_pending=1)')
+
+
+@coroutine
+def count_items(next):
+    """ Sends number of items passed to pipeline on close """
+    count = 0
+    try:
+        while True:
+            yield
+            count += 1
+    except GeneratorExit:
+        next.send(count)
+
+
+def parallel_closed_worker_test():
+    result = []
+    p = pipeline(
+        parallel(tumbling.params(4, total), processes=1, chunk_size=3),
+        collect.params(result),
+    )
+    p.feed(range(10))
+    tools.eq_(result, [Window(None, 0, 4, 6), Window(None, 4, 8, 22),
+                       Window(None, 8, 10, 17)])
+
+    # Worker copy of each process is closed once
+    result = []
+    p = pipeline(parallel(count_items, processes=3, chunk_size=2),
+                 collect.params(result))
+    p.feed(range(20))
+    tools.eq_(len(result), 3)
+    tools.eq_(sum(result), 20)
+
+
+def parallel_unordered_pipeline_test():
+    result = []
+    p = pipeline(
+        parallel(add.params(1), processes=3, ordered=False, chunk_size=2),
+        collect.params(result),
+    )
+    p.feed(range(20))
+    tools.eq_(sorted(result), list(range(1, 21)))
+
+
+def parallel_spawned_pipeline_test():
+    import multiprocessing
+    if not hasattr(multiprocessing, 'get_context'):
+        raise SkipTest('Start methods are not supported')
+    result = []
+    p = pipeline(
+        parallel(add.params(1), processes=2, chunk_size=4, context='spawn'),
+        collect.params(result),
+    )
+    p.feed(range(10))
+    tools.eq_(result, list(range(1, 11)))
+
+
+def copied_coroutine_test():
+    import copy
+    import pickle
+    for c in (add.params(1), pure(coroutine(add.func)).params(1),
+              add_value.params(1), collect_batches.params([])):
+        for clone in (copy.copy(c), copy.deepcopy(c),
+                      pickle.loads(pickle.dumps(c))):
+            tools.ok_(type(clone) is type(c))
+            tools.eq_(clone.pure, c.pure)
+            tools.eq_(repr(clone), repr(c))
+
+
+def pickled_coroutine_test():
+    import pickle
+    c = pickle.loads(pickle.dumps(add.params(1)))
+    tools.ok_(c.func is add.func)
+    tools.eq_(c.args, (1,))
+    tools.ok_(pickle.loads(pickle.dumps(odd)).func is odd.func)
+
+
+def threaded_pipeline_test():
+    result = []
+    closed = []
+    p = pipeline(
+        threaded(add.params(1), threads=3, maxsize=2),
+        closing.params(closed),
+        collect.params(result),
+    )
+    p.feed(range(100))
+    tools.eq_(sorted(result), list(range(1, 101)))
+    tools.eq_(closed, ['closed'])
+
+
+def threaded_pipeline_policies_test():
+    tools.assert_raises(ValueError, threaded, add, policy='unknown')
+
+    from threading import Event
+    release = Event()
+    started = Event()
+
+    @coroutine
+    def wait(next):
+        while True:
+            item = yield
+            started.set()
+            release.wait()
+            next.send(item)
+
+    result = []
+    p = pipeline(
+        threaded(wait, maxsize=2, policy='drop'),
+        collect.params(result),
+    )()
+    p.send(0)
+    started.wait()
+    for i in range(1, 10):
+        p.send(i)
+    release.set()
+    p.close()
+    # The first item is taken by the thread, the last two ones are queued
+    tools.eq_(result, [0, 8, 9])
+
+    release.clear()
+    started.clear()
+    p = pipeline(threaded(wait, maxsize=1, policy='raise'))()
+    p.send(1)
+    started.wait()
+    p.send(2)
+    try:
+        p.send(3)
+    except Exception as e:
+        tools.eq_(e.__class__.__name__, 'Full')
+    else:
+        tools.ok_(False, 'Full is not raised')
+    release.set()
+    p.close()
+
+
+def threaded_pipeline_sample_test():
+    from threading import Event
+    release = Event()
+    started = Event()
+
+    @coroutine
+    def wait(next):
+        while True:
+            item = yield
+            started.set()
+            release.wait()
+            next.send(item)
+
+    result = []
+    t = threaded(wait, maxsize=2, policy='sample', rate=3)
+    p = pipeline(t, collect.params(result))()
+    p.send(0)
+    started.wait()
+    for i in range(1, 12):
+        p.send(i)
+    release.set()
+    p.close()
+    # Each third overflowing item replaces the oldest queued one
+    tools.eq_(result, [0, 6, 9])
+    tools.eq_(t.dropped, 9)
+    tools.eq_(t.high_water, 2)
+
+
+def buffered_fork_test():
+    from threading import Event
+    release = Event()
+
+    @coroutine
+    def route(even, odd):
+        try:
+            while True:
+                item = yield
+                (odd if item % 2 else even).send(item)
+        except GeneratorExit:
+            even.close()
+            odd.close()
+
+    @coroutine
+    def wait(target, next):
+        try:
+            while True:
+                item = yield
+                release.wait()
+                target.append(item)
+                next.send(item)
+        except GeneratorExit:
+            next.close()
+
+    @coroutine
+    def append(target, next):
+        try:
+            while True:
+                item = yield
+                target.append(item)
+                next.send(item)
+        except GeneratorExit:
+            next.close()
+
+    fast = []
+    slow = []
+    closed = []
+    p = pipeline()
+    with p.fork(route, 2) as (even, odd):
+        even.connect(buffer(maxsize=100), wait.params(slow))
+        odd.connect(append.params(fast))
+    p.connect(closing.params(closed))
+    tools.eq_(repr(p), dedent("""
+        route:
+            -->
+                buffer(maxsize=100)
+                wait.params([])
+            -->
+                append.params([])
+        closing.params([])
+    """).strip().replace('\n', linesep))
+
+    p = p()
+    for i in range(10):
+        p.send(i)
+    # The slow branch doesn't block the other one
+    tools.eq_(fast, [1, 3, 5, 7, 9])
+    tools.eq_(slow, [])
+    release.set()
+    p.close()
+    tools.eq_(slow, [0, 2, 4, 6, 8])
+    tools.eq_(closed, ['closed'])
+
+
+def buffer_repr_test():
+    tools.eq_(repr(buffer()), 'buffer()')
+    tools.eq_(repr(buffer(maxsize=10, policy='sample', rate=5)),
+              "buffer(maxsize=10, policy='sample', rate=5)")
+
+
+def watermarks_test():
+    p = pipeline(buffer(maxsize=10))
+    with p.fork(split, 2) as (even, odd):
+        even.connect(threaded(add.params(1), maxsize=5))
+    tools.eq_(watermarks(p), [
+        ('buffer(maxsize=10)', 0),
+        ('split: --> 1: threaded(add.params(1), maxsize=5)', 0),
+    ])
+    p.feed(range(3))
+    tools.ok_(1 <= watermarks(p)[0][1] <= 3)
+
+
+def threaded_pipeline_error_test():
+    import threading
+    import time
+    from threading import Event
+    try:
+        from queue import Full
+    except ImportError:     # Python 2.x
+        from Queue import Full
+
+    p = pipeline(threaded(add.params(None)))()
+    p.send(1)
+    tools.assert_raises(TypeError, p.close)
+
+    # Failed worker copy stops the rest of threads
+    for wrapper in (threaded(add.params(None), threads=4),
+                    buffer(maxsize=2)):
+        active = threading.active_count()
+        p = pipeline(wrapper, add.params(None))()
+        with tools.assert_raises(TypeError):
+            for i in range(100):
+                p.send(i)
+                time.sleep(0.001)
+        tools.eq_(threading.active_count(), active)
+
+    # Threads blocked by busy copy stop after the current item
+    release = Event()
+
+    @coroutine
+    def wait(next):
+        while True:
+            item = yield
+            release.wait()
+            next.send(item)
+
+    active = threading.active_count()
+    p = pipeline(threaded(wait, threads=2, maxsize=1, policy='raise'))()
+    with tools.assert_raises(Full):
+        for i in range(10):
+            p.send(i)
+    release.set()
+    for i in range(100):
+        if threading.active_count() == active:
+            break
+        time.sleep(0.01)
+    tools.eq_(threading.active_count(), active)
+
+
+def async_pipeline_test():
+    try:
+        from copipes import aio
+    except SyntaxError:
+        raise SkipTest('Asynchronous generators are not supported')
+    import asyncio
+
+    # Asynchronous generators are a syntax error on Python 2.x
+    namespace = {'aio': aio, 'asyncio': asyncio}
+    exec(dedent("""
+        @aio.async_coroutine
+        async def collect(target, next=aio.null):
+            try:
+                while True:
+                    item = yield
+                    await asyncio.sleep(0)
+                    target.append(item)
+                    await next.send(item)
+            except GeneratorExit:
+                target.append('closed')
+                await next.close()
+
+        @aio.async_coroutine
+        async def split(even, odd):
+            try:
+                while True:
+                    item = yield
+                    await (odd if item % 2 else even).send(item)
+            except GeneratorExit:
+                await even.close()
+                await odd.close()
+
+        async def numbers(count):
+            for i in range(count):
+                await asyncio.sleep(0)
+                yield i
+    """), namespace)
+    collect = namespace['collect']
+    numbers = namespace['numbers']
+
+    evens = []
+    odds = []
+    result = []
+    p = aio.async_pipeline()
+    with p.fork(namespace['split'], 2) as (even, odd):
+        even.connect(collect.params(evens))
+        odd.connect(collect.params(odds))
+        odd.plug()
+    p.connect(collect.params(result))
+    asyncio.run(p.feed(numbers(6)))
+    tools.eq_(evens, [0, 2, 4, 'closed'])
+    tools.eq_(odds, [1, 3, 5, 'closed'])
+    tools.eq_(result, [0, 2, 4, 'closed'])
+
+    results = [[] for i in range(3)]
+
+    async def main():
+        await asyncio.gather(*[
+            aio.async_pipeline(collect.params(r)).feed(range(3))
+            for r in results
+        ])
+    asyncio.run(main())
+    tools.eq_(results, [[0, 1, 2, 'closed']] * 3)
+
+    for method in ('compile', 'profile', 'freeze', 'iter', 'session',
+                   'pool', 'get_state'):
+        tools.assert_raises(TypeError, getattr(p, method))
+
+
+def profiled_pipeline_test():
+    evens = []
+    p = pipeline(
+        add.params(1)
+    )
+    with p.fork(split, 2) as (even, odd):
+        even.connect(
+            multiply.params(2),
+            collect.params(evens),
+        )
+        odd.connect(
+            multiply.params(5),
+        )
+        odd.plug()
+    p.connect(
+        add.params(2)
+    )
+    profiled = p.profile()
+    profiled.feed([1, 2, 3, 4])
+    tools.eq_(evens, [4, 8])
+    stats = profiled.stats()
+    tools.eq_([label for label, s in stats], [
+        'add.params(1)',
+        'split:',
+        '    -->',
+        '        multiply.params(2)',
+        '        collect.params([4, 8])',
+        '    -->',
+        '        multiply.params(5)',
+        '        null',
+        'add.params(2)',
+    ])
+    counts = [(s.count_in, s.count_out) for label, s in stats if s]
+    tools.eq_(counts, [(4, 4), (4, 4), (2, 2), (2, 2), (2, 2), (2, 2)])
+    for label, s in stats:
+        if s:
+            tools.ok_(s.cumulative >= s.cumulative - s.downstream >= 0)
+            tools.ok_(s.max_latency <= s.cumulative)
+    report = profiled.report().split(linesep)
+    tools.eq_(len(report), len(stats) + 1)
+    tools.ok_(report[2].startswith('split:'))
+
+
+def null_elimination_test():
+    initialized = []
+
+    def tracked(name, pure):
+        def worker(next=null):
+            initialized.append(name)
+            while True:
+                item = yield
+                next.send(item)
+        return coroutine(worker, pure=pure)
+
+    result = []
+    p = pipeline(
+        tracked('first', pure=True),
+        collect.params(result),
+        tracked('second', pure=True),
+        tracked('third', pure=False),
+        tracked('fourth', pure=True),
+    )
+    p.plug()
+    p.connect(tracked('fifth', pure=False))
+    p.feed([1, 2])
+    tools.eq_(result, [1, 2])
+    tools.eq_(initialized, ['third', 'second', 'first'])
+    tools.eq_(tracked('sixth', pure=True).params().pure, True)
+
+
+def forked_null_elimination_test():
+    @pure
+    @coroutine
+    def broadcast(*next):
+        while True:
+            item = yield
+            for n in next:
+                n.send(item)
+
+    p = pipeline()
+    with p.fork(broadcast, 2) as (first, second):
+        first.connect(mapper(add_value.func, pure=True).params(1))
+        second.plug()
+    tools.ok_(p() is null)
+
+    result = []
+    p = pipeline()
+    with p.fork(broadcast, 2) as (first, second):
+        first.connect(add_value.params(1), collect.params(result))
+        second.plug()
+    p.feed([1, 2])
+    tools.eq_(result, [2, 3])
+
+
+def fused_null_elimination_test():
+    pure_add = mapper(add_value.func, pure=True)
+    pure_odd = predicate(odd.func, pure=True)
+    tools.ok_(pipeline(pure_add.params(1), pure_odd).compile()() is null)
+
+    result = []
+
+    @mapper
+    def register(item):
+        result.append(item)
+        return item
+
+    p = pipeline(pure_add.params(1), register, pure_odd)
+    p.compile().feed([1, 2, 3])
+    tools.eq_(result, [2, 3, 4])
+
+
+def mmap_lines_source_test():
+    from tempfile import NamedTemporaryFile
+    from os import remove
+    from os.path import getsize
+
+    lines = ['line {0}\n'.format('x' * (i % 7)) for i in range(50)]
+    f = NamedTemporaryFile(delete=False)
+    f.write(''.join(lines).encode('utf-8') + b'no newline')
+    f.close()
+    try:
+        expected = lines + ['no newline']
+        result = []
+        pipeline(collect.params(result)).feed(
+            bytes(line).decode('utf-8') for line in mmap_lines(f.name)
+        )
+        tools.eq_(result, expected)
+        for count in range(1, 6):
+            result = []
+            for start, stop in shards(f.name, count):
+                result.extend(mmap_lines(f.name, start, stop, 'utf-8'))
+            tools.eq_(result, expected)
+        # Ranges may be unaligned to line boundaries
+        result = []
+        for start in range(0, getsize(f.name), 13):
+            result.extend(mmap_lines(f.name, start, start + 13, 'utf-8'))
+        tools.eq_(result, expected)
+    finally:
+        remove(f.name)
+
+    f = NamedTemporaryFile(delete=False)
+    f.close()
+    try:
+        tools.eq_(list(mmap_lines(f.name)), [])
+        tools.eq_(shards(f.name, 2), [(0, 0), (0, 0)])
+    finally:
+        remove(f.name)
+
+
+def buffered_write_sink_test():
+    class File(object):
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, data):
+            self.chunks.append(data)
+
+    f = File()
+    result = []
+    pipeline(
+        write.params(f, template='{0};', buffer_size=4),
+        collect.params(result),
+    ).feed([1, 22, 3, 4, 555, 6])
+    tools.eq_(f.chunks, ['1;22;', '3;4;', '555;', '6;'])
+    tools.eq_(result, [1, 22, 3, 4, 555, 6])
+
+    f = File()
+    p = pipeline(write.params(f, interval=0))()
+    p.send('a')
+    tools.eq_(f.chunks, ['a'])
+    p.close()
+    tools.eq_(f.chunks, ['a'])
+
+
+def rotating_write_sink_test():
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    from os import listdir
+    from os.path import join
+
+    directory = mkdtemp()
+    try:
+        path = join(directory, 'log')
+        pipeline(
+            rotating_write.params(path, max_bytes=10, backup_count=2,
+                                  template='{0}\n', buffer_size=6),
+        ).feed(['aa', 'bb', 'cc', 'dd', 'ee', 'ff', 'gg', 'hh'])
+        tools.eq_(sorted(listdir(directory)), ['log', 'log.1', 'log.2'])
+        contents = [open(join(directory, name)).read()
+                    for name in ('log.2', 'log.1', 'log')]
+        tools.eq_(contents, ['cc\ndd\n', 'ee\nff\n', 'gg\nhh\n'])
+    finally:
+        rmtree(directory)
+
+
+def socket_write_sink_test():
+    from socket import socketpair
+
+    left, right = socketpair()
+    try:
+        pipeline(
+            socket_write.params(left, template='{0}\n'),
+        ).feed(['first', 'second'])
+        tools.eq_(right.recv(100), b'first\nsecond\n')
+    finally:
+        left.close()
+        right.close()
+
+
+def unique_lru_test():
+    result = []
+    seen = lru(3)
+    pipeline(
+        unique.params(seen, key=lambda item: item % 10),
+        collect.params(result),
+    ).feed([1, 11, 2, 3, 21, 4, 5, 1, 2])
+    tools.eq_(result, [1, 2, 3, 4, 5, 2])
+    tools.eq_(seen.evictions, 3)
+    tools.eq_(len(seen.keys), 3)
+
+
+def unique_ttl_test():
+    now = [0]
+    seen = ttl(10, maxsize=3, clock=lambda: now[0])
+    result = []
+    p = pipeline(unique.params(seen), collect.params(result))()
+    for t, item in [(0, 'a'), (1, 'b'), (5, 'a'), (10, 'a'), (11, 'b'),
+                    (12, 'c'), (13, 'd'), (14, 'e'), (15, 'a')]:
+        now[0] = t
+        p.send(item)
+    p.close()
+    # 'a' is expired at 10, 'b' at 11, then 'a' is evicted by 'd'
+    tools.eq_(result, ['a', 'b', 'a', 'b', 'c', 'd', 'e', 'a'])
+    tools.eq_(seen.expirations, 2)
+    tools.eq_(seen.evictions, 5)
+    tools.eq_(repr(seen), 'ttl(10, maxsize=3)')
+    # Memory is bounded by default
+    tools.ok_(ttl(10).maxsize is not None)
+    tools.eq_(repr(ttl(10)), 'ttl(10)')
+
+
+def unique_bloom_test():
+    seen = bloom(1000, error_rate=0.01)
+    result = []
+    pipeline(unique.params(seen), collect.params(result)).feed(
+        list(range(1000)) * 2
+    )
+    # False positives are possible, false negatives are not
+    tools.ok_(990 <= len(result) <= 1000)
+    tools.eq_(seen.evictions, 0)
+
+    result = []
+    pipeline(unique.params(seen), collect.params(result)).feed(
+        range(1000, 4000)
+    )
+    tools.ok_(len(result) > 2900)
+    tools.ok_(seen.evictions > 0)
+    tools.eq_(len(seen.current), len(seen.previous))
+
+    # Both filters are full, new keys are still mistaken rarely
+    seen = bloom(1000, error_rate=0.01)
+    for key in range(1000):
+        seen.add(('old', key))
+    for key in range(1000):
+        seen.add(('current', key))
+    mistaken = sum(1 for key in range(10000) if not seen.add(('new', key)))
+    tools.ok_(mistaken < 150)
+
+
+def forked_pipeline_closes_joint_once_test():
+    @coroutine
+    def broadcast(*next):
+        try:
+            while True:
+                item = yield
+                for n in next:
+                    n.send(item)
+        except GeneratorExit:
+            for n in next:
+                n.close()
+
+    closed = []
+    result = []
+    p = pipeline()
+    with p.fork(broadcast, 3) as branches:
+        for branch in branches:
+            branch.connect(add_value.params(1))
+    p.connect(closing.params(closed), collect.params(result))
+    p.feed([1])
+    tools.eq_(result, [2, 2, 2])
+    tools.eq_(closed, ['closed'])
+
+    # Plugged branch doesn't hold the joint open, also in frozen, profiled
+    # and compiled pipelines
+    p = pipeline()
+    with p.fork(broadcast, 3) as (first, second, third):
+        first.connect(add_value.params(1))
+        second.connect(add_value.params(1))
+        second.plug()
+        third.connect(add_value.params(2))
+    for build in [p, p.freeze(), p.profile(), p.compile()]:
+        closed = []
+        result = []
+        # The reference keeps the sink from being finalized on garbage
+        # collection, which would close it too
+        sink = pipeline(closing.params(closed), collect.params(result))()
+        initialized = build(sink)
+        initialized.send(1)
+        initialized.close()
+        tools.eq_(result, [2, 3])
+        tools.eq_(closed, ['closed'])
+
+
+def columnar_pipeline_test():
+    try:
+        from copipes import columnar
+    except ImportError:
+        raise SkipTest('NumPy is not installed')
+
+    records = [{'key': i % 3, 'value': float(i)} for i in range(10)]
+    result = []
+    p = columnar.columnar_pipeline(batch_size=4)
+    p.connect(
+        columnar.filter.params(lambda batch: batch['value'] > 2),
+        collect.params(result),
+    )
+    p.feed(records)
+    tools.eq_(result, records[3:])
+
+    p = columnar.columnar_pipeline()
+    with p.fork(columnar.split.params(lambda batch: batch['key']),
+                'zero', 'one') as (zero, one):
+        pass
+    tools.assert_raises(KeyError, p.feed, records)
+
+    seen = lru(10)
+    p = columnar.columnar_pipeline(unique.params(seen))
+    tools.eq_([w.args[0] for w in p.stateful()], [seen])
+
+    names = columnar.numpy.array(['zero', 'one', 'two'])
+    totals = []
+    p = columnar.columnar_pipeline(batch_size=3)
+    with p.fork(columnar.split.params(lambda batch: names[batch['key']]),
+                'zero', 'one', 'two') as (zero, one, two):
+        zero.connect(columnar.aggregate.params('sum', 'value'))
+        one.connect(columnar.aggregate.params('count'))
+        two.connect(columnar.aggregate.params('max', 'value'))
+    p.connect(add_value.params(0), collect.params(totals))
+    p.feed(records)
+    tools.eq_(sorted(float(t) for t in totals), [3.0, 8.0, 18.0])
+
+    result = []
+    p = columnar.columnar_pipeline(
+        add_value.params(1),
+        columnar.map.params(lambda batch: batch * 10),
+        add_value.params(1),
+        collect.params(result),
+        batch_size=2,
+    )
+    p.feed(range(5))
+    tools.eq_(result, [11, 21, 31, 41, 51])
+
+    # Batches pass the joint of forked pipelines as is
+    @columnar.vectorized
+    def sizes(target, next):
+        while True:
+            batch = yield
+            target.append(len(batch))
+
+    result = []
+    parity = columnar.numpy.array(['even', 'odd'])
+    p = columnar.columnar_pipeline(batch_size=100)
+    with p.fork(columnar.split.params(lambda batch: parity[batch % 2]),
+                'even', 'odd') as (even, odd):
+        even.connect(columnar.map.params(lambda batch: batch + 1))
+        odd.connect(columnar.filter.params(lambda batch: batch >= 0))
+    p.connect(sizes.params(result))
+    p.feed(range(1000))
+    tools.eq_(result, [50] * 20)
+
+
+def partitioned_pipeline_test():
+    result = []
+    p = pipeline(
+        partitioned(lambda item: item, 4, pipeline(multiply.params(10)),
+                    consistent=False),
+        collect.params(result),
+    )
+    p.feed(range(8))
+    # Keys are routed to shards round-robin, shards are initialized in order
+    tools.eq_(result, [i * 10 for i in range(8)])
+
+    @coroutine
+    def worker_pid(next):
+        from os import getpid
+        while True:
+            item = yield
+            next.send((item, getpid()))
+
+    result = []
+    p = pipeline(
+        partitioned(lambda item: item, 3, pipeline(worker_pid),
+                    processes=True, chunk_size=2),
+        collect.params(result),
+    )
+    p.feed(range(30))
+    tools.eq_(sorted(item for item, pid in result), list(range(30)))
+    pids = {}
+    for item, pid in result:
+        pids.setdefault(dispatch_table(3)[item], set()).add(pid)
+    tools.eq_(sorted(len(shard) for shard in pids.values()), [1, 1, 1])
+    tools.eq_(len(set.union(*pids.values())), 3)
+
+
+def dispatch_table_test():
+    tools.assert_raises(ValueError, dispatch_table, 10, slots=8)
+    for count in range(1, 20):
+        old = dispatch_table(count)
+        new = dispatch_table(count + 1)
+        tools.eq_(set(old), set(range(count)))
+        tools.ok_(all(o == n or n == count for o, n in zip(old, new)))
+
+
+def sliding_window_test():
+    from random import Random
+
+    random = Random(1)
+    values = [random.randint(-50, 50) for i in range(200)]
+    for aggregate, func in ((minimum, min), (maximum, max), (total, sum)):
+        result = []
+        pipeline(
+            sliding.params(7, 3, aggregate),
+            collect.params(result),
+        ).feed(values)
+        expected = [func(values[max(0, end - 7):end])
+                    for end in list(range(3, 201, 3)) + [200]]
+        tools.eq_([w.value for w in result], expected)
+
+    events = [(t, 'ab'[t % 2]) for t in range(0, 40, 3)]
+    result = []
+    pipeline(
+        sliding.params(10, 10, total, value=lambda e: e[0],
+                       time=lambda e: e[0], key=lambda e: e[1]),
+        collect.params(result),
+    ).feed(events)
+    tumbled = []
+    pipeline(
+        tumbling.params(10, total, value=lambda e: e[0],
+                        time=lambda e: e[0], key=lambda e: e[1]),
+        collect.params(tumbled),
+    ).feed(events)
+    tools.eq_(sorted(result), sorted(tumbled))
+
+
+def session_window_test():
+    events = [(1, 'a'), (2, 'b'), (3, 'a'), (9, 'b'), (10, 'a'), (20, 'b')]
+    result = []
+    pipeline(
+        session.params(5, quantile.params(0.5), time=lambda e: e[0],
+                       value=lambda e: e[0], key=lambda e: e[1]),
+        collect.params(result),
+    ).feed(events)
+    tools.eq_([(w.key, w.start, w.end) for w in result], [
+        ('b', 2, 2),
+        ('a', 1, 3),
+        ('b', 9, 9),
+        ('a', 10, 10),
+        ('b', 20, 20),
+    ])
+    tools.ok_(abs(result[1].value - 1) < 0.02)
+
+
+def window_incomparable_keys_test():
+    # Windows ending at the same time are ordered without comparing keys
+    events = [(1, None), (2, 'a'), (3, None), (12, 'a')]
+    options = dict(value=lambda e: 1, time=lambda e: e[0],
+                   key=lambda e: e[1])
+    for worker, keys in ((tumbling.params(10, total, **options),
+                          [None, 'a', 'a']),
+                         (sliding.params(10, 10, total, **options),
+                          [None, 'a', 'a']),
+                         (session.params(5, total, **options),
+                          ['a', None, 'a'])):
+        result = []
+        pipeline(worker, collect.params(result)).feed(events)
+        tools.eq_([w.key for w in result], keys)
+    result = []
+    pipeline(
+        tumbling.params(10, total, **options),
+        collect.params(result),
+    ).feed(events)
+    tools.eq_(result, [
+        Window(key=None, start=0, end=10, value=2),
+        Window(key='a', start=0, end=10, value=1),
+        Window(key='a', start=10, end=20, value=1),
+    ])
+
+
+def quantile_aggregate_test():
+    aggregator = quantile(0.9, accuracy=0.01)
+    tools.eq_(aggregator.result(), None)
+    values = [i - 500 for i in range(1000)]
+    for value in values:
+        aggregator.add(value)
+    tools.ok_(abs(aggregator.result() - 399) <= 4)
+    for value in values[:900]:
+        aggregator.remove(value)
+    tools.ok_(abs(aggregator.result() - 489) <= 5)
+
+
+def spill_buffer_test():
+    import os
+    import shutil
+    import tempfile
+    from threading import Event
+    release = Event()
+
+    @coroutine
+    def wait(next):
+        while True:
+            item = yield
+            release.wait()
+            next.send(item)
+
+    directory = tempfile.mkdtemp()
+    try:
+        result = []
+        closed = []
+        spill = spill_buffer(max_memory=10, segment_size=64,
+                             directory=directory, sizeof=lambda item: 1)
+        p = pipeline(spill, wait, closing.params(closed),
+                     collect.params(result))()
+        for i in range(100):
+            p.send(i)
+        # The drain thread may have taken the first item already
+        tools.ok_(spill.high_water >= 99)
+        tools.ok_(spill.spilled >= 89)
+        tools.eq_(len(os.listdir(directory)), 1)
+        release.set()
+        p.close()
+        tools.eq_(result, list(range(100)))
+        tools.eq_(closed, ['closed'])
+        tools.eq_(os.listdir(directory), [])
+        tools.eq_(watermarks(pipeline(spill)),
+                  [('spill_buffer(max_memory=10)', spill.high_water)])
+    finally:
+        release.set()
+        shutil.rmtree(directory)
+
+
+def checkpoint_resume_test():
+    import os
+    import shutil
+    import tempfile
+
+    @coroutine
+    def crash(state, next):
+        while True:
+            item = yield
+            state['count'] += 1
+            if state['count'] == state.get('crash'):
+                raise ValueError(item)
+            next.send(item)
+
+    source = [i % 30 for i in range(100)]
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'checkpoint')
+    try:
+        result = []
+        p = pipeline(crash.params({'count': 0, 'crash': 56}),
+                     unique.params(lru(100)), collect.params(result))
+        log = checkpoint(path, interval=10)
+        tools.assert_raises(ValueError, p.feed, source, checkpoint=log)
+        tools.eq_(log.file, None)
+        tools.eq_(result, list(range(30)))
+
+        # Fresh pipeline restores the state and skips the items fed before
+        # the last snapshot
+        state = {'count': 0}
+        seen = lru(100)
+        p = pipeline(crash.params(state), unique.params(seen),
+                     collect.params(result))
+        log = checkpoint(path, interval=10, compact=3)
+        p.feed(source, batch_size=7, checkpoint=log, resume_from=log)
+        tools.eq_(log.file, None)
+        tools.eq_(result, list(range(30)))
+        tools.eq_(state['count'], 50)
+        tools.eq_(len(seen.keys), 30)
+
+        log = checkpoint(path)
+        tools.eq_(log.load()[0], 100)
+        log.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def wrapped_state_test():
+    seen = [lru(10) for i in range(4)]
+    p = pipeline(
+        threaded(unique.params(seen[0])),
+        buffer(),
+        partitioned(lambda item: item, 2, pipeline(unique.params(seen[1]))),
+    )
+    with p.fork(split, 2) as (even, odd):
+        even.connect(threaded(pipeline(unique.params(seen[2]))))
+        odd.connect(unique.params(seen[3]))
+    workers = [w for w in p.stateful() if w.get_state() is not None]
+    tools.eq_([w.args[0] for w in workers], seen)
+    p.feed([1, 2, 2, 3])
+    state = [s for s in p.get_state() if s is not None]
+    tools.eq_(state[0], {0: ([1, 2, 3], 0)})
+    tools.eq_(len(state), 4)
+    p.set_state([None if s is None else {0: ([5], 0)}
+                 for s in p.get_state()])
+    tools.eq_([list(backend.keys) for backend in seen], [[5]] * 4)
+
+    p = pipeline(parallel(unique.params(lru(10))))
+    tools.assert_raises(TypeError, p.get_state)
+    tools.eq_(pipeline(parallel(add.params(1))).get_state(), [])
+
+
+# Pipeline served by worker process of remote_process_test
+served = pipeline(add.params(10))
+
+Entry = record('Entry', [('size', 'l'), 'path'])
+
+
+def remote_pipeline_test():
+    import os
+    import shutil
+    import tempfile
+    from threading import Thread
+
+    @coroutine
+    def twice(next):
+        while True:
+            item = yield
+            next.send(item)
+            next.send(item)
+
+    listener = listen(('127.0.0.1', 0))
+    address = listener.getsockname()
+    doubled = pipeline(multiply.params(10), twice)
+    worker = Thread(target=serve, args=(listener, doubled, 1))
+    worker.start()
+    evens = []
+    odds = []
+    closed = []
+    cut = remote(address, batch_size=3, credits=2)
+    p = pipeline()
+    with p.fork(split, 2) as (even, odd):
+        even.connect(cut, collect.params(evens))
+        odd.connect(collect.params(odds))
+    p.connect(closing.params(closed))
+    p.feed(range(100))
+    worker.join()
+    tools.eq_(evens, [i * 10 for i in range(0, 100, 2) for j in range(2)])
+    tools.eq_(odds, list(range(1, 100, 2)))
+    tools.eq_(closed, ['closed'])
+    tools.ok_(1 <= cut.high_water <= 2)
+    tools.eq_(repr(cut), 'remote({0!r}, batch_size=3, credits=2)'.format(
+        address))
+
+    # Unix socket, error of served pipeline is re-raised
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'socket')
+        worker = Thread(target=serve, args=(listen(path),
+                                            pipeline(add.params(None)), 1))
+        worker.start()
+        p = pipeline(remote(path, batch_size=2))
+        tools.assert_raises(TypeError, p.feed, range(10))
+        worker.join()
+    finally:
+        shutil.rmtree(directory)
+
+
+def remote_loopback_test():
+    from copipes import remote as module
+
+    listener = listen(0)
+    tools.eq_(listener.getsockname()[0], module.LOOPBACK)
+    listener.close()
+    tools.eq_(module._address('8080'), (module.LOOPBACK, 8080))
+    tools.ok_(module._loopback(('localhost', 8080)))
+    tools.ok_(module._loopback('/tmp/socket'))
+    tools.ok_(not module._loopback(('0.0.0.0', 8080)))
+    # Worker refuses to listen on public interface by default
+    with tools.assert_raises(SystemExit):
+        module.main(['worker', '0.0.0.0:0', 'copipes.test:served'])
+
+
+def remote_process_test():
+    import os
+    import shutil
+    import subprocess
+    import sys
+    import tempfile
+    import time
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'socket')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    worker = subprocess.Popen([sys.executable, '-m', 'copipes.remote',
+                               'worker', path, 'copipes.test:served',
+                               '--connections', '1'], env=env)
+    try:
+        for i in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        result = []
+        pipeline(remote(path, batch_size=4),
+                 collect.params(result)).feed(range(10))
+        tools.eq_(result, list(range(10, 20)))
+        tools.eq_(worker.wait(), 0)
+    finally:
+        if worker.poll() is None:
+            worker.kill()
+        shutil.rmtree(directory)
+
+
+def record_test():
+    import pickle
+    entry = Entry('10', '/index')
+    tools.eq_(entry.size, 10)
+    tools.eq_(tuple(entry), (10, '/index'))
+    tools.eq_(entry, Entry(10, '/index'))
+    tools.ok_(entry != Entry(20, '/index'))
+    tools.ok_(entry != (10, '/index'))
+    tools.eq_(len(set([entry, Entry(10, '/index')])), 1)
+    tools.eq_(pickle.loads(pickle.dumps(entry)), entry)
+    tools.eq_(Entry._make([1, '/']), Entry(1, '/'))
+    with tools.assert_raises(AttributeError):
+        entry.extra = 1
+    with tools.assert_raises(TypeError):
+        Entry(1)
+    for fields in ['a a', 'a _b', 'a 1b', 'a class', 'a-b', [('a', 'Q!')]]:
+        with tools.assert_raises(ValueError):
+            record('Invalid', fields)
+    tools.eq_(repr(record('Empty', [])()), 'Empty()')
+
+    # Fields don't clash with parameters of generated methods
+    Clash = record('Clash', 'self data index values other')
+    batch = columns(Clash, 2)
+    batch.append([1, 2, 3, 4, 5])
+    tools.eq_(list(batch), [Clash(1, 2, 3, 4, 5)])
+    tools.eq_(Clash(self=1, data=2, index=3, values=4, other=5).self, 1)
+
+
+def columns_test():
+    batch = columns(Entry, 2)
+    batch.append(['1', '/a'])
+    with tools.assert_raises(ValueError):
+        batch.append([2])
+    batch.append([2, '/b'])
+    with tools.assert_raises(IndexError):
+        batch.append([3, '/c'])
+    tools.eq_(list(batch), [Entry(1, '/a'), Entry(2, '/b')])
+    tools.eq_(list(batch.column('size')), [1, 2])
+    with tools.assert_raises(IndexError):
+        batch[2]
+    columns_before = list(map(id, batch.data))
+    batch.clear()
+    batch.append([3, '/c'])
+    tools.eq_(list(batch), [Entry(3, '/c')])
+    tools.eq_(list(map(id, batch.data)), columns_before)
+
+
+def parse_records_test():
+    result = []
+    p = pipeline(parse.params(Entry, sep=','), collect.params(result))
+    p.feed(['1,/a', '  ', '2,/b,c\n'])
+    tools.eq_(result, [Entry(1, '/a'), Entry(2, '/b,c')])
+
+
+def parse_columns_test():
+    batches = []
+    sizes = []
+
+    @coroutine
+    def keep(next):
+        while True:
+            batch = yield
+            batches.append(batch)
+            sizes.append(list(batch.column('size')))
+
+    lines = ['{0} /{0}'.format(i) for i in range(5)] + ['']
+    p = pipeline(parse_columns.params(Entry, 2), keep)
+    p.feed(lines, batch_size=3)
+    tools.eq_(sizes, [[0, 1], [2, 3], [4]])
+    # The same preallocated batch is filled again
+    tools.eq_(len(set(map(id, batches))), 1)
@@ -0,0 +1,449 @@
+"""
+Windowed aggregation workers.
+
+Window workers group items into windows, aggregate ``value(item)`` of each
+item incrementally, and send :class:`Window` to the next worker, when window
+is closed.  Windows are defined either by count of items or, if ``time``
+function is passed, by event time ``time(item)``.  If ``key`` function is
+passed, windows are computed separately for each ``key(item)``.
+
+Time windows are closed when an item with event time past the window end
+comes, so items are expected to come in order of event time.  Late item is
+aggregated into the current window of its key.  Windows, which are still
+open, are flushed on ``close()``.
+
+Aggregate is a class (or any factory), which instances provide ``add(value)``
+and ``result()`` methods.  Sliding windows also require ``remove(value)``
+method, which is called for values in order they are added.
+
+"""
+
+from collections import deque, namedtuple
+from functools import partial
+from heapq import heappush, heappop
+from itertools import count as _count
+from math import ceil, floor, log
+
+from copipes import coroutine, null
+
+
+__all__ = ['Window', 'tumbling', 'sliding', 'session',
+           'count', 'total', 'minimum', 'maximum', 'quantile']
+
+
+Window = namedtuple('Window', ['key', 'start', 'end', 'value'])
+
+
+def _sequence():
+    # Returns function, which returns increasing numbers to break ties
+    # of heap entries
+    return partial(next, _count())
+
+
+def _identity(item):
+    return item
+
+
+@coroutine
+def tumbling(size, aggregate, value=_identity, time=None, key=None,
+             next=null):
+    """
+    Aggregates adjacent non-overlapping windows of ``size`` items or
+    ``size`` units of event time.  Time windows are aligned to multiples of
+    the ``size``.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> pipeline(
+        ...     tumbling.params(3, total),
+        ...     collect.params(result),
+        ... ).feed(range(8))
+        >>> for window in result:
+        ...     print(window)
+        Window(key=None, start=0, end=3, value=3)
+        Window(key=None, start=3, end=6, value=12)
+        Window(key=None, start=6, end=8, value=13)
+
+        >>> events = [(1, 'a'), (2, 'b'), (4, 'a'), (11, 'a'), (12, 'b')]
+        >>> result = []
+        >>> pipeline(
+        ...     tumbling.params(10, count, time=lambda e: e[0],
+        ...                     key=lambda e: e[1]),
+        ...     collect.params(result),
+        ... ).feed(events)
+        >>> for window in result:
+        ...     print(window)
+        Window(key='a', start=0, end=10, value=2)
+        Window(key='b', start=0, end=10, value=1)
+        Window(key='a', start=10, end=20, value=1)
+        Window(key='b', start=10, end=20, value=1)
+
+    """
+    windows = {}
+    # Heap entries are ``(end, seq, key)``, where ``seq`` breaks ties,
+    # so keys are never compared
+    ends = []
+    sequence = _sequence()
+    try:
+        while True:
+            item = yield
+            k = None if key is None else key(item)
+            if time is None:
+                window = windows.get(k)
+                if window is None:
+                    window = windows[k] = [0, aggregate(), 0]
+                window[1].add(value(item))
+                window[2] += 1
+                if window[2] == size:
+                    next.send(Window(k, window[0], window[0] + size,
+                                     window[1].result()))
+                    window[:] = [window[0] + size, aggregate(), 0]
+                continue
+            t = time(item)
+            while ends and ends[0][0] <= t:
+                end, _, ek = heappop(ends)
+                window = windows.pop(ek)
+                next.send(Window(ek, window[0], end, window[1].result()))
+            window = windows.get(k)
+            if window is None:
+                start = t - t % size
+                window = windows[k] = [start, aggregate()]
+                heappush(ends, (start + size, sequence(), k))
+            window[1].add(value(item))
+    except GeneratorExit:
+        if time is None:
+            for k, window in windows.items():
+                if window[2]:
+                    next.send(Window(k, window[0], window[0] + window[2],
+                                     window[1].result()))
+        else:
+            while ends:
+                end, _, k = heappop(ends)
+                window = windows.pop(k)
+                next.send(Window(k, window[0], end, window[1].result()))
+        next.close()
+
+
+@coroutine
+def sliding(size, step, aggregate, value=_identity, time=None, key=None,
+            next=null):
+    """
+    Aggregates overlapping windows of ``size`` items or ``size`` units of
+    event time, which are closed each ``step`` items or units of time.  Values
+    leaving window are removed from aggregate, so the window is not
+    recomputed from scratch.  Time windows are aligned to multiples of the
+    ``step``, and each window containing an item is sent.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> pipeline(
+        ...     sliding.params(3, 2, maximum),
+        ...     collect.params(result),
+        ... ).feed([5, 1, 4, 2, 3, 0, 1])
+        >>> for window in result:
+        ...     print(window)
+        Window(key=None, start=0, end=2, value=5)
+        Window(key=None, start=1, end=4, value=4)
+        Window(key=None, start=3, end=6, value=3)
+        Window(key=None, start=4, end=7, value=3)
+
+        >>> result = []
+        >>> pipeline(
+        ...     sliding.params(10, 5, count, time=lambda t: t),
+        ...     collect.params(result),
+        ... ).feed([1, 2, 7, 12])
+        >>> for window in result:
+        ...     print(window)
+        Window(key=None, start=-5, end=5, value=2)
+        Window(key=None, start=0, end=10, value=3)
+        Window(key=None, start=5, end=15, value=2)
+        Window(key=None, start=10, end=20, value=1)
+
+    """
+    windows = {}
+    # Heap entries are ``(end, seq, key)``, see :func:`tumbling`
+    ends = []
+    sequence = _sequence()
+
+    def emit(k, end):
+        # Sends window ending at ``end`` and schedules the next one
+        items, aggregator = windows[k]
+        while items and items[0][0] < end - size:
+            aggregator.remove(items.popleft()[1])
+        if not items:
+            del windows[k]
+            return
+        next.send(Window(k, end - size, end, aggregator.result()))
+        heappush(ends, (end + step, sequence(), k))
+
+    try:
+        while True:
+            item = yield
+            k = None if key is None else key(item)
+            window = windows.get(k)
+            if time is None:
+                if window is None:
+                    window = windows[k] = [deque(), aggregate(), 0]
+                items, aggregator = window[0], window[1]
+                v = value(item)
+                items.append(v)
+                aggregator.add(v)
+                if len(items) > size:
+                    aggregator.remove(items.popleft())
+                window[2] += 1
+                if not window[2] % step:
+                    next.send(Window(k, window[2] - len(items), window[2],
+                                     aggregator.result()))
+                continue
+            t = time(item)
+            while ends and ends[0][0] <= t:
+                end, _, ek = heappop(ends)
+                emit(ek, end)
+            window = windows.get(k)
+            if window is None:
+                window = windows[k] = [deque(), aggregate()]
+                heappush(ends, (t - t % step + step, sequence(), k))
+            v = value(item)
+            window[0].append((t, v))
+            window[1].add(v)
+    except GeneratorExit:
+        if time is None:
+            for k, window in windows.items():
+                if window[2] % step:
+                    next.send(Window(k, window[2] - len(window[0]), window[2],
+                                     window[1].result()))
+        else:
+            while ends:
+                end, _, k = heappop(ends)
+                emit(k, end)
+        next.close()
+
+
+@coroutine
+def session(gap, aggregate, time, value=_identity, key=None, next=null):
+    """
+    Aggregates sessions, i.e. windows of items separated by less than ``gap``
+    units of event time.  Session is closed when an item with event time
+    ``gap`` or more past the last item of the session comes.  Window ``end``
+    is event time of the last item of the session.
+
+    Examples:
+
+    ..  code-block:: pycon
+
+        >>> @coroutine
+        ... def collect(target, next=null):
+        ...     while True:
+        ...         item = yield
+        ...         target.append(item)
+        ...         next.send(item)
+
+        >>> from copipes import pipeline
+        >>> result = []
+        >>> pipeline(
+        ...     session.params(5, count, time=lambda t: t),
+        ...     collect.params(result),
+        ... ).feed([1, 3, 7, 20, 22, 30])
+        >>> for window in result:
+        ...     print(window)
+        Window(key=None, start=1, end=7, value=3)
+        Window(key=None, start=20, end=22, value=2)
+        Window(key=None, start=30, end=30, value=1)
+
+    """
+    sessions = {}
+    # Heap entries are ``(expiration, seq, key)``, see :func:`tumbling`
+    expirations = []
+    sequence = _sequence()
+
+    def emit(k):
+        start, last, aggregator = sessions.pop(k)
+        next.send(Window(k, start, last, aggregator.result()))
+
+    try:
+        while True:
+            item = yield
+            k = None if key is None else key(item)
+            t = time(item)
+            while expirations and expirations[0][0] <= t:
+                expiration, _, ek = heappop(expirations)
+                s = sessions.get(ek)
+                # Expiration is outdated, if the session has been extended
+                if s is not None and s[1] + gap == expiration:
+                    emit(ek)
+            s = sessions.get(k)
+            if s is None:
+                s = sessions[k] = [t, t, aggregate()]
+            s[1] = t if t > s[1] else s[1]
+            s[2].add(value(item))
+            heappush(expirations, (s[1] + gap, sequence(), k))
+    except GeneratorExit:
+        for k in sorted(sessions, key=lambda k: sessions[k][1]):
+            emit(k)
+        next.close()
+
+
+class count(object):
+    """ Counts values """
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        self.value += 1
+
+    def remove(self, value):
+        self.value -= 1
+
+    def result(self):
+        return self.value
+
+
+class total(object):
+    """ Sums values """
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        self.value += value
+
+    def remove(self, value):
+        self.value -= value
+
+    def result(self):
+        return self.value
+
+
+class minimum(object):
+    """
+    Finds minimal value.  Values are kept in monotonic deque, so both
+    ``add`` and ``remove`` take amortized constant time.
+
+    """
+
+    def __init__(self):
+        self.values = deque()
+
+    def add(self, value):
+        values = self.values
+        while values and self.prefer(value, values[-1]):
+            values.pop()
+        values.append(value)
+
+    def remove(self, value):
+        if self.values and self.values[0] == value:
+            self.values.popleft()
+
+    def result(self):
+        return self.values[0] if self.values else None
+
+    @staticmethod
+    def prefer(value, other):
+        return value < other
+
+
+class maximum(minimum):
+    """
+    Finds maximal value.  Values are kept in monotonic deque, so both
+    ``add`` and ``remove`` take amortized constant time.
+
+    """
+
+    @staticmethod
+    def prefer(value, other):
+        return value > other
+
+
+class quantile(object):
+    """
+    Approximates ``q``-quantile of values with relative ``accuracy``.  Values
+    are counted in logarithmic buckets, so memory depends on range of values
+    rather than on their number.  Use :meth:`params` to get aggregate of
+    specific quantile.
+
+    ..  code-block:: pycon
+
+        >>> median = quantile.params(0.5)
+        >>> aggregator = median()
+        >>> for value in range(1, 101):
+        ...     aggregator.add(value)
+        >>> abs(aggregator.result() - 50) <= 0.5
+        True
+
+    """
+
+    def __init__(self, q, accuracy=0.01):
+        self.q = q
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    @classmethod
+    def params(cls, q, accuracy=0.01):
+        """ Returns factory of aggregate """
+        return lambda: cls(q, accuracy)
+
+    def bucket(self, value):
+        return int(ceil(log(value) / self.log_gamma))
+
+    def add(self, value, delta=1):
+        self.count += delta
+        if value > 0:
+            store, value = self.positive, value
+        elif value < 0:
+            store, value = self.negative, -value
+        else:
+            self.zeros += delta
+            return
+        b = self.bucket(value)
+        store[b] = store.get(b, 0) + delta
+        if not store[b]:
+            del store[b]
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def estimate(self, bucket):
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def result(self):
+        if not self.count:
+            return None
+        rank = int(floor(self.q * (self.count - 1)))
+        for b in sorted(self.negative, reverse=True):
+            rank -= self.negative[b]
+            if rank < 0:
+                return -self.estimate(b)
+        rank -= self.zeros
+        if rank < 0:
+            return 0
+        for b in sorted(self.positive):
+            rank -= self.positive[b]
+            if rank < 0:
+                return self.estimate(b)
@@ -1,5 +1,5 @@
 from os import path
-from setuptools import setup
+from setuptools import setup, find_packages
 
 readme = ''.join(open(path.join(path.dirname(__file__), 'README.rst')))
 
@@ -24,7 +24,10 @@ setup(
     url='https://bitbucket.org/kr41/copipes',
     download_url='https://bitbucket.org/kr41/copipes/downloads',
     license='BSD',
-    packages=['copipes'],
+    packages=find_packages(exclude=['benchmarks', 'docs']),
+    extras_require={
+        'numpy': ['numpy'],
+    },
     include_package_data=True,
-    zip_safe=True,
+    zip_safe=False,
 )